@@ -16,6 +16,10 @@
 #include <sys/socket.h>
 #include <sys/un.h>
 #include <sys/epoll.h>
+#include <poll.h>
+#include <linux/futex.h>
+#include <linux/io_uring.h>
+#include <sys/mman.h>
 #include <stdio.h>
 
 struct options {
@@ -24,10 +28,14 @@ struct options {
 };
 
 char hello[] = "hello world, I am the syscall server!\n";
-char read_failed[] = "rsyscall: read(infd, &request, sizeof(request)) failed\n";
-char read_eof[] = "rsyscall: read(infd, &request, sizeof(request)) returned EOF\n";
-char write_failed[] = "rsyscall: write(outfd, &response, sizeof(response)) failed\n";
+char read_failed[] = "rsyscall: read(infd, requests, sizeof(requests)) failed\n";
+char read_eof[] = "rsyscall: read(infd, requests, sizeof(requests)) returned EOF\n";
+char write_failed[] = "rsyscall: write(outfd, responses, sizeof(responses)) failed\n";
 const int EINTR = 4;
+const int ENOTSOCK = 88;
+const int EINVAL = 22;
+const int ECANCELED = 125;
+const int ENOSYS = 38;
 
 static long write(int fd, const void *buf, size_t count) {
     return rsyscall_raw_syscall(fd, (long) buf, (long) count, 0, 0, 0, SYS_write);
@@ -36,10 +44,10 @@ static long read(int fd, void *buf, size_t count) {
     return rsyscall_raw_syscall(fd, (long) buf, (long) count, 0, 0, 0, SYS_read);
 }
 
-static int read_request(const int infd, struct rsyscall_syscall *request)
+static int read_requests(const int infd, struct rsyscall_syscall *requests, const size_t count)
 {
-    char* buf = (char*) request;
-    size_t remaining = sizeof(*request);
+    char* buf = (char*) requests;
+    size_t remaining = sizeof(*requests) * count;
     while (remaining) {
         long const ret = read(infd, buf, remaining);
         if (ret == -EINTR) continue;
@@ -57,17 +65,44 @@ static int read_request(const int infd, struct rsyscall_syscall *request)
     return 1;
 }
 
-static int64_t perform_syscall(struct rsyscall_syscall request)
+/* The results of the requests in the current chain; see RSYSCALL_CHAINED. */
+struct chain {
+    uint32_t length;
+    int failed;
+    int64_t results[RSYSCALL_CHAIN_MAX];
+};
+
+static int64_t perform_chained_syscall(struct chain *chain, const struct rsyscall_syscall *request)
+{
+    int64_t args[6];
+    if (chain->failed) return -ECANCELED;
+    for (int i = 0; i < 6; i++) {
+        args[i] = request->args[i];
+        if (request->sys & RSYSCALL_ARG_RESULT(i)) {
+            if ((uint64_t) args[i] >= chain->length) return -EINVAL;
+            args[i] = chain->results[args[i]];
+        }
+    }
+    return rsyscall_raw_syscall(args[0], args[1], args[2], args[3], args[4], args[5],
+                                request->sys & RSYSCALL_SYS_MASK);
+}
+
+static int64_t perform_syscall(struct chain *chain, const struct rsyscall_syscall *request)
 {
-    return rsyscall_raw_syscall(request.args[0], request.args[1], request.args[2],
-                       request.args[3], request.args[4], request.args[5],
-                       request.sys);
+    if (!(request->sys & RSYSCALL_CHAINED)) {
+        chain->length = 0;
+        chain->failed = 0;
+    }
+    int64_t const ret = perform_chained_syscall(chain, request);
+    if ((uint64_t) ret > -4096UL) chain->failed = 1;
+    if (chain->length < RSYSCALL_CHAIN_MAX) chain->results[chain->length++] = ret;
+    return ret;
 }
 
-static int write_response(const int outfd, const int64_t response)
+static int write_responses(const int outfd, const int64_t *responses, const size_t count)
 {
-    char* data = (char*) &response;
-    size_t remaining = sizeof(response);
+    char* data = (char*) responses;
+    size_t remaining = sizeof(*responses) * count;
     while (remaining) {
         long const ret = write(outfd, data, remaining);
         if (ret == -EINTR) continue;
@@ -81,19 +116,483 @@ static int write_response(const int outfd, const int64_t response)
     return 1;
 }
 
+/* Whether this request might block for an unbounded time, or never return at all.
+ *
+ * Most syscalls are conservatively assumed to block; we only list the common
+ * ones which we know complete promptly, whatever their arguments, except for
+ * fcntl, whose lock-waiting commands can block indefinitely. */
+static int may_block(const struct rsyscall_syscall *request)
+{
+    switch (request->sys & RSYSCALL_SYS_MASK) {
+    case SYS_fcntl:
+        return request->args[1] == F_SETLKW || request->args[1] == F_OFD_SETLKW;
+    case SYS_close:
+    case SYS_dup3:
+    case SYS_getpid:
+    case SYS_getppid:
+    case SYS_gettid:
+    case SYS_getuid:
+    case SYS_getgid:
+    case SYS_lseek:
+    case SYS_fstat:
+    case SYS_mmap:
+    case SYS_munmap:
+    case SYS_mprotect:
+    case SYS_madvise:
+    case SYS_pipe2:
+    case SYS_socket:
+    case SYS_socketpair:
+    case SYS_bind:
+    case SYS_listen:
+    case SYS_getsockname:
+    case SYS_getpeername:
+    case SYS_getsockopt:
+    case SYS_setsockopt:
+    case SYS_epoll_create1:
+    case SYS_epoll_ctl:
+    case SYS_eventfd2:
+    case SYS_signalfd4:
+    case SYS_memfd_create:
+    case SYS_inotify_init1:
+    case SYS_inotify_add_watch:
+    case SYS_inotify_rm_watch:
+    case SYS_rt_sigprocmask:
+    case SYS_rt_sigaction:
+    case SYS_chdir:
+    case SYS_fchdir:
+    case SYS_getdents64:
+    case SYS_ftruncate:
+    case SYS_set_robust_list:
+    case SYS_set_tid_address:
+    case SYS_prctl:
+        return 0;
+    default:
+        return 1;
+    }
+}
+
+/* Whether we can hold on to earlier responses while performing this request.
+ *
+ * The client may be waiting on the response to an earlier request before it
+ * does whatever will let a blocking syscall return, so we must send responses
+ * before anything that may block; and of course we must send them before
+ * anything that gets rid of outfd. */
+static int can_delay_responses(const struct rsyscall_syscall *request, const int outfd)
+{
+    switch (request->sys & RSYSCALL_SYS_MASK) {
+    case SYS_close:
+        return request->args[0] != outfd;
+    case SYS_dup3:
+        return request->args[1] != outfd;
+    default:
+        return !may_block(request);
+    }
+}
+
+/* Keep this small; forked children run the server on a single page of stack. */
+#define BATCH_REQUESTS 8
+
+/* Read a batch of requests, returning the number read.
+ *
+ * If `peek` is set, we peek at the whole requests waiting on infd, and consume
+ * them with a single read, up to and including the first one that we can't
+ * delay responses across. Anything after that stays on infd, so infd remains
+ * readable while that request is performed. That matters because infd is the
+ * activity fd, which the client registers in any epoll set that we block on; a
+ * request sent while we're blocked there needs to wake us up.
+ *
+ * Peeking costs an extra syscall, which is only worthwhile when the client is
+ * likely to have pipelined several requests; the caller sets `peek` when the
+ * previous batch ended on a request whose response could be held back. If
+ * `peek` isn't set, or only part of a request has arrived, we just read a
+ * single request. If infd turns out not to be a socket, we clear `is_socket`,
+ * so that the caller doesn't ask us to peek again. */
+static long read_batch(const int infd, const int outfd, struct rsyscall_syscall *requests,
+                       const int peek, int *is_socket)
+{
+    long ret;
+    if (!peek) {
+        return read_requests(infd, requests, 1);
+    }
+    do {
+        ret = rsyscall_raw_syscall(infd, (long) requests, sizeof(*requests) * BATCH_REQUESTS,
+                                   MSG_PEEK, 0, 0, SYS_recvfrom);
+    } while (ret == -EINTR);
+    if (ret == -ENOTSOCK) {
+        *is_socket = 0;
+    }
+    if (ret == -ENOTSOCK || (ret > 0 && ret < (long) sizeof(*requests))) {
+        return read_requests(infd, requests, 1);
+    }
+    if (ret < 0) {
+        write(2, read_failed, sizeof(read_failed) - 1);
+        return ret;
+    }
+    if (ret == 0) {
+        write(2, read_eof, sizeof(read_eof) - 1);
+        return 0;
+    }
+    long count = ret / sizeof(*requests);
+    for (long i = 0; i < count; i++) {
+        if (!can_delay_responses(&requests[i], outfd)) {
+            count = i + 1;
+            break;
+        }
+    }
+    /* these requests are already buffered on infd, so this won't block */
+    ret = read_requests(infd, requests, count);
+    return ret <= 0 ? ret : count;
+}
+
 int rsyscall_server(const int infd, const int outfd)
 {
     // write(2, hello, sizeof(hello) -1);
-    struct rsyscall_syscall request;
+    struct rsyscall_syscall requests[BATCH_REQUESTS];
+    int64_t responses[BATCH_REQUESTS];
+    struct chain chain = { .length = 0, .failed = 0 };
+    long count;
+    size_t pending;
     int ret;
+    int peek = 0, is_socket = 1;
+    for (;;) {
+        count = read_batch(infd, outfd, requests, peek, &is_socket);
+        if (count <= 0) return count;
+        peek = is_socket && can_delay_responses(&requests[count-1], outfd);
+        pending = 0;
+        for (long i = 0; i < count; i++) {
+            if (pending && !can_delay_responses(&requests[i], outfd)) {
+                ret = write_responses(outfd, responses, pending);
+                if (ret <= 0) return ret;
+                pending = 0;
+            }
+            responses[pending++] = perform_syscall(&chain, &requests[i]);
+        }
+        ret = write_responses(outfd, responses, pending);
+        if (ret <= 0) return ret;
+    }
+}
+
+static void cpu_relax(void)
+{
+    __builtin_ia32_pause();
+}
+
+static long futex(uint32_t *uaddr, int op, uint32_t val, const struct timespec *timeout)
+{
+    return rsyscall_raw_syscall((long) uaddr, op, val, (long) timeout, 0, 0, SYS_futex);
+}
+
+/* Whether the client has hung up on infd. */
+static int hung_up(const int infd)
+{
+    struct pollfd pfd = { .fd = infd, .events = POLLRDHUP, .revents = 0 };
+    long const ret = rsyscall_raw_syscall((long) &pfd, 1, 0, 0, 0, 0, SYS_poll);
+    return ret > 0 && (pfd.revents & (POLLHUP|POLLRDHUP|POLLERR|POLLNVAL));
+}
+
+/* Read back the doorbell bytes the client has written to infd. */
+static int drain_doorbells(struct rsyscall_ring *ring, const int infd)
+{
+    char buf[16];
+    for (;;) {
+        uint32_t const pending = __atomic_load_n(&ring->doorbells_sent, __ATOMIC_ACQUIRE) - ring->doorbells_read;
+        if (!pending) return 1;
+        long const ret = read(infd, buf, pending < sizeof(buf) ? pending : sizeof(buf));
+        if (ret == -EINTR) continue;
+        if (ret < 0) {
+            write(2, read_failed, sizeof(read_failed) - 1);
+            return ret;
+        }
+        if (ret == 0) {
+            write(2, read_eof, sizeof(read_eof) - 1);
+            return 0;
+        }
+        ring->doorbells_read += ret;
+    }
+}
+
+/* Wait for the client to submit a request after the first `completed`, or hang up. */
+static int wait_for_requests(struct rsyscall_ring *ring, const int infd, const uint32_t completed)
+{
+    for (uint32_t i = __atomic_load_n(&ring->spins, __ATOMIC_RELAXED); i; i--) {
+        if (__atomic_load_n(&ring->submitted, __ATOMIC_ACQUIRE) != completed) return 1;
+        cpu_relax();
+    }
+    /* We wake up now and then even without a FUTEX_WAKE, to notice if the
+     * client has died; a live client wakes us when it closes the connection. */
+    struct timespec const timeout = { .tv_sec = 1, .tv_nsec = 0 };
+    __atomic_store_n(&ring->server_sleeping, 1, __ATOMIC_SEQ_CST);
+    if (__atomic_load_n(&ring->submitted, __ATOMIC_SEQ_CST) == completed) {
+        futex(&ring->submitted, FUTEX_WAIT, completed, &timeout);
+    }
+    __atomic_store_n(&ring->server_sleeping, 0, __ATOMIC_SEQ_CST);
+    if (__atomic_load_n(&ring->submitted, __ATOMIC_ACQUIRE) == completed && hung_up(infd)) {
+        write(2, read_eof, sizeof(read_eof) - 1);
+        return 0;
+    }
+    return 1;
+}
+
+/* Serve syscall requests submitted through a shared rsyscall_ring.
+ *
+ * infd and outfd carry only doorbells. The client writes a byte to infd
+ * whenever it submits a request while an earlier request which may block is
+ * still outstanding; infd is the activity fd which the client registers in any
+ * epoll set that we block on, so that wakes us up. We write a byte to outfd
+ * when we complete a request while the client is asleep waiting for one. */
+int rsyscall_ring_server(struct rsyscall_ring *ring, const int infd, const int outfd)
+{
+    static const char doorbell = 0;
+    struct chain chain = { .length = 0, .failed = 0 };
+    uint32_t completed = ring->completed;
+    long ret;
     for (;;) {
-	ret = read_request(infd, &request);
-	if (ret <= 0) return ret;
-	ret = write_response(outfd, perform_syscall(request));
-	if (ret <= 0) return ret;
+        ret = drain_doorbells(ring, infd);
+        if (ret <= 0) return ret;
+        if (__atomic_load_n(&ring->submitted, __ATOMIC_ACQUIRE) == completed) {
+            ret = wait_for_requests(ring, infd, completed);
+            if (ret <= 0) return ret;
+            continue;
+        }
+        uint32_t const slot = completed % RSYSCALL_RING_SIZE;
+        ring->responses[slot] = perform_syscall(&chain, &ring->requests[slot]);
+        __atomic_store_n(&ring->completed, ++completed, __ATOMIC_SEQ_CST);
+        if (__atomic_exchange_n(&ring->client_sleeping, 0, __ATOMIC_SEQ_CST)) {
+            do {
+                ret = write(outfd, &doorbell, sizeof(doorbell));
+            } while (ret == -EINTR);
+            if (ret < 0) {
+                write(2, write_failed, sizeof(write_failed) - 1);
+                return ret;
+            }
+        }
     }
 }
 
+int rsyscall_ring_submit(struct rsyscall_ring *ring, const struct rsyscall_syscall *request, const int tofd)
+{
+    static const char doorbell = 0;
+    uint32_t const submitted = ring->submitted;
+    if (submitted - ring->collected >= RSYSCALL_RING_SIZE) return 0;
+    ring->requests[submitted % RSYSCALL_RING_SIZE] = *request;
+    __atomic_store_n(&ring->submitted, submitted + 1, __ATOMIC_SEQ_CST);
+    if (__atomic_load_n(&ring->server_sleeping, __ATOMIC_SEQ_CST)) {
+        futex(&ring->submitted, FUTEX_WAKE, 1, NULL);
+    }
+    /* the server may have already completed this very request, so completed may be past submitted */
+    for (uint32_t i = __atomic_load_n(&ring->completed, __ATOMIC_SEQ_CST); (int32_t) (submitted - i) > 0; i++) {
+        if (may_block(&ring->requests[i % RSYSCALL_RING_SIZE])) {
+            __atomic_add_fetch(&ring->doorbells_sent, 1, __ATOMIC_SEQ_CST);
+            long ret;
+            do {
+                ret = write(tofd, &doorbell, sizeof(doorbell));
+            } while (ret == -EINTR);
+            if (ret < 0) return ret;
+            break;
+        }
+    }
+    return 1;
+}
+
+/* Copy out any completed responses, spinning for a while if there are none.
+ *
+ * If we return 0, the server will write a doorbell byte to outfd when it
+ * next completes a request. */
+uint32_t rsyscall_ring_collect(struct rsyscall_ring *ring, int64_t *responses, uint32_t spins)
+{
+    uint32_t completed = __atomic_load_n(&ring->completed, __ATOMIC_ACQUIRE);
+    for (; completed == ring->collected && spins; spins--) {
+        cpu_relax();
+        completed = __atomic_load_n(&ring->completed, __ATOMIC_ACQUIRE);
+    }
+    if (completed == ring->collected) {
+        __atomic_store_n(&ring->client_sleeping, 1, __ATOMIC_SEQ_CST);
+        completed = __atomic_load_n(&ring->completed, __ATOMIC_SEQ_CST);
+        if (completed == ring->collected) return 0;
+        /* a response arrived after all; we might get a spurious doorbell, which is harmless */
+        __atomic_store_n(&ring->client_sleeping, 0, __ATOMIC_SEQ_CST);
+    }
+    uint32_t const count = completed - ring->collected;
+    for (uint32_t i = 0; i < count; i++) {
+        responses[i] = ring->responses[(ring->collected + i) % RSYSCALL_RING_SIZE];
+    }
+    __atomic_store_n(&ring->collected, completed, __ATOMIC_RELEASE);
+    return count;
+}
+
+/* Wake the server so it notices that we've closed the connection. */
+void rsyscall_ring_wake(struct rsyscall_ring *ring)
+{
+    futex(&ring->submitted, FUTEX_WAKE, 1, NULL);
+}
+
+static void *uring_mmap(const int fd, const size_t size, const long offset)
+{
+    return (void *) rsyscall_raw_syscall(0, size, PROT_READ|PROT_WRITE, MAP_SHARED|MAP_POPULATE,
+                                         fd, offset, SYS_mmap);
+}
+
+int rsyscall_uring_setup(struct rsyscall_uring *ring, uint32_t entries)
+{
+    struct io_uring_params params = { 0 };
+    long const fd = rsyscall_raw_syscall(entries, (long) &params, 0, 0, 0, 0, SYS_io_uring_setup);
+    if (fd < 0) return fd;
+    /* we rely on a single mapping for both rings, which Linux has supported since 5.4 */
+    if (!(params.features & IORING_FEAT_SINGLE_MMAP)) {
+        rsyscall_raw_syscall(fd, 0, 0, 0, 0, 0, SYS_close);
+        return -ENOSYS;
+    }
+    size_t const sq_size = params.sq_off.array + params.sq_entries * sizeof(uint32_t);
+    size_t const cq_size = params.cq_off.cqes + params.cq_entries * sizeof(struct io_uring_cqe);
+    ring->rings_size = sq_size > cq_size ? sq_size : cq_size;
+    ring->sqes_size = params.sq_entries * sizeof(struct io_uring_sqe);
+    char *const rings = uring_mmap(fd, ring->rings_size, IORING_OFF_SQ_RING);
+    if ((unsigned long) rings > -4096UL) {
+        rsyscall_raw_syscall(fd, 0, 0, 0, 0, 0, SYS_close);
+        return (long) rings;
+    }
+    void *const sqes = uring_mmap(fd, ring->sqes_size, IORING_OFF_SQES);
+    if ((unsigned long) sqes > -4096UL) {
+        rsyscall_raw_syscall((long) rings, ring->rings_size, 0, 0, 0, 0, SYS_munmap);
+        rsyscall_raw_syscall(fd, 0, 0, 0, 0, 0, SYS_close);
+        return (long) sqes;
+    }
+    ring->fd = fd;
+    ring->unsubmitted = 0;
+    ring->rings = rings;
+    ring->sqes = sqes;
+    ring->sq_head = (uint32_t *) (rings + params.sq_off.head);
+    ring->sq_tail = (uint32_t *) (rings + params.sq_off.tail);
+    ring->sq_mask = (uint32_t *) (rings + params.sq_off.ring_mask);
+    ring->cq_head = (uint32_t *) (rings + params.cq_off.head);
+    ring->cq_tail = (uint32_t *) (rings + params.cq_off.tail);
+    ring->cq_mask = (uint32_t *) (rings + params.cq_off.ring_mask);
+    ring->cqes = rings + params.cq_off.cqes;
+    /* each slot in the submission queue always holds the sqe with the same index */
+    uint32_t *const array = (uint32_t *) (rings + params.sq_off.array);
+    for (uint32_t i = 0; i < params.sq_entries; i++) array[i] = i;
+    return 0;
+}
+
+/* Whether this fd is nonblocking, or invalid.
+ *
+ * io_uring waits for an operation on a nonblocking fd to be possible, rather than
+ * failing with EAGAIN. Anyway, there's no point in sending such operations
+ * through io_uring, since they return promptly. */
+static int nonblocking(const int fd)
+{
+    long const flags = rsyscall_raw_syscall(fd, F_GETFL, 0, 0, 0, 0, SYS_fcntl);
+    return flags < 0 || (flags & O_NONBLOCK);
+}
+
+int rsyscall_uring_prep(struct rsyscall_uring *ring, const struct rsyscall_syscall *request, uint64_t user_data)
+{
+    int64_t const *args = request->args;
+    struct io_uring_sqe sqe = { 0 };
+    sqe.fd = args[0];
+    sqe.user_data = user_data;
+    switch (request->sys) {
+    case SYS_read:
+    case SYS_write:
+    case SYS_readv:
+    case SYS_writev:
+    case SYS_accept4:
+    case SYS_connect:
+    case SYS_sendmsg:
+    case SYS_recvmsg:
+        if (nonblocking(args[0])) return -ENOSYS;
+        break;
+    }
+    switch (request->sys) {
+    case SYS_read:
+    case SYS_write:
+        sqe.opcode = request->sys == SYS_read ? IORING_OP_READ : IORING_OP_WRITE;
+        sqe.addr = args[1];
+        sqe.len = args[2];
+        /* use and update the file position, like read and write do */
+        sqe.off = -1;
+        break;
+    case SYS_readv:
+    case SYS_writev:
+        sqe.opcode = request->sys == SYS_readv ? IORING_OP_READV : IORING_OP_WRITEV;
+        sqe.addr = args[1];
+        sqe.len = args[2];
+        sqe.off = -1;
+        break;
+    case SYS_accept4:
+        sqe.opcode = IORING_OP_ACCEPT;
+        sqe.addr = args[1];
+        sqe.addr2 = args[2];
+        sqe.accept_flags = args[3];
+        break;
+    case SYS_connect:
+        sqe.opcode = IORING_OP_CONNECT;
+        sqe.addr = args[1];
+        sqe.off = args[2];
+        break;
+    case SYS_sendmsg:
+    case SYS_recvmsg:
+        sqe.opcode = request->sys == SYS_sendmsg ? IORING_OP_SENDMSG : IORING_OP_RECVMSG;
+        sqe.addr = args[1];
+        sqe.len = 1;
+        sqe.msg_flags = args[2];
+        break;
+    case SYS_openat:
+        sqe.opcode = IORING_OP_OPENAT;
+        sqe.addr = args[1];
+        sqe.open_flags = args[2];
+        sqe.len = args[3];
+        break;
+    case SYS_close:
+        sqe.opcode = IORING_OP_CLOSE;
+        break;
+    case SYS_fsync:
+        sqe.opcode = IORING_OP_FSYNC;
+        break;
+    default:
+        return -ENOSYS;
+    }
+    uint32_t const tail = *ring->sq_tail;
+    uint32_t const mask = *ring->sq_mask;
+    if (tail - __atomic_load_n(ring->sq_head, __ATOMIC_ACQUIRE) > mask) return 0;
+    ((struct io_uring_sqe *) ring->sqes)[tail & mask] = sqe;
+    __atomic_store_n(ring->sq_tail, tail + 1, __ATOMIC_RELEASE);
+    ring->unsubmitted++;
+    return 1;
+}
+
+/* Submit all the queued requests, returning the number submitted. */
+long rsyscall_uring_enter(struct rsyscall_uring *ring)
+{
+    if (!ring->unsubmitted) return 0;
+    long const ret = rsyscall_raw_syscall(ring->fd, ring->unsubmitted, 0, 0, 0, 0, SYS_io_uring_enter);
+    if (ret > 0) ring->unsubmitted -= ret;
+    return ret;
+}
+
+/* Copy out up to count completed results, returning the number copied. */
+uint32_t rsyscall_uring_collect(struct rsyscall_uring *ring, uint64_t *user_data, int64_t *results, uint32_t count)
+{
+    uint32_t head = *ring->cq_head;
+    uint32_t const tail = __atomic_load_n(ring->cq_tail, __ATOMIC_ACQUIRE);
+    uint32_t const mask = *ring->cq_mask;
+    uint32_t i;
+    for (i = 0; i < count && head != tail; i++, head++) {
+        struct io_uring_cqe const *cqe = &((struct io_uring_cqe *) ring->cqes)[head & mask];
+        user_data[i] = cqe->user_data;
+        results[i] = cqe->res;
+    }
+    __atomic_store_n(ring->cq_head, head, __ATOMIC_RELEASE);
+    return i;
+}
+
+void rsyscall_uring_close(struct rsyscall_uring *ring)
+{
+    rsyscall_raw_syscall((long) ring->sqes, ring->sqes_size, 0, 0, 0, 0, SYS_munmap);
+    rsyscall_raw_syscall((long) ring->rings, ring->rings_size, 0, 0, 0, 0, SYS_munmap);
+    rsyscall_raw_syscall(ring->fd, 0, 0, 0, 0, 0, SYS_close);
+}
+
 static void receive_fds(const int sock, int *fds, int n) {
     union {
         struct cmsghdr hdr;
@@ -139,6 +638,7 @@ struct rsyscall_symbol_table rsyscall_symbol_table()
         .rsyscall_persistent_server = rsyscall_persistent_server,
         .rsyscall_futex_helper = rsyscall_futex_helper,
         .rsyscall_trampoline = rsyscall_trampoline,
+        .rsyscall_ring_server = rsyscall_ring_server,
     };
     return table;
 }
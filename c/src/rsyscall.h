@@ -7,9 +7,75 @@ struct rsyscall_syscall {
     int64_t args[6];
 };
 
+/* Flags in the high bits of rsyscall_syscall.sys, for chaining requests together.
+ *
+ * A request with RSYSCALL_CHAINED set continues the chain started by the
+ * nearest earlier request without it; it's only performed if every earlier
+ * request in the chain succeeded, and otherwise fails with -ECANCELED. If
+ * RSYSCALL_ARG_RESULT(i) is set, args[i] is replaced by the result of the
+ * args[i]'th request in the chain, counting from zero; -EINVAL if there's no
+ * such result. Only the first RSYSCALL_CHAIN_MAX results can be referred to. */
+#define RSYSCALL_SYS_MASK 0xffffffffLL
+#define RSYSCALL_CHAINED (1LL << 32)
+#define RSYSCALL_ARG_RESULT_SHIFT 33
+#define RSYSCALL_ARG_RESULT(i) (1LL << (RSYSCALL_ARG_RESULT_SHIFT + (i)))
+#define RSYSCALL_CHAIN_MAX 16
+
 int rsyscall_server(const int infd, const int outfd);
 int rsyscall_persistent_server(int infd, int outfd, const int listensock);
 
+/* A queue of syscall requests and responses in memory shared between the
+ * client and an rsyscall_ring_server. Zero-initialize it before use. */
+#define RSYSCALL_RING_SIZE 32
+struct rsyscall_ring {
+    /* The number of requests submitted; also the futex the server sleeps on. */
+    uint32_t submitted;
+    /* The number of requests the server has completed. */
+    uint32_t completed;
+    /* The number of responses the client has collected. */
+    uint32_t collected;
+    /* Set while the server is asleep on the submitted futex. */
+    uint32_t server_sleeping;
+    /* Set while the client is waiting for a doorbell byte on outfd. */
+    uint32_t client_sleeping;
+    /* The number of doorbell bytes the client has written to infd, and the number the server has read. */
+    uint32_t doorbells_sent;
+    uint32_t doorbells_read;
+    /* How long the server busy-waits for requests before going to sleep; set by the client. */
+    uint32_t spins;
+    struct rsyscall_syscall requests[RSYSCALL_RING_SIZE];
+    int64_t responses[RSYSCALL_RING_SIZE];
+};
+int rsyscall_ring_server(struct rsyscall_ring *ring, const int infd, const int outfd);
+/* Client-side operations, called in a process that shares memory with the server. */
+int rsyscall_ring_submit(struct rsyscall_ring *ring, const struct rsyscall_syscall *request, const int tofd);
+uint32_t rsyscall_ring_collect(struct rsyscall_ring *ring, int64_t *responses, uint32_t spins);
+void rsyscall_ring_wake(struct rsyscall_ring *ring);
+
+/* An io_uring through which the calling process makes some of its own syscalls
+ * asynchronously. Requests are queued with rsyscall_uring_prep, submitted by
+ * rsyscall_uring_enter, and their results collected by rsyscall_uring_collect;
+ * user_data identifies a request's result. */
+struct rsyscall_uring {
+    int fd;
+    /* The number of requests queued but not yet submitted to the kernel. */
+    uint32_t unsubmitted;
+    uint32_t *sq_head, *sq_tail, *sq_mask;
+    void *sqes;
+    uint32_t *cq_head, *cq_tail, *cq_mask;
+    void *cqes;
+    void *rings;
+    size_t rings_size, sqes_size;
+};
+int rsyscall_uring_setup(struct rsyscall_uring *ring, uint32_t entries);
+/* Returns 1 if the request was queued, 0 if the queue is full, and -ENOSYS if
+ * this syscall should be made directly instead: because io_uring can't do it,
+ * or because it's on a nonblocking fd. */
+int rsyscall_uring_prep(struct rsyscall_uring *ring, const struct rsyscall_syscall *request, uint64_t user_data);
+long rsyscall_uring_enter(struct rsyscall_uring *ring);
+uint32_t rsyscall_uring_collect(struct rsyscall_uring *ring, uint64_t *user_data, int64_t *results, uint32_t count);
+void rsyscall_uring_close(struct rsyscall_uring *ring);
+
 /* Assembly-language routines: */
 /* careful: the syscall number is the last arg, to make the assembly more convenient. */
 long rsyscall_raw_syscall(long arg1, long arg2, long arg3, long arg4, long arg5, long arg6, long sys);
@@ -35,6 +101,7 @@ struct rsyscall_symbol_table {
     void* rsyscall_persistent_server;
     void* rsyscall_futex_helper;
     void* rsyscall_trampoline;
+    void* rsyscall_ring_server;
 };
 struct rsyscall_symbol_table rsyscall_symbol_table();
 
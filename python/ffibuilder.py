@@ -11,6 +11,7 @@ ffibuilder.set_source(
 #include <dirent.h>
 #include <fcntl.h>
 #include <linux/capability.h>
+#include <linux/close_range.h>
 #include <linux/if_tun.h>
 #include <linux/netlink.h>
 #include <linux/futex.h>
@@ -163,6 +164,7 @@ int faccessat(int dirfd, const char *pathname, int mode, int flags);
 #define P_PID ...
 #define P_PGID ...
 #define P_ALL ...
+#define P_PIDFD ...
 #define CLD_EXITED ... // child called _exit(2)
 #define CLD_KILLED ... // child killed by signal
 #define CLD_DUMPED ... // child killed by signal, and dumped core
@@ -241,6 +243,13 @@ struct signalfd_siginfo {
 #define SYS_preadv2 ...
 #define SYS_pwritev2 ...
 
+// process_vm_readv
+#define SYS_process_vm_readv ...
+#define SYS_process_vm_writev ...
+
+// pidfd_open
+#define SYS_pidfd_open ...
+
 #define RWF_DSYNC ...
 #define RWF_HIPRI ...
 #define RWF_SYNC ...
@@ -252,6 +261,9 @@ struct signalfd_siginfo {
 #define SYS_pread64 ...
 #define SYS_recvfrom ...
 #define SYS_close ...
+#define SYS_close_range ...
+#define CLOSE_RANGE_UNSHARE ...
+#define CLOSE_RANGE_CLOEXEC ...
 #define SYS_dup3 ...
 #define SYS_pipe2 ...
 #define SYS_ftruncate ...
@@ -588,6 +600,7 @@ void *memcpy(void *dest, const void *src, size_t n);
 // we need these as function pointers, we aren't calling them from Python
 int (*const rsyscall_persistent_server)(int infd, int outfd, const int listensock);
 int (*const rsyscall_server)(const int infd, const int outfd);
+int (*const rsyscall_ring_server)(struct rsyscall_ring *ring, const int infd, const int outfd);
 void (*const rsyscall_futex_helper)(void *futex_addr);
 void (*const rsyscall_trampoline)(void);
 
@@ -605,11 +618,43 @@ struct rsyscall_syscall {
     int64_t sys;
     int64_t args[6];
 };
+#define RSYSCALL_SYS_MASK ...
+#define RSYSCALL_CHAINED ...
+#define RSYSCALL_ARG_RESULT_SHIFT ...
+#define RSYSCALL_CHAIN_MAX ...
+#define RSYSCALL_RING_SIZE ...
+struct rsyscall_ring {
+    uint32_t submitted;
+    uint32_t completed;
+    uint32_t collected;
+    uint32_t server_sleeping;
+    uint32_t client_sleeping;
+    uint32_t doorbells_sent;
+    uint32_t doorbells_read;
+    uint32_t spins;
+    struct rsyscall_syscall requests[...];
+    int64_t responses[...];
+};
+// we do call these from Python, to drive a ring shared with a child
+int rsyscall_ring_submit(struct rsyscall_ring *ring, const struct rsyscall_syscall *request, const int tofd);
+uint32_t rsyscall_ring_collect(struct rsyscall_ring *ring, int64_t *responses, uint32_t spins);
+void rsyscall_ring_wake(struct rsyscall_ring *ring);
+struct rsyscall_uring {
+    int fd;
+    uint32_t unsubmitted;
+    ...;
+};
+int rsyscall_uring_setup(struct rsyscall_uring *ring, uint32_t entries);
+int rsyscall_uring_prep(struct rsyscall_uring *ring, const struct rsyscall_syscall *request, uint64_t user_data);
+long rsyscall_uring_enter(struct rsyscall_uring *ring);
+uint32_t rsyscall_uring_collect(struct rsyscall_uring *ring, uint64_t *user_data, int64_t *results, uint32_t count);
+void rsyscall_uring_close(struct rsyscall_uring *ring);
 struct rsyscall_symbol_table {
     void* rsyscall_server;
     void* rsyscall_persistent_server;
     void* rsyscall_futex_helper;
     void* rsyscall_trampoline;
+    void* rsyscall_ring_server;
 };
 struct rsyscall_bootstrap {
     struct rsyscall_symbol_table symbols;
@@ -695,6 +740,20 @@ struct robust_list_head {
 
 #define FUTEX_WAITERS ...
 #define FUTEX_TID_MASK ...
+#define FUTEX_WAKE ...
+#define SYS_futex ...
+
+// for waiting on many futexes at once
+#define SYS_futex_waitv ...
+#define FUTEX_32 ...
+#define FUTEX_WAITV_MAX ...
+
+struct futex_waitv {
+  uint64_t val;
+  uint64_t uaddr;
+  uint32_t flags;
+  ...;
+};
 
 """
 )
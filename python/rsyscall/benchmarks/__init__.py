@@ -0,0 +1,4 @@
+"""Benchmarks for rsyscall
+
+Each module here can be run with `python -m`, and prints its results.
+"""
@@ -0,0 +1,89 @@
+"""Microbenchmark of Arena malloc and free
+
+We compare Arena against LinearArena, a copy of the previous Arena which kept a sorted
+list of live allocations and scanned it on every malloc, and called list.remove on
+every free.
+
+No syscalls are made; the arenas allocate out of a fake mapping which is never touched.
+
+Run with `python -m rsyscall.benchmarks.allocator`.
+
+"""
+from __future__ import annotations
+from rsyscall.handle import MemoryMapping, Task
+from rsyscall.memory.allocator import Arena, OutOfSpaceError, align
+import argparse
+import random
+import rsyscall.far as far
+import rsyscall.near.types as near
+import time
+import typing as t
+
+class LinearAllocation:
+    def __init__(self, arena: LinearArena, start: int, end: int) -> None:
+        self.arena = arena
+        self.start = start
+        self.end = end
+
+    def free(self) -> None:
+        self.arena.allocations.remove(self)
+
+class LinearArena:
+    "The previous Arena: a list of live allocations sorted by address, searched linearly"
+    def __init__(self, mapping: MemoryMapping) -> None:
+        self.mapping = mapping
+        self.allocations: t.List[LinearAllocation] = []
+
+    def allocate(self, size: int, alignment: int) -> LinearAllocation:
+        newstart = 0
+        for i, alloc in enumerate(self.allocations):
+            if (newstart+size) <= alloc.start:
+                newalloc = LinearAllocation(self, newstart, newstart+size)
+                self.allocations.insert(i, newalloc)
+                return newalloc
+            newstart = align(alloc.end, alignment)
+        if (newstart+size) <= self.mapping.near.length:
+            newalloc = LinearAllocation(self, newstart, newstart+size)
+            self.allocations.append(newalloc)
+            return newalloc
+        raise OutOfSpaceError()
+
+def fake_mapping(length: int) -> MemoryMapping:
+    return MemoryMapping(t.cast(Task, None), near.MemoryMapping(0, length, 4096), far.File())
+
+def workload(live: int, ops: int, seed: int) -> t.List[t.Tuple[int, int]]:
+    """A list of (size, index) pairs: allocate size bytes, then free the live allocation at index
+
+    We first allocate `live` allocations, so that's how many are live throughout.
+
+    """
+    rand = random.Random(seed)
+    return [(rand.choice([8, 16, 24, 64, 128, 256]), rand.randrange(live)) for _ in range(live + ops)]
+
+def run(arena: t.Any, live: int, steps: t.List[t.Tuple[int, int]]) -> float:
+    allocations: t.List[t.Any] = []
+    start = time.perf_counter()
+    for size, _ in steps[:live]:
+        allocations.append(arena.allocate(size, 8))
+    for size, idx in steps[live:]:
+        allocations[idx].free()
+        allocations[idx] = arena.allocate(size, 8)
+    return time.perf_counter() - start
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ops', type=int, default=20000, help="malloc/free pairs per run")
+    parser.add_argument('--live', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help="numbers of live allocations to benchmark with")
+    args = parser.parse_args()
+    print(f"{'live':>8} {'Arena ops/s':>14} {'LinearArena ops/s':>18}")
+    for live in args.live:
+        steps = workload(live, args.ops, seed=live)
+        length = align(live * 256 * 4, 4096)
+        arena_time = run(Arena(fake_mapping(length)), live, steps)
+        linear_time = run(LinearArena(fake_mapping(length)), live, steps)
+        total = live + args.ops
+        print(f"{live:>8} {total/arena_time:>14.0f} {total/linear_time:>18.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Benchmark of opening and closing fds through Task
+
+With `live` fds held open, we repeatedly close a random one and open a replacement, so
+the cost of the FileDescriptor bookkeeping is measured with that many handles around.
+
+We compare Task against ListTask, which tracks its handles the way Task used to: in
+lists, calling list.remove whenever a handle is invalidated.
+
+The syscalls are real, and made through the local thread; we raise our soft
+RLIMIT_NOFILE as far as we can to hold all the fds open.
+
+Run with `python -m rsyscall.benchmarks.fds`.
+
+"""
+from __future__ import annotations
+from rsyscall.fcntl import O
+from rsyscall.handle import Task, FileDescriptor, fd_table_to_near_to_handles
+from rsyscall.path import Path
+import argparse
+import random
+import resource
+import rsyscall.near.types as near
+import rsyscall.tasks.local as local
+import time
+import trio
+import typing as t
+
+class HandleList(list):
+    "A list with the set methods FileDescriptor uses for tracking"
+    def add(self, handle: FileDescriptor) -> None:
+        self.append(handle)
+
+    def discard(self, handle: FileDescriptor) -> None:
+        self.remove(handle)
+
+class ListTask(Task):
+    "A Task which tracks its FileDescriptors in lists, as Task used to"
+    def _make_fd_handle_from_near(self, fd: near.FileDescriptor) -> FileDescriptor:
+        handle = FileDescriptor(self, fd)
+        self.fd_handles.add(handle)
+        fd_table_to_near_to_handles[self.fd_table].setdefault(fd, HandleList()).add(handle)
+        return handle
+
+def make_list_task(task: Task) -> ListTask:
+    "Make a ListTask which makes its syscalls through `task`, in the same fd table"
+    list_task = ListTask(task.sysif, near.Process(task.process.near.id),
+                         task.fd_table, task.address_space, task.pidns)
+    list_task.fd_handles = t.cast(t.MutableSet[FileDescriptor], HandleList())
+    return list_task
+
+async def run(task: Task, path: t.Any, live: int, ops: int, seed: int) -> float:
+    rand = random.Random(seed)
+    fds = []
+    start = time.perf_counter()
+    for _ in range(live):
+        fds.append(await task.open(path, O.RDONLY))
+    for _ in range(ops):
+        idx = rand.randrange(live)
+        await fds[idx].close()
+        fds[idx] = await task.open(path, O.RDONLY)
+    elapsed = time.perf_counter() - start
+    for fd in fds:
+        await fd.close()
+    return elapsed
+
+async def amain(live_counts: t.List[int], ops: int) -> None:
+    thr = local.thread
+    path = await thr.ram.ptr(Path("/dev/null"))
+    list_task = make_list_task(thr.task)
+    print(f"{'live':>8} {'Task ops/s':>12} {'ListTask ops/s':>16}")
+    for live in live_counts:
+        task_time = await run(thr.task, path, live, ops, seed=live)
+        list_time = await run(list_task, path, live, ops, seed=live)
+        total = live + ops
+        print(f"{live:>8} {total/task_time:>12.0f} {total/list_time:>16.0f}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--ops', type=int, default=100000, help="close/open pairs per run")
+    parser.add_argument('--live', type=int, nargs='+', default=[10, 100, 1000, 10000],
+                        help="numbers of live fds to benchmark with")
+    args = parser.parse_args()
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    trio.run(amain, args.live, args.ops)
+
+if __name__ == "__main__":
+    main()
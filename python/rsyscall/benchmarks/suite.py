@@ -0,0 +1,258 @@
+"""Benchmark suite for the thread types and core primitives, with machine-readable results
+
+We measure:
+
+- syscall round-trip latency, and throughput with many syscalls pipelined, for the local
+  thread, a forked ChildThread, a thread connected through a StubServer, a persistent
+  thread, and a thread started with spawn_exec
+- SocketMemoryTransport read and write bandwidth across payload sizes
+- the rate at which we can fork, fork and exec, and spawn
+- epoll fan-out: how long it takes to wake up N readers whose fds are all ready
+- Arena malloc/free pairs per second
+
+Each result is printed as it's measured, and with --json all of them are written to a
+file as a JSON object, so that runs against different releases can be compared. A
+benchmark which fails or exceeds --timeout is recorded with an "error" instead of a
+value, and the suite moves on.
+
+Run with `python -m rsyscall.benchmarks.suite`.
+
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field, asdict
+from rsyscall.benchmarks.allocator import fake_mapping, run as run_allocator, workload
+from rsyscall.command import Command
+from rsyscall.memory.allocator import Arena, align
+from rsyscall.memory.socket_transport import SocketMemoryTransport
+from rsyscall.nix import local_store
+from rsyscall.sys.wait import W
+from rsyscall.tasks.exec import RsyscallServerExecutable, rsyscall_exec, spawn_exec
+from rsyscall.tasks.persistent import fork_persistent
+from rsyscall.tasks.stub import StubServer
+from rsyscall.thread import Thread
+from rsyscall.unistd import Pipe
+import argparse
+import contextlib
+import json
+import platform
+import rsyscall.tasks.local as local
+import sys
+import time
+import trio
+import typing as t
+
+@dataclass
+class Result:
+    "One measurement"
+    benchmark: str
+    params: t.Dict[str, t.Any]
+    value: t.Optional[float] = None
+    unit: t.Optional[str] = None
+    error: t.Optional[str] = None
+
+    def print(self) -> None:
+        params = ' '.join(f"{key}={value}" for key, value in self.params.items())
+        if self.error is None:
+            print(f"{self.benchmark:<20} {params:<36} {self.value:>14.1f} {self.unit}")
+        else:
+            print(f"{self.benchmark:<20} {params:<36} {'error':>14} {self.error}")
+
+@dataclass
+class Suite:
+    "The settings shared by all the benchmarks, and the results so far"
+    iterations: int
+    timeout: float
+    results: t.List[Result] = field(default_factory=list)
+
+    def record(self, result: Result) -> None:
+        result.print()
+        self.results.append(result)
+
+    @contextlib.asynccontextmanager
+    async def measuring(self, benchmark: str, **params: t.Any) -> t.AsyncIterator[None]:
+        "Record an error result if the body fails or times out"
+        try:
+            with trio.fail_after(self.timeout):
+                yield
+        except (Exception, trio.TooSlowError) as exn:
+            self.record(Result(benchmark, params, error=repr(exn)))
+
+#### syscalls
+
+@contextlib.asynccontextmanager
+async def make_thread(kind: str) -> t.AsyncIterator[Thread]:
+    "Make a thread of this kind, and get rid of it afterwards"
+    if kind == "local":
+        yield local.thread
+    elif kind == "fork":
+        thread = await local.thread.fork()
+        async with thread:
+            yield thread
+    elif kind == "stub":
+        async with (await local.thread.mkdtemp("bench_stub")) as path:
+            server = await StubServer.make(local.thread, local_store, path, "bench_stub")
+            await (await local.thread.fork()).exec(Command(path/"bench_stub", ["bench_stub"], {}))
+            _, thread = await server.accept()
+            yield thread
+            await thread.exit(0)
+    elif kind == "persistent":
+        async with (await local.thread.mkdtemp("bench_persistent")) as path:
+            thread = await fork_persistent(local.thread, path/"persist.sock")
+            yield thread
+            await thread.exit(0)
+    elif kind == "spawn_exec":
+        thread = await spawn_exec(local.thread, local_store)
+        async with thread:
+            yield thread
+    else:
+        raise ValueError("unknown thread kind", kind)
+
+THREAD_KINDS = ["local", "fork", "stub", "persistent", "spawn_exec"]
+
+async def bench_syscalls(suite: Suite, kind: str) -> None:
+    async with suite.measuring("syscall_latency", thread=kind):
+        async with make_thread(kind) as thread:
+            # warm up
+            await thread.task.getuid()
+            start = time.perf_counter()
+            for _ in range(suite.iterations):
+                await thread.task.getuid()
+            elapsed = time.perf_counter() - start
+            suite.record(Result("syscall_latency", {"thread": kind}, elapsed/suite.iterations*1e6, "us"))
+
+            start = time.perf_counter()
+            async with trio.open_nursery() as nursery:
+                for _ in range(suite.iterations):
+                    nursery.start_soon(thread.task.getuid)
+            elapsed = time.perf_counter() - start
+            suite.record(Result("syscall_pipelined", {"thread": kind}, suite.iterations/elapsed, "ops/s"))
+
+#### memory transport
+
+async def bench_transport(suite: Suite, sizes: t.List[int]) -> None:
+    async with suite.measuring("transport"):
+        thread = await local.thread.fork()
+        async with thread:
+            await rsyscall_exec(local.thread, thread, await RsyscallServerExecutable.from_store(local_store))
+            # skip the faster transports which an exec'd thread layers on top
+            transport = thread.ram.transport
+            while not isinstance(transport, SocketMemoryTransport):
+                transport = transport.fallback # type: ignore
+            for size in sizes:
+                data = b"x" * size
+                ptr = await thread.ram.malloc(bytes, size)
+                # move about the same number of bytes for every size, within reason
+                count = max(4, min(suite.iterations, (suite.iterations * 4096) // size))
+                start = time.perf_counter()
+                for _ in range(count):
+                    await transport.batch_write([(ptr, data)])
+                elapsed = time.perf_counter() - start
+                suite.record(Result("transport_write", {"size": size}, count*size/elapsed/2**20, "MiB/s"))
+                start = time.perf_counter()
+                for _ in range(count):
+                    await transport.batch_read([ptr])
+                elapsed = time.perf_counter() - start
+                suite.record(Result("transport_read", {"size": size}, count*size/elapsed/2**20, "MiB/s"))
+
+#### processes
+
+async def bench_processes(suite: Suite) -> None:
+    count = max(1, suite.iterations // 20)
+    async with suite.measuring("fork"):
+        start = time.perf_counter()
+        for _ in range(count):
+            await (await local.thread.fork()).exit(0)
+        elapsed = time.perf_counter() - start
+        suite.record(Result("fork", {}, count/elapsed, "forks/s"))
+    true = await local.thread.environ.which("true")
+    async with suite.measuring("fork_exec"):
+        start = time.perf_counter()
+        for _ in range(count):
+            child = await (await local.thread.fork()).exec(true)
+            await child.waitpid(W.EXITED)
+        elapsed = time.perf_counter() - start
+        suite.record(Result("fork_exec", {}, count/elapsed, "execs/s"))
+    async with suite.measuring("spawn"):
+        start = time.perf_counter()
+        for _ in range(count):
+            child = await local.thread.spawn(true)
+            await child.waitpid(W.EXITED)
+        elapsed = time.perf_counter() - start
+        suite.record(Result("spawn", {}, count/elapsed, "execs/s"))
+
+#### epoll
+
+async def bench_epoll(suite: Suite, fd_counts: t.List[int]) -> None:
+    for nfds in fd_counts:
+        async with suite.measuring("epoll_fanout", fds=nfds):
+            thread = await local.thread.fork()
+            async with thread:
+                pipes = [await (await thread.task.pipe(await thread.ram.malloc(Pipe))).read()
+                         for _ in range(nfds)]
+                afds = [await thread.make_afd(pipe.read, nonblock=True) for pipe in pipes]
+                rounds = max(1, suite.iterations // nfds)
+                elapsed = 0.0
+                for _ in range(rounds):
+                    async with trio.open_nursery() as nursery:
+                        for pipe in pipes:
+                            @nursery.start_soon
+                            async def write(pipe=pipe) -> None:
+                                await pipe.write.write(await thread.ram.ptr(b"x"))
+                    # all the fds are ready; now time waking up a reader for each of them
+                    start = time.perf_counter()
+                    async with trio.open_nursery() as nursery:
+                        for afd in afds:
+                            nursery.start_soon(afd.read_some_bytes)
+                    elapsed += time.perf_counter() - start
+                suite.record(Result("epoll_fanout", {"fds": nfds}, rounds*nfds/elapsed, "reads/s"))
+                for afd in afds:
+                    await afd.close()
+
+#### allocator
+
+def bench_allocator(suite: Suite, live_counts: t.List[int]) -> None:
+    for live in live_counts:
+        steps = workload(live, suite.iterations * 10, seed=live)
+        arena = Arena(fake_mapping(align(live * 256 * 4, 4096)))
+        elapsed = run_allocator(arena, live, steps)
+        suite.record(Result("arena", {"live": live}, len(steps)/elapsed, "ops/s"))
+
+BENCHMARKS = ["syscalls", "transport", "processes", "epoll", "allocator"]
+
+async def amain(suite: Suite, benchmarks: t.List[str]) -> None:
+    if "syscalls" in benchmarks:
+        for kind in THREAD_KINDS:
+            await bench_syscalls(suite, kind)
+    if "transport" in benchmarks:
+        await bench_transport(suite, [64, 4096, 65536, 2**20])
+    if "processes" in benchmarks:
+        await bench_processes(suite)
+    if "epoll" in benchmarks:
+        await bench_epoll(suite, [1, 16, 256])
+    if "allocator" in benchmarks:
+        bench_allocator(suite, [10, 1000, 10000])
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--iterations', type=int, default=1000,
+                        help="syscalls per syscall benchmark; the others scale from this")
+    parser.add_argument('--timeout', type=float, default=60, help="seconds before giving up on a benchmark")
+    parser.add_argument('--only', choices=BENCHMARKS, nargs='+', default=BENCHMARKS,
+                        help="which benchmarks to run")
+    parser.add_argument('--json', type=argparse.FileType('w'), help="write the results to this file as JSON")
+    args = parser.parse_args()
+    suite = Suite(args.iterations, args.timeout)
+    print(f"{'benchmark':<20} {'params':<36} {'value':>14} unit")
+    trio.run(amain, suite, args.only)
+    if args.json:
+        json.dump({
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "argv": sys.argv[1:],
+            "iterations": args.iterations,
+            "results": [asdict(result) for result in suite.results],
+        }, args.json, indent=2)
+        args.json.write('\n')
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 "Miscellaneous concurrency-management utilities."
 import trio
 import contextlib
+import rsyscall.trace as trace
 from dataclasses import dataclass
 import typing as t
 
@@ -43,7 +44,8 @@ class OneAtATime:
         "Yield a bool indiciating whether the caller should perform the actual work controlled by this OneAtATime."
         if self.running is not None:
             yield False
-            await self.running.wait()
+            with trace.span("wait for OneAtATime", "wait"):
+                await self.running.wait()
         else:
             running = trio.Event()
             self.running = running
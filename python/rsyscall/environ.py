@@ -49,7 +49,7 @@ class ExecutablePathCache:
         "Return a cached file descriptor for this path."
         if path not in self.fds:
             try:
-                fd = await self.task.open(await self.ram.ptr(path), O.PATH|O.DIRECTORY)
+                fd = await self.task.open(await self.ram.const_ptr(path), O.PATH|O.DIRECTORY)
             except OSError:
                 self.fds[path] = None
             else:
@@ -76,7 +76,7 @@ class ExecutablePathCache:
         try:
             path = self.name_to_path[name]
         except KeyError:
-            nameptr = await self.ram.ptr(Path(name))
+            nameptr = await self.ram.const_ptr(Path(name))
             # do the lookup for 64 paths at a time, that seems like a good batching number
             for paths in chunks(self.paths, 64):
                 thunks = [functools.partial(self._check, path, nameptr) for path in paths]
@@ -82,6 +82,7 @@ from rsyscall._raw import ffi # type: ignore
 import errno
 import os
 import math
+import rsyscall.trace as trace
 import typing as t
 from rsyscall.concurrency import OneAtATime
 from rsyscall.memory.ram import RAM, RAMThread
@@ -117,7 +118,18 @@ class EpollWaiter:
     actual epoll_wait calls in this shared class, our usage of epoll becomes more
     efficient.
 
+    We keep a persistent buffer for events, and adapt its size (and so maxevents) to how
+    many events we're actually getting: If a wait fills the buffer, there are probably
+    more events pending, so we double it for the next wait; if many waits in a row use
+    only a small fraction of it, we halve it. The counters on this object track how many
+    events we're getting per wait.
+
     """
+    min_maxevents = 32
+    max_maxevents = 1024
+    # how many mostly-empty waits in a row before we shrink the buffer
+    shrink_after = 16
+
     def __init__(self, ram: RAM, epfd: FileDescriptor,
                  wait_readable: t.Optional[t.Callable[[], t.Awaitable[None]]],
                  timeout: int,
@@ -132,10 +144,45 @@ class EpollWaiter:
         self.number_to_cb: t.Dict[int, t.Callable[[EPOLL], None]] = {}
         self.pending_remove: t.Set[int] = set()
         self.running_wait = OneAtATime()
-        # resumability
+        self.maxevents = self.min_maxevents
         self.input_buf: t.Optional[Pointer[EpollEventList]] = None
+        # resumability
         self.syscall_response: t.Optional[SyscallResponse] = None
         self.valid_events_buf: t.Optional[Pointer[EpollEventList]] = None
+        self.unused_events_buf: t.Optional[Pointer[EpollEventList]] = None
+        # statistics
+        self.waits = 0
+        self.events = 0
+        self.full_waits = 0
+        self.sparse_waits_in_a_row = 0
+
+    @property
+    def events_per_wait(self) -> float:
+        "The average number of events returned by each epoll_wait so far."
+        return self.events / self.waits if self.waits else 0.0
+
+    def _resize(self, maxevents: int) -> None:
+        "Change maxevents; we'll allocate a new buffer of that size on the next wait."
+        self.maxevents = maxevents
+        self.sparse_waits_in_a_row = 0
+        if self.input_buf is not None:
+            self.input_buf.free()
+            self.input_buf = None
+
+    def _record_wait(self, count: int) -> None:
+        "Update statistics with the number of events received, and adapt maxevents."
+        self.waits += 1
+        self.events += count
+        if count >= self.maxevents:
+            self.full_waits += 1
+            if self.maxevents < self.max_maxevents:
+                self._resize(min(self.maxevents * 2, self.max_maxevents))
+        elif count * 4 < self.maxevents and self.maxevents > self.min_maxevents:
+            self.sparse_waits_in_a_row += 1
+            if self.sparse_waits_in_a_row >= self.shrink_after:
+                self._resize(max(self.maxevents // 2, self.min_maxevents))
+        else:
+            self.sparse_waits_in_a_row = 0
 
     def add_and_allocate_number(self, cb: t.Callable[[EPOLL], None]) -> int:
         """Add a callback which will be called on EpollEvents with data == returned number.
@@ -169,27 +216,32 @@ class EpollWaiter:
         """
         async with self.running_wait.needs_run() as needs_run:
             if needs_run:
-                for number in self.pending_remove:
-                    del self.number_to_cb[number]
-                self.pending_remove = set()
-                maxevents = 32
-                if self.input_buf is None:
-                    self.input_buf = await self.ram.malloc(EpollEventList, maxevents * EpollEvent.sizeof())
-                if self.syscall_response is None:
-                    if self.wait_readable:
-                        await self.wait_readable()
-                    self.syscall_response = await self.epfd.task.sysif.submit_syscall(
-                        SYS.epoll_wait, self.epfd.near, self.input_buf.near, maxevents, self.timeout)
-                if self.valid_events_buf is None:
-                    count = await self.syscall_response.receive()
-                    self.valid_events_buf, _ = self.input_buf.split(count * EpollEvent.sizeof())
-                received_events = await self.valid_events_buf.read()
-                self.input_buf = None
-                self.valid_events_buf = None
-                self.syscall_response = None
-                for event in received_events:
-                    if event.data not in self.pending_remove:
-                        self.number_to_cb[event.data](event.events)
+                with trace.span("epoll_wait", "epoll", self.epfd.task.process.near.id) as args:
+                    for number in self.pending_remove:
+                        del self.number_to_cb[number]
+                    self.pending_remove = set()
+                    if self.syscall_response is None:
+                        if self.input_buf is None:
+                            self.input_buf = await self.ram.malloc(EpollEventList, self.maxevents * EpollEvent.sizeof())
+                        if self.wait_readable:
+                            await self.wait_readable()
+                        self.syscall_response = await self.epfd.task.sysif.submit_syscall(
+                            SYS.epoll_wait, self.epfd.near, self.input_buf.near, self.maxevents, self.timeout)
+                    if self.valid_events_buf is None:
+                        count = await self.syscall_response.receive()
+                        # read back only the events we got, then merge the buffer back together to reuse it
+                        self.valid_events_buf, self.unused_events_buf = self.input_buf.split(count * EpollEvent.sizeof())
+                    received_events = await self.valid_events_buf.read()
+                    self.input_buf = self.valid_events_buf.merge(self.unused_events_buf)
+                    self.valid_events_buf = None
+                    self.unused_events_buf = None
+                    self.syscall_response = None
+                    self._record_wait(len(received_events))
+                    if args is not None:
+                        args["events"] = len(received_events)
+                    for event in received_events:
+                        if event.data not in self.pending_remove:
+                            self.number_to_cb[event.data](event.events)
 
 class Epoller:
     "Terribly named class that allows registering fds on epoll, and waiting on them."
@@ -280,7 +332,7 @@ class EpolledFileDescriptor:
     async def modify(self, events: EPOLL) -> None:
         "Change the EPOLL flags that this fd is registered with."
         await self.epoller.epfd.epoll_ctl(
-            EPOLL_CTL.MOD, self.fd, await self.epoller.ram.ptr(EpollEvent(self.number, events)))
+            EPOLL_CTL.MOD, self.fd, await self.epoller.ram.const_ptr(EpollEvent(self.number, events)))
 
     async def delete(self) -> None:
         "Delete this fd from the epollfd."
@@ -383,6 +435,10 @@ class AsyncFileDescriptor:
         "Call epoll_wait until this file descriptor has a hangup."
         await self._wait_for(EPOLL.RDHUP|EPOLL.HUP)
 
+    async def wait_for_readable(self) -> None:
+        "Call epoll_wait until this file descriptor is readable or has a hangup."
+        await self._wait_for(EPOLL.IN|EPOLL.HUP)
+
     async def read(self, ptr: Pointer) -> t.Tuple[Pointer, Pointer]:
         "Call read without blocking the thread."
         while True:
@@ -403,8 +459,8 @@ class AsyncFileDescriptor:
 
     async def write(self, buf: Pointer) -> t.Tuple[Pointer, Pointer]:
         "Call write without blocking the thread."
-        await self._wait_for(EPOLL.OUT|EPOLL.ERR)
         while True:
+            await self._wait_for(EPOLL.OUT|EPOLL.ERR)
             try:
                 return await self.handle.write(buf)
             except OSError as e:
@@ -416,7 +472,7 @@ class AsyncFileDescriptor:
     async def write_all(self, to_write: Pointer) -> None:
         "Write all of this pointer to the fd, retrying on partial writes until complete."
         while to_write.size() > 0:
-            written, to_write = await self.handle.write(to_write)
+            written, to_write = await self.write(to_write)
 
     async def write_all_bytes(self, buf: bytes) -> None:
         "Write all these bytes to the fd, retrying on partial writes until complete."
@@ -502,16 +558,49 @@ class AsyncReadBuffer:
     data so that it can be parsed. That's what this class does; and it provides a few
     helper methods to make it easier to read and parse such streams.
 
+    Buffered data lives in a bytearray, and we consume records by advancing an offset
+    into it, rather than copying the remaining data after every record. The consumed
+    prefix is only discarded once it makes up more than half the bytearray, so parsing
+    a long stream of records costs time linear in its size.
+
+    We read from the fd into a single remote buffer, which we allocate on the first read
+    and reuse for every following read.
+
     """
+    read_size = 4096
+    "The size of the remote buffer we read into"
+
     def __init__(self, fd: AsyncFileDescriptor) -> None:
         self.fd = fd
-        self.buf = b""
+        self.buf = bytearray()
+        self.start = 0
+        self.read_buf: t.Optional[Pointer[bytes]] = None
+
+    def __len__(self) -> int:
+        "The number of bytes buffered and not yet consumed."
+        return len(self.buf) - self.start
+
+    def _consume(self, length: int) -> bytes:
+        "Remove and return the first length buffered bytes."
+        end = self.start + length
+        with memoryview(self.buf) as view:
+            section = bytes(view[self.start:end])
+        self.start = end
+        if self.start*2 > len(self.buf):
+            del self.buf[:self.start]
+            self.start = 0
+        return section
 
     async def _read(self) -> t.Optional[bytes]:
         "Read some bytes; return None on EOF."
-        data = await self.fd.read_some_bytes()
+        # if we're cancelled while reading, read_buf stays None, and we'll allocate a new one next time
+        ptr = self.read_buf or await self.fd.ram.malloc(bytes, self.read_size)
+        self.read_buf = None
+        valid, rest = await self.fd.read(ptr)
+        data = await valid.read()
+        self.read_buf = valid.merge(rest)
         if len(data) == 0:
-            if len(self.buf) != 0:
+            if len(self) != 0:
                 raise EOFException("got EOF while we still hold unhandled buffered data")
             else:
                 return None
@@ -520,14 +609,12 @@ class AsyncReadBuffer:
 
     async def read_length(self, length: int) -> t.Optional[bytes]:
         "Read exactly this many bytes; return None on EOF."
-        while len(self.buf) < length:
+        while len(self) < length:
             data = await self._read()
             if data is None:
                 return None
             self.buf += data
-        section = self.buf[:length]
-        self.buf = self.buf[length:]
-        return section
+        return self._consume(length)
 
     async def read_cffi(self, name: str) -> t.Any:
         "Read, parse, and return this fixed-size cffi type."
@@ -577,16 +664,16 @@ class AsyncReadBuffer:
 
     async def read_until_delimiter(self, delim: bytes) -> t.Optional[bytes]:
         "Read and return all bytes until the specified delimiter, stripping the delimiter; on EOF, return None."
+        # where to resume searching, so we don't rescan data we already know doesn't contain delim
+        search_from = self.start
         while True:
-            try:
-                i = self.buf.index(delim)
-            except ValueError:
-                pass
-            else:
-                section = self.buf[:i]
+            i = self.buf.find(delim, search_from)
+            if i != -1:
+                section = self._consume(i - self.start)
                 # skip the delimiter
-                self.buf = self.buf[i+1:]
+                self._consume(len(delim))
                 return section
+            search_from = max(self.start, len(self.buf) - len(delim) + 1)
             # buf contains no copies of "delim", gotta read some more data
             data = await self._read()
             if data is None:
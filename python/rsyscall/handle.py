@@ -20,7 +20,8 @@ from __future__ import annotations
 from rsyscall._raw import ffi, lib # type: ignore
 from dataclasses import dataclass, field
 import copy
-import gc
+import errno
+import weakref
 import rsyscall.far
 import rsyscall.near
 from rsyscall.far import File
@@ -42,8 +43,10 @@ from rsyscall.sys.socket import (
 )
 from rsyscall.sched import CLONE, Stack, Borrowable
 from rsyscall.struct import Serializer, HasSerializer, FixedSerializer, FixedSize, Serializable, Int32, Struct
-from rsyscall.signal import Sigaction, Sigset, SIG, Siginfo, SignalMaskTask
+from rsyscall.signal import Sigaction, Sigset, SIG, Siginfo, SignalMaskTask, HowSIG
 from rsyscall.fcntl import AT, F, O
+from rsyscall.near.sysif import SyscallHangup, ChainResult
+from rsyscall.sys.syscall import SYS
 from rsyscall.path import Path, EmptyPath
 from rsyscall.unistd import SEEK, Arg, ArgList, Pipe, OK
 from rsyscall.sys.epoll import EpollFlag, EPOLL_CTL, EpollEvent, EpollEventList
@@ -241,8 +244,6 @@ class Pointer(t.Generic[T]):
         # But, that will only happen when *all* pointers referring to the allocation are collected;
         # not just the valid one.
         # So, this ensures GC is a bit more prompt.
-        # Oh, wait. The real reason we need this is because the Arena stores references to the allocation.
-        # TODO We should fix that.
         self.free()
 
     def split_from_end(self, size: int, alignment: int) -> t.Tuple[Pointer, Pointer]:
@@ -411,8 +412,10 @@ class FileDescriptor:
     will not change either, and no actual change is required in the FileDescriptors. See
     Task.unshare_files for more details.
 
-    Garbage collection is currently run when we change file descriptor tables, as well as
-    on-demand when run_fd_table_gc is run.
+    When the last FileDescriptor for an fd is removed from tracking, whether by
+    invalidation or by garbage collection, the fd is put on a garbage list for its fd
+    table. The fds on that list are closed when we change file descriptor tables, as well
+    as on-demand when run_fd_table_gc is run.
 
     """
     task: Task
@@ -447,6 +450,9 @@ class FileDescriptor:
         if self._invalidate():
             # we were the last handle for this fd, we should close it
             logger.debug("invalidating %s, no handles remaining, closing", self)
+            # so that run_fd_table_gc doesn't close it too
+            del fd_table_to_near_to_handles[self.task.fd_table][self.near]
+            fd_table_to_garbage[self.task.fd_table].discard(self.near)
             await rsyscall.near.close(self.task.sysif, self.near)
             return True
         else:
@@ -543,17 +549,21 @@ class FileDescriptor:
                             "but after removing handle A, there are no handles left. Huh?")
         return new
 
-    def _get_global_handles(self) -> t.List[FileDescriptor]:
+    def _get_global_handles(self) -> t.MutableSet[FileDescriptor]:
         return fd_table_to_near_to_handles[self.task.fd_table][self.near]
 
     def is_only_handle(self) -> bool:
         self._validate()
         return len(self._get_global_handles()) == 1
 
-    def _remove_from_tracking(self) -> t.List[FileDescriptor]:
-        self.task.fd_handles.remove(self)
+    def _remove_from_tracking(self) -> t.MutableSet[FileDescriptor]:
+        # if we're being collected as part of a reference cycle, the weak references to us
+        # have already been cleared, and we've already been removed from these sets.
+        self.task.fd_handles.discard(self)
         handles = self._get_global_handles()
-        handles.remove(self)
+        handles.discard(self)
+        if not handles:
+            _add_garbage(self.task.fd_table, self.near)
         return handles
 
     def __del__(self) -> None:
@@ -843,18 +853,33 @@ class FileDescriptor:
         self._validate()
         await rsyscall.near.fchmod(self.task.sysif, self.near, mode)
 
-fd_table_to_near_to_handles: t.Dict[rsyscall.far.FDTable, t.Dict[rsyscall.near.FileDescriptor, t.List[FileDescriptor]]] = {}
+# We track FileDescriptors weakly, so that when a FileDescriptor becomes unreachable, it's
+# freed, and its __del__ puts its fd on the garbage list if it was the last handle.
+fd_table_to_near_to_handles: t.Dict[rsyscall.far.FDTable, t.Dict[rsyscall.near.FileDescriptor, t.MutableSet[FileDescriptor]]] = {}
 fd_table_to_task: t.Dict[rsyscall.far.FDTable, t.List[Task]] = {}
+fd_table_to_garbage: t.Dict[rsyscall.far.FDTable, t.Set[rsyscall.near.FileDescriptor]] = {}
+
+def _add_garbage(fd_table: rsyscall.far.FDTable, fd: rsyscall.near.FileDescriptor) -> None:
+    "Note that this fd might have no handles left, so run_fd_table_gc should close it"
+    fd_table_to_garbage.setdefault(fd_table, set()).add(fd)
 
 async def run_fd_table_gc(fd_table: rsyscall.far.FDTable) -> None:
+    """Close the fds on this fd table's garbage list which still have no handles
+
+    Only the fds on the garbage list are looked at, and we don't run the Python garbage
+    collector; an unreachable FileDescriptor which isn't part of a reference cycle puts
+    its fd on the garbage list as soon as it's freed, and the rest will get there
+    whenever Python gets around to collecting them.
+
+    The fds are closed with close_fds.
+
+    """
     if fd_table not in fd_table_to_task:
         # this is an fd table that has never had active tasks;
         # probably we called run_fd_table_gc on an exited task
         return
-    gc.collect()
-    near_to_handles = fd_table_to_near_to_handles[fd_table]
-    fds_to_close = [fd for fd, handles in near_to_handles.items() if not handles]
-    if not fds_to_close:
+    garbage = fd_table_to_garbage.get(fd_table)
+    if not garbage:
         return
     tasks = fd_table_to_task[fd_table]
     for task in list(tasks):
@@ -868,24 +893,69 @@ async def run_fd_table_gc(fd_table: rsyscall.far.FDTable) -> None:
     else:
         # uh, there's no valid task available? I guess just do nothing?
         return
-    async def close_fd(fd: rsyscall.near.FileDescriptor) -> None:
+    near_to_handles = fd_table_to_near_to_handles[fd_table]
+    # an fd on the garbage list may have been closed since, or even reopened and given new handles
+    fds_to_close = [fd for fd in garbage if fd in near_to_handles and not near_to_handles[fd]]
+    garbage.clear()
+    for fd in fds_to_close:
         del near_to_handles[fd]
-        # TODO I guess we should take a lock on the fd table
-        try:
-            # TODO we should mark this task as dead and fall back to later tasks in the list if
-            # we fail due to a SyscallInterface-level error; that might happen if, say, this is
-            # some decrepit task where we closed the syscallinterface but didn't exit the task.
-            await rsyscall.near.close(task.sysif, fd)
-        except:
-            if fd in fd_table_to_near_to_handles:
-                raise Exception("somehow someone else closed fd", fd, "and then it was reopened???")
-            # put the fd back, I guess.
-            near_to_handles[fd] = []
-    async with trio.open_nursery() as nursery:
-        for fd in fds_to_close:
-            nursery.start_soon(close_fd, fd)
+    # TODO I guess we should take a lock on the fd table
+    for fd in await close_fds(task.sysif, fds_to_close):
+        # TODO we should mark this task as dead and fall back to later tasks in the list if
+        # we fail due to a SyscallInterface-level error; that might happen if, say, this is
+        # some decrepit task where we closed the syscallinterface but didn't exit the task.
+        if fd in near_to_handles:
+            raise Exception("somehow someone else closed fd", fd, "and then it was reopened???")
+        # put the fd back, I guess.
+        near_to_handles[fd] = weakref.WeakSet()
+        garbage.add(fd)
+
+def _fd_runs(fds: t.Iterable[rsyscall.near.FileDescriptor]) -> t.List[t.Tuple[int, int]]:
+    "Group these fds into runs of consecutive fd numbers, as (first, last) pairs"
+    runs: t.List[t.Tuple[int, int]] = []
+    for num in sorted(set(fd.number for fd in fds)):
+        if runs and runs[-1][1] + 1 == num:
+            runs[-1] = (runs[-1][0], num)
+        else:
+            runs.append((num, num))
+    return runs
+
+async def close_fds(sysif: rsyscall.near.SyscallInterface,
+                    fds: t.Iterable[rsyscall.near.FileDescriptor]) -> t.List[rsyscall.near.FileDescriptor]:
+    """Close all these fds in as few round trips as we can, returning those we failed to close
+
+    Each run of consecutive fds is closed with one close_range, or with one close per fd
+    if close_range isn't available through this SyscallInterface, and the syscalls are all sent in one
+    syscall_batch, so that they don't depend on each other.
+
+    close always releases the fd, even when it fails, so we only fail to close an fd if
+    its syscall couldn't be made at all, because of some SyscallInterface-level error.
+
+    """
+    if sysif.have_close_range:
+        runs = _fd_runs(fds)
+    else:
+        runs = [(fd.number, fd.number) for fd in fds]
+    failed: t.List[rsyscall.near.FileDescriptor] = []
+    while runs:
+        unsupported: t.List[t.Tuple[int, int]] = []
+        results = await sysif.syscall_batch([
+            (SYS.close, first) if first == last else (SYS.close_range, first, last, 0)
+            for first, last in runs])
+        for (first, last), result in zip(runs, results):
+            if isinstance(result, OSError) and result.errno == errno.ENOSYS and first != last:
+                unsupported.append((first, last))
+            elif isinstance(result, OSError):
+                # close always releases the fd, even when it fails
+                pass
+            elif isinstance(result, Exception):
+                failed.extend(rsyscall.near.FileDescriptor(num) for num in range(first, last+1))
+        if unsupported:
+            sysif.have_close_range = False
+        runs = [(num, num) for first, last in unsupported for num in range(first, last+1)]
+    return failed
+
 
-
 ################################################################################
 # Task
 
@@ -909,7 +979,7 @@ class Task(SignalMaskTask, rsyscall.far.Task):
         self.fd_table = fd_table
         self.address_space = address_space
         self.pidns = pidns
-        self.fd_handles: t.List[FileDescriptor] = []
+        self.fd_handles: t.MutableSet[FileDescriptor] = weakref.WeakSet()
         self.manipulating_fd_table = False
         self.alive = True
 
@@ -931,8 +1001,8 @@ class Task(SignalMaskTask, rsyscall.far.Task):
             raise Exception("can't make a new FD handle while manipulating_fd_table==True")
         handle = FileDescriptor(self, fd)
         logger.debug("made handle: %s", self)
-        self.fd_handles.append(handle)
-        fd_table_to_near_to_handles[self.fd_table].setdefault(fd, []).append(handle)
+        self.fd_handles.add(handle)
+        fd_table_to_near_to_handles[self.fd_table].setdefault(fd, weakref.WeakSet()).add(handle)
         return handle
 
     def make_fd_handle(self, fd: t.Union[rsyscall.near.FileDescriptor,
@@ -951,10 +1021,16 @@ class Task(SignalMaskTask, rsyscall.far.Task):
     def _add_to_active_fd_table_tasks(self) -> None:
         fd_table_to_task.setdefault(self.fd_table, []).append(self)
 
+    def _remove_from_active_fd_table_tasks(self) -> None:
+        "Stop using this task to close fds for its fd table; use this for tasks which block forever"
+        tasks = fd_table_to_task.get(self.fd_table, [])
+        if self in tasks:
+            tasks.remove(self)
+
     def _setup_fd_table_handles(self) -> None:
         near_to_handles = fd_table_to_near_to_handles.setdefault(self.fd_table, {})
         for handle in self.fd_handles:
-            near_to_handles.setdefault(handle.near, []).append(handle)
+            near_to_handles.setdefault(handle.near, weakref.WeakSet()).add(handle)
 
     def _make_fresh_fd_table(self) -> None:
         self.fd_table = rsyscall.far.FDTable(self.process.near.id)
@@ -984,15 +1060,16 @@ class Task(SignalMaskTask, rsyscall.far.Task):
         """
         if self.manipulating_fd_table:
             raise Exception("can't unshare_files while manipulating_fd_table==True")
-        # do a GC now to improve efficiency when GCing both tables after the unshare
-        gc.collect()
+        # close garbage now, so it isn't copied into the new table
         await run_fd_table_gc(self.fd_table)
         self.manipulating_fd_table = True
         old_fd_table = self.fd_table
         self._make_fresh_fd_table()
         # each fd in the old table is also in the new table, possibly with no handles
+        new_near_to_handles = fd_table_to_near_to_handles[self.fd_table]
         for fd in fd_table_to_near_to_handles[old_fd_table]:
-            fd_table_to_near_to_handles[self.fd_table].setdefault(fd, [])
+            if not new_near_to_handles.setdefault(fd, weakref.WeakSet()):
+                _add_garbage(self.fd_table, fd)
         self._add_to_active_fd_table_tasks()
         # perform the actual unshare
         await rsyscall.near.unshare(self.sysif, CLONE.FILES)
@@ -1002,7 +1079,10 @@ class Task(SignalMaskTask, rsyscall.far.Task):
         # old fd table would close our fds when they notice there are no more handles.
         old_near_to_handles = fd_table_to_near_to_handles[old_fd_table]
         for handle in self.fd_handles:
-            old_near_to_handles[handle.near].remove(handle)
+            handles = old_near_to_handles[handle.near]
+            handles.remove(handle)
+            if not handles:
+                _add_garbage(old_fd_table, handle.near)
         await run_fd_table_gc(old_fd_table)
         await run_fd_table_gc(self.fd_table)
 
@@ -1048,6 +1128,32 @@ class Task(SignalMaskTask, rsyscall.far.Task):
                 raise
             return self.make_fd_handle(fd)
 
+    async def open_write_close(self, path: WrittenPointer[Path], flags: O, mode: int,
+                               buf: Pointer) -> t.Tuple[Pointer, Pointer]:
+        """Open a file, write buf to it, and close it, all in a single syscall chain
+
+        Returns the written and unwritten parts of buf, like FileDescriptor.write. If the
+        write is short, the file is still closed; reopen it to write the rest.
+
+        """
+        with path.borrow(self) as path_n, buf.borrow(self) as buf_n:
+            opened, written, closed = await self.sysif.syscall_chain([
+                (SYS.openat, AT.FDCWD, path_n, flags|O.CLOEXEC, mode),
+                (SYS.write, ChainResult(0), buf_n, buf.size()),
+                (SYS.close, ChainResult(0)),
+            ])
+            if isinstance(opened, Exception):
+                if isinstance(opened, FileNotFoundError):
+                    opened.filename = path.value
+                raise opened
+            if isinstance(written, Exception):
+                # the close was never performed, so we have to do it ourselves
+                await self.make_fd_handle(rsyscall.near.FileDescriptor(opened)).close()
+                raise written
+            if isinstance(closed, Exception):
+                raise closed
+            return buf.split(written)
+
     async def mkdir(self, path: WrittenPointer[Path], mode=0o755) -> None:
         with path.borrow(self) as path_n:
             await rsyscall.near.mkdirat(self.sysif, None, path_n, mode)
@@ -1154,6 +1260,84 @@ class Task(SignalMaskTask, rsyscall.far.Task):
             if isinstance(self.process, ChildProcess):
                 self.process.did_exec()
 
+    async def setup_and_execve(self,
+                               replace: t.List[t.Tuple[FileDescriptor, t.Union[FileDescriptor, rsyscall.near.FileDescriptor]]],
+                               cwd: t.Optional[WrittenPointer[Path]],
+                               sigmask: WrittenPointer[Sigset],
+                               filename: WrittenPointer[Path],
+                               argv: WrittenPointer[ArgList],
+                               envp: WrittenPointer[ArgList],
+                               flags: AT) -> None:
+        """Replace some fds, chdir, set the signal mask, and execve, all in a single round trip
+
+        We send all the syscalls as one chain, so each is only performed if the ones
+        before it succeeded; if any setup syscall fails, we raise its error, and the
+        execve is never attempted. `replace` is a list of (source, newfd) pairs; source
+        is dup'd over newfd, or just has CLOEXEC cleared if it's already newfd. newfd is
+        either an fd number, or a FileDescriptor which, as with dup3, must be the only
+        handle to its fd. If the execve succeeds, the source handles are invalidated, as
+        with FileDescriptor.replace_with; the execve closed their fds.
+
+        A failed setup syscall may still leave the earlier ones in effect. We should have
+        our own fd table, so at least that can only affect us.
+
+        """
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(filename.borrow(self))
+            for arg in [*argv.value, *envp.value]:
+                stack.enter_context(arg.borrow(self))
+            stack.enter_context(argv.borrow(self))
+            stack.enter_context(envp.borrow(self))
+            stack.enter_context(sigmask.borrow(self))
+            if cwd is not None:
+                stack.enter_context(cwd.borrow(self))
+            calls: t.List[t.Tuple[SYS, ...]] = []
+            for source, newfd in replace:
+                stack.enter_context(source.borrow(self))
+                if isinstance(newfd, FileDescriptor):
+                    stack.enter_context(newfd.borrow(self))
+                    newfd_n = newfd.near
+                    if source.near != newfd_n and not newfd.is_only_handle():
+                        raise Exception("can't dup over newfd, there are more handles to it than just ours", newfd)
+                else:
+                    newfd_n = newfd
+                if source.near == newfd_n:
+                    calls.append((SYS.fcntl, newfd_n, F.SETFD, 0))
+                else:
+                    calls.append((SYS.dup3, source.near, newfd_n, 0))
+            if cwd is not None:
+                calls.append((SYS.chdir, cwd.near))
+            calls.append((SYS.rt_sigprocmask, HowSIG.SETMASK, sigmask.near, 0, Sigset.sizeof()))
+            calls.append((SYS.execveat, AT.FDCWD, filename.near, argv.near, envp.near, flags))
+            self.manipulating_fd_table = True
+            try:
+                *setup, result = await self.sysif.syscall_chain(calls)
+            finally:
+                self.manipulating_fd_table = False
+            if not isinstance(setup[-1], Exception):
+                # the rt_sigprocmask took effect, even if the exec then fails
+                self.sigmask = Sigset(sigmask.value)
+            for exn in setup:
+                if isinstance(exn, Exception):
+                    raise exn
+            def handle(exn):
+                # a hangup means the execve succeeded, or we exited; either way we've left our old fd table
+                if isinstance(exn, SyscallHangup):
+                    return None
+                else:
+                    return exn
+            if isinstance(result, Exception):
+                if isinstance(result, FileNotFoundError):
+                    result.filename = filename.value
+                with trio.MultiError.catch(handle):
+                    raise result
+            for source, _ in replace:
+                source._invalidate()
+            self._make_fresh_fd_table()
+            self._make_fresh_address_space()
+            if isinstance(self.process, ChildProcess):
+                self.process.did_exec()
+
     async def exit(self, status: int) -> None:
         self.manipulating_fd_table = True
         await rsyscall.near.exit(self.sysif, status)
@@ -1342,16 +1526,26 @@ class ChildProcess(Process):
                 with pgid.borrow():
                     await rsyscall.near.setpgid(self.task.sysif, self.near, self._as_process_group())
 
+    async def pidfd_open(self) -> FileDescriptor:
+        "Open a pidfd referring to this child, in the task which is its parent"
+        with self.borrow():
+            fd = await rsyscall.near.pidfd_open(self.task.sysif, self.near, 0)
+        return self.task.make_fd_handle(fd)
+
     async def waitid(self, options: W, infop: Pointer[Siginfo],
-                     *, rusage: t.Optional[Pointer[Siginfo]]=None) -> None:
+                     *, rusage: t.Optional[Pointer[Siginfo]]=None,
+                     pidfd: t.Optional[FileDescriptor]=None) -> None:
+        "Call waitid on this child, identifying it by pidfd instead of pid if one is passed"
         with contextlib.ExitStack() as stack:
             stack.enter_context(self.borrow())
             stack.enter_context(infop.borrow(self.task))
             if rusage is not None:
                 stack.enter_context(rusage.borrow(self.task))
+            if pidfd is not None:
+                stack.enter_context(pidfd.borrow(self.task))
             try:
-                await rsyscall.near.waitid(self.task.sysif, self.near, infop.near, options,
-                                           rusage.near if rusage else None)
+                await rsyscall.near.waitid(self.task.sysif, pidfd.near if pidfd else self.near,
+                                           infop.near, options, rusage.near if rusage else None)
             except ChildProcessError as exn:
                 exn.filename = self.near
                 raise
@@ -3,7 +3,7 @@ from rsyscall._raw import lib, ffi # type: ignore
 import typing as t
 import enum
 from dataclasses import dataclass
-from rsyscall.struct import Serializable
+from rsyscall.struct import Serializable, codec
 
 __all__ = [
     "DT",
@@ -22,6 +22,8 @@ class DT(enum.IntEnum):
     UNKNOWN = lib.DT_UNKNOWN # The file type is unknown.
 
 _d_name_offset = ffi.offsetof('struct linux_dirent64', 'd_name')
+# d_ino, d_off, d_reclen, d_type, plus the tail padding, which every aligned record has room for
+_dirent = codec('struct linux_dirent64')
 
 @dataclass
 class Dirent:
@@ -49,23 +51,24 @@ class Dirent:
 
 class DirentList(t.List[Dirent], Serializable):
     def to_bytes(self) -> bytes:
-        ret = b""
-        for ent in self:
-            ret += ent.to_bytes()
-        return ret
+        return b"".join([ent.to_bytes() for ent in self])
 
     T = t.TypeVar('T', bound='DirentList')
     @classmethod
     def from_bytes(cls: t.Type[T], data: bytes) -> T:
         entries = []
-        while len(data) > 0:
-            record = ffi.cast('struct linux_dirent64*', ffi.from_buffer(data))
-            name_len = record.d_reclen - _d_name_offset
+        offset = 0
+        while offset < len(data):
+            inode, off, reclen, type = _dirent.unpack_from(data, offset)
+            name_start = offset + _d_name_offset
+            end = offset + reclen
             # the name is padded with null bytes to make the dirent aligned,
-            # so we have to use strlen to find the end
-            name = ffi.string(record.d_name, name_len).decode()
-            entries.append(Dirent(inode=record.d_ino, offset=record.d_off, type=DT(record.d_type), name=name))
-            data = data[record.d_reclen:]
+            # so we have to search for the end
+            name_end = data.find(b'\0', name_start, end)
+            if name_end == -1:
+                name_end = end
+            entries.append(Dirent(inode=inode, offset=off, type=DT(type), name=data[name_start:name_end].decode()))
+            offset = end
         return cls(entries)
 
 
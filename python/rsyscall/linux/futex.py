@@ -9,6 +9,9 @@ if t.TYPE_CHECKING:
 
 FUTEX_WAITERS: int = lib.FUTEX_WAITERS
 FUTEX_TID_MASK: int = lib.FUTEX_TID_MASK
+FUTEX_WAKE: int = lib.FUTEX_WAKE
+FUTEX_32: int = lib.FUTEX_32
+FUTEX_WAITV_MAX: int = lib.FUTEX_WAITV_MAX
 
 @dataclass
 class FutexNode(Struct):
@@ -50,3 +53,33 @@ class RobustListHead(Struct):
     @classmethod
     def sizeof(cls) -> int:
         return ffi.sizeof('struct robust_list_head')
+
+@dataclass
+class FutexWaitv(Struct):
+    """One entry in the array passed to futex_waitv
+
+    uaddr is a raw address in the address space of the task calling futex_waitv; the
+    caller is responsible for keeping the futex there alive while it's waited on.
+
+    """
+    val: int
+    uaddr: int
+    flags: int = FUTEX_32
+
+    def to_bytes(self) -> bytes:
+        struct = ffi.new('struct futex_waitv*', {
+            'val': self.val,
+            'uaddr': self.uaddr,
+            'flags': self.flags,
+        })
+        return bytes(ffi.buffer(struct))
+
+    T = t.TypeVar('T', bound='FutexWaitv')
+    @classmethod
+    def from_bytes(cls: t.Type[T], data: bytes) -> T:
+        struct = ffi.cast('struct futex_waitv*', ffi.from_buffer(data))
+        return cls(struct.val, struct.uaddr, struct.flags)
+
+    @classmethod
+    def sizeof(cls) -> int:
+        return ffi.sizeof('struct futex_waitv')
@@ -1,5 +1,6 @@
 from rsyscall._raw import ffi, lib # type: ignore
 from rsyscall.sys.socket import Address, AF, _register_sockaddr
+from rsyscall.struct import codec
 import typing as t
 import enum
 from dataclasses import dataclass
@@ -12,6 +13,8 @@ __all__ = [
 class NETLINK(enum.IntEnum):
     ROUTE = lib.NETLINK_ROUTE
 
+_sockaddr_nl = codec('struct sockaddr_nl')
+
 @dataclass
 class SockaddrNl(Address):
     # not an actual process pid, but rather "port id", which is unique per netlink socket
@@ -20,19 +23,18 @@ class SockaddrNl(Address):
     family = AF.NETLINK
 
     def to_bytes(self) -> bytes:
-        struct = ffi.new('struct sockaddr_nl*', (AF.NETLINK, 0, self.pid, self.groups))
-        return bytes(ffi.buffer(struct))
+        return _sockaddr_nl.pack(AF.NETLINK, 0, self.pid, self.groups)
 
     T = t.TypeVar('T', bound='SockaddrNl')
     @classmethod
     def from_bytes(cls: t.Type[T], data: bytes) -> T:
         if len(data) < cls.sizeof():
             raise Exception("data too small", data)
-        struct = ffi.cast('struct sockaddr_nl*', ffi.from_buffer(data))
-        cls.check_family(AF(struct.nl_family))
-        return cls(struct.nl_pid, struct.nl_groups)
+        family, pad, pid, groups = _sockaddr_nl.unpack_from(data)
+        cls.check_family(AF(family))
+        return cls(pid, groups)
 
     @classmethod
     def sizeof(cls) -> int:
-        return ffi.sizeof('struct sockaddr_nl')
+        return _sockaddr_nl.size
 _register_sockaddr(SockaddrNl)
@@ -34,6 +34,9 @@ class Allocation(AllocationInterface):
     We have a reference back to our Arena so that we can do free(), split(), and merge().
     When __del__ is called on this allocation, we'll free ourselves out of our Arena.
 
+    The Arena doesn't keep references to its allocations; it only tracks free space. So
+    split() and merge() don't need to touch the Arena at all.
+
     See AllocationInterface for more about this interface.
 
     """
@@ -50,7 +53,7 @@ class Allocation(AllocationInterface):
     def free(self) -> None:
         if self.valid:
             self.valid = False
-            self.arena.allocations.remove(self)
+            self.arena._free(self.start, self.end)
 
     def size(self) -> int:
         return self.end - self.start
@@ -58,15 +61,9 @@ class Allocation(AllocationInterface):
     def split(self, size: int) -> t.Tuple[Allocation, Allocation]:
         if not self.valid:
             raise Exception("can't split freed allocation")
-        idx = self.arena.allocations.index(self)
         splitpoint = self.start+size
-        first = Allocation(self.arena, self.start, splitpoint, valid=False)
-        second = Allocation(self.arena, splitpoint, self.end, valid=False)
-        self.free()
-        self.arena.allocations[idx:idx] = [first, second]
-        first.valid = True
-        second.valid = True
-        return first, second
+        self.valid = False
+        return Allocation(self.arena, self.start, splitpoint), Allocation(self.arena, splitpoint, self.end)
 
     def merge(self, other: AllocationInterface) -> Allocation:
         if not isinstance(other, Allocation):
@@ -78,22 +75,13 @@ class Allocation(AllocationInterface):
         if self.arena != other.arena:
             # in general, merge is only supported if they started out from the same allocation
             raise Exception("merging allocations from two different arenas - not supported!")
-        arena = self.arena
         if self.end != other.start:
             raise Exception("to merge allocations, our end", self.end, "must equal their start", other.start)
-        a_idx = arena.allocations.index(self)
-        b_idx = arena.allocations.index(other)
-        if a_idx + 1 != b_idx:
-            raise Exception("allocations are unexpectedly at non-adjacent indices", a_idx, b_idx)
-        new = Allocation(self.arena, self.start, other.end, valid=False)
-        self.free()
-        other.free()
-        arena.allocations.insert(a_idx, new)
-        new.valid = True
-        return new
+        self.valid = False
+        other.valid = False
+        return Allocation(self.arena, self.start, other.end)
 
     def __del__(self) -> None:
-        # TODO this is actually not going to work, because the Arena stores references to the allocation
         self.free()
 
 class OutOfSpaceError(Exception):
@@ -112,32 +100,84 @@ class AllocatorInterface:
     def inherit(self, task: Task) -> AllocatorInterface:
         raise Exception("can't be inherited:", self)
 
+def _size_class(size: int) -> int:
+    "The size class of a free extent; every extent in class n is at least 2**n bytes long."
+    return size.bit_length() - 1
+
 class Arena(AllocatorInterface):
-    "A single memory mapping and allocations within it."
+    """A single memory mapping and allocations within it.
+
+    We track the free extents of the mapping, not the allocations. Free extents are
+    indexed by their start and by their end, so that freeing an allocation can coalesce
+    it with its free neighbors in constant time. They're also put in bins by size class,
+    so that malloc can take any extent from the first non-empty bin whose extents are
+    all certain to be large enough, without searching.
+
+    """
     def __init__(self, mapping: MemoryMapping) -> None:
         self.mapping = mapping
-        self.allocations: t.List[Allocation] = []
+        self.free_by_start: t.Dict[int, int] = {}
+        self.free_by_end: t.Dict[int, int] = {}
+        self.bins: t.List[t.Set[int]] = [set() for _ in range(_size_class(self.mapping.near.length) + 1)]
+        self._add_extent(0, self.mapping.near.length)
+
+    def _add_extent(self, start: int, end: int) -> None:
+        if start == end:
+            return
+        self.free_by_start[start] = end
+        self.free_by_end[end] = start
+        self.bins[_size_class(end - start)].add(start)
+
+    def _remove_extent(self, start: int) -> int:
+        end = self.free_by_start.pop(start)
+        del self.free_by_end[end]
+        self.bins[_size_class(end - start)].remove(start)
+        return end
+
+    def _free(self, start: int, end: int) -> None:
+        if start == end:
+            return
+        if end in self.free_by_start:
+            end = self._remove_extent(end)
+        prev_start = self.free_by_end.get(start)
+        if prev_start is not None:
+            self._remove_extent(prev_start)
+            start = prev_start
+        self._add_extent(start, end)
+
+    def _find_extent(self, size: int, alignment: int) -> t.Optional[int]:
+        "Return the start of some free extent which can hold an aligned allocation of this size"
+        # any extent at least this large can hold the allocation no matter its start
+        smallest_sure_class = (size + alignment - 2).bit_length()
+        for bin in self.bins[smallest_sure_class:]:
+            if bin:
+                return next(iter(bin))
+        # an extent in a lower class, but at least as large as the allocation, might still
+        # fit, depending on how its start is aligned; we have to check each one.
+        for bin in self.bins[_size_class(size):smallest_sure_class]:
+            for start in bin:
+                if align(start, alignment) + size <= self.free_by_start[start]:
+                    return start
+        return None
 
     async def malloc(self, size: int, alignment: int) -> t.Tuple[MemoryMapping, Allocation]:
         return self.mapping, self.allocate(size, alignment)
 
     def allocate(self, size: int, alignment: int) -> Allocation:
-        newstart = 0
-        for i, alloc in enumerate(self.allocations):
-            if (newstart+size) <= alloc.start:
-                newalloc = Allocation(self, newstart, newstart+size)
-                self.allocations.insert(i, newalloc)
-                return newalloc
-            newstart = align(alloc.end, alignment)
-        if (newstart+size) <= self.mapping.near.length:
-            newalloc = Allocation(self, newstart, newstart+size)
-            self.allocations.append(newalloc)
-            return newalloc
-        raise OutOfSpaceError()
+        if size == 0:
+            return Allocation(self, 0, 0)
+        start = self._find_extent(size, alignment)
+        if start is None:
+            raise OutOfSpaceError()
+        end = self._remove_extent(start)
+        newstart = align(start, alignment)
+        self._add_extent(start, newstart)
+        self._add_extent(newstart+size, end)
+        return Allocation(self, newstart, newstart+size)
 
     async def close(self) -> None:
-        if self.allocations:
-            raise Exception
+        if self.free_by_start.get(0) != self.mapping.near.length:
+            raise Exception("can't close arena with live allocations", self.mapping)
         await self.mapping.munmap()
 
 def align(num: int, alignment: int) -> int:
@@ -208,6 +248,10 @@ class UnlimitedAllocator:
         [ret] = await self.bulk_malloc([(size, alignment)])
         return ret
 
+    def add_arena(self, mapping: MemoryMapping) -> None:
+        "Allocate from this mapping in preference to any of our other mappings"
+        self.arenas.insert(0, Arena(mapping.for_task(self.task)))
+
     async def close(self) -> None:
         "Unmap all the mappings owned by this Allocator."
         for arena in self.arenas:
@@ -237,6 +281,10 @@ class AllocatorClient(AllocatorInterface):
     def inherit(self, task: Task) -> AllocatorClient:
         return AllocatorClient(task, self.shared_allocator)
 
+    def add_arena(self, mapping: MemoryMapping) -> None:
+        "Allocate from this mapping in preference to any other; see UnlimitedAllocator.add_arena"
+        self.shared_allocator.add_arena(mapping)
+
     async def bulk_malloc(self, sizes: t.List[t.Tuple[int, int]]) -> t.Sequence[t.Tuple[MemoryMapping, AllocationInterface]]:
         seq = await self.shared_allocator.bulk_malloc(sizes)
         return [(mapping.for_task(self.task), alloc) for mapping, alloc in seq]
@@ -0,0 +1,142 @@
+"""Memory transport to a remote address space based on process_vm_readv/writev.
+
+SocketMemoryTransport can reach any address space we have a connected
+file descriptor into, but every batch costs several syscalls on both
+sides and two copies through the kernel.
+
+When the remote address space belongs to a process in our own pid
+namespace, and we're allowed to ptrace it, we can instead copy
+directly between our memory and its memory with a single
+process_vm_readv or process_vm_writev call for a whole batch. These
+syscalls are made in the local thread, so the remote task doesn't have
+to do anything at all.
+
+This doesn't always work: Yama or a lack of privileges may deny us
+ptrace access, the kernel may not have these syscalls, or the process
+may have died while the address space lives on in another task. In
+those cases we permanently fall back to some other transport;
+typically, a SocketMemoryTransport.
+
+"""
+from __future__ import annotations
+from rsyscall._raw import ffi # type: ignore
+from rsyscall.handle import MemoryTransport, Pointer, Task
+from rsyscall.sys.uio import IOV_MAX
+import errno
+import logging
+import rsyscall.near as near
+import typing as t
+
+__all__ = [
+    "ProcessVMMemoryTransport",
+]
+
+logger = logging.getLogger(__name__)
+
+FALLBACK_ERRNOS = {errno.EPERM, errno.EACCES, errno.ENOSYS, errno.ESRCH}
+
+Segment = t.Tuple[int, int, int]
+"A (local address, remote address, size) triple describing one contiguous copy"
+
+def _make_iovecs(segments: t.List[Segment]) -> t.Tuple[t.Any, t.Any]:
+    local_iov = ffi.new('struct iovec[]', len(segments))
+    remote_iov = ffi.new('struct iovec[]', len(segments))
+    for i, (local_addr, remote_addr, size) in enumerate(segments):
+        local_iov[i].iov_base = ffi.cast('void*', local_addr)
+        local_iov[i].iov_len = size
+        remote_iov[i].iov_base = ffi.cast('void*', remote_addr)
+        remote_iov[i].iov_len = size
+    return local_iov, remote_iov
+
+def _drop_transferred(segments: t.List[Segment], count: int) -> t.List[Segment]:
+    "Remove the first count bytes from this list of segments"
+    for i, (local_addr, remote_addr, size) in enumerate(segments):
+        if count < size:
+            return [(local_addr + count, remote_addr + count, size - count)] + segments[i+1:]
+        count -= size
+    return []
+
+class ProcessVMMemoryTransport(MemoryTransport):
+    """Read and write bytes in a remote address space with process_vm_readv/writev
+
+    "local" must be a task making syscalls directly in this Python
+    thread, since we pass it pointers to our own buffers. "remote" is
+    some task in the address space we want to access; we use its pid
+    to name the address space to the kernel.
+
+    If the remote task isn't in the same pid namespace as the local
+    task, or if process_vm_readv/writev fail because of permissions
+    or lack of support, we use "fallback" instead, from then on.
+
+    """
+    def __init__(self, local: Task, remote: Task, fallback: MemoryTransport) -> None:
+        self.local = local
+        self.remote = remote
+        self.fallback = fallback
+        self.usable = remote.pidns is local.pidns
+
+    def inherit(self, task: Task) -> ProcessVMMemoryTransport:
+        ret = ProcessVMMemoryTransport(self.local, task, self.fallback.inherit(task))
+        ret.usable = ret.usable and self.usable
+        return ret
+
+    def _disable(self, e: OSError) -> None:
+        logger.debug("process_vm_readv/writev unusable for %s, falling back to %s: %s",
+                     self.remote, self.fallback, e)
+        self.usable = False
+
+    async def _transfer(self, syscall: t.Callable[..., t.Awaitable[int]], segments: t.List[Segment]) -> None:
+        pid = self.remote.process.near
+        while segments:
+            chunk = segments[:IOV_MAX]
+            local_iov, remote_iov = _make_iovecs(chunk)
+            ret = await syscall(
+                self.local.sysif, pid,
+                near.Address(int(ffi.cast('uintptr_t', local_iov))), len(chunk),
+                near.Address(int(ffi.cast('uintptr_t', remote_iov))), len(chunk), 0)
+            if ret == 0:
+                raise Exception("process_vm transfer made no progress", chunk)
+            # a partial transfer is possible if part of a remote iovec is inaccessible;
+            # we retry with the rest, which will fail with a proper error if it really is.
+            segments = _drop_transferred(segments, ret)
+
+    async def batch_write(self, ops: t.List[t.Tuple[Pointer, bytes]]) -> None:
+        if not self.usable:
+            return await self.fallback.batch_write(ops)
+        bufs = [ffi.from_buffer(data) for _, data in ops]
+        segments = [(int(ffi.cast('uintptr_t', buf)), int(dest.near), len(data))
+                    for buf, (dest, data) in zip(bufs, ops) if len(data) > 0]
+        try:
+            await self._transfer(near.process_vm_writev, segments)
+        except OSError as e:
+            if e.errno not in FALLBACK_ERRNOS:
+                raise
+            self._disable(e)
+            await self.fallback.batch_write(ops)
+
+    async def batch_read(self, ops: t.List[Pointer]) -> t.List[bytes]:
+        if not self.usable:
+            return await self.fallback.batch_read(ops)
+        sizes = [src.size() for src in ops]
+        buf = ffi.new('char[]', max(sum(sizes), 1))
+        base = int(ffi.cast('uintptr_t', buf))
+        segments: t.List[Segment] = []
+        offset = 0
+        for src, size in zip(ops, sizes):
+            if size > 0:
+                segments.append((base + offset, int(src.near), size))
+            offset += size
+        try:
+            await self._transfer(near.process_vm_readv, segments)
+        except OSError as e:
+            if e.errno not in FALLBACK_ERRNOS:
+                raise
+            self._disable(e)
+            return await self.fallback.batch_read(ops)
+        data = ffi.buffer(buf)
+        ret: t.List[bytes] = []
+        offset = 0
+        for size in sizes:
+            ret.append(bytes(data[offset:offset+size]))
+            offset += size
+        return ret
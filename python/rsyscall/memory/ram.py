@@ -6,10 +6,13 @@ from rsyscall.struct import FixedSize, T_fixed_size, HasSerializer, T_has_serial
 import rsyscall.near.types as near
 import rsyscall.far as far
 
+import collections
+import weakref
 import typing as t
 
 __all__ = [
     "RAM",
+    "ConstPointerCache",
     "perform_batch",
     "RAMThread",
 ]
@@ -21,23 +24,60 @@ class BytesSerializer(Serializer[bytes]):
     def from_bytes(self, data: bytes) -> bytes:
         return data
 
+class ConstPointerCache:
+    """An LRU cache of pointers to constant values in one address space, keyed by their contents
+
+    This can be shared between the RAMs of all the tasks in an address space. We store the
+    address space the pointers were allocated in, so that RAM.const_ptr can notice when a
+    task has changed address space, such as by calling execve, and start a new cache. We
+    only store a weak reference to it, so that the cache doesn't keep an address space
+    alive after every task has left it.
+
+    """
+    def __init__(self, address_space: far.AddressSpace, maxsize: int=256) -> None:
+        self.address_space = weakref.ref(address_space)
+        self.maxsize = maxsize
+        self.pointers: t.OrderedDict[t.Tuple[type, bytes], WrittenPointer] = collections.OrderedDict()
+
+    def get(self, key: t.Tuple[type, bytes]) -> t.Optional[WrittenPointer]:
+        ptr = self.pointers.get(key)
+        if ptr is None:
+            return None
+        if not ptr.valid:
+            # someone freed it, despite being told not to
+            del self.pointers[key]
+            return None
+        self.pointers.move_to_end(key)
+        return ptr
+
+    def put(self, key: t.Tuple[type, bytes], ptr: WrittenPointer) -> None:
+        self.pointers[key] = ptr
+        self.pointers.move_to_end(key)
+        while len(self.pointers) > self.maxsize:
+            # the pointer is freed when the last user drops it
+            self.pointers.popitem(last=False)
+
+# larger values aren't worth keeping around in the cache
+MAX_CONST_SIZE = 4096
+
 T = t.TypeVar('T')
 class RAM:
     """Central user-friendly class for accessing memory.
 
-    Future work: An option to allocate "const" pointers, which we
-    could cache and reuse each time they're requested. This would be
-    useful for small pieces of memory which are very frequently used.
+    Small constants which are frequently passed to syscalls can be allocated with
+    const_ptr, which caches them in a ConstPointerCache shared by the whole address space.
 
     """
     def __init__(self, 
                  task: Task,
                  transport: MemoryTransport,
                  allocator: AllocatorInterface,
+                 const_cache: ConstPointerCache=None,
     ) -> None:
         self.task = task
         self.transport = transport
         self.allocator = allocator
+        self.const_cache = ConstPointerCache(task.address_space) if const_cache is None else const_cache
 
     @t.overload
     async def malloc(self, cls: t.Type[T_fixed_size]) -> Pointer[T_fixed_size]: ...
@@ -83,6 +123,37 @@ class RAM:
         else:
             raise Exception("don't know how to serialize data passed to ptr", data)
 
+    @t.overload
+    async def const_ptr(self, data: T_has_serializer) -> WrittenPointer[T_has_serializer]: ...
+    @t.overload
+    async def const_ptr(self, data: t.Union[bytes]) -> WrittenPointer[bytes]: ...
+    async def const_ptr(self, data: t.Union[T_has_serializer, bytes],
+    ) -> t.Union[WrittenPointer[T_has_serializer], WrittenPointer[bytes]]:
+        """Like ptr, but the pointer may be shared with anyone else who asks for the same data.
+
+        Pointers are cached by the serialized contents of the data, so frequently used
+        small constants don't need to be allocated and written each time. The returned
+        pointer must only be passed to syscalls which read from it; it must not be written
+        to, split, or freed.
+
+        """
+        if isinstance(data, HasSerializer):
+            data_bytes = data.get_self_serializer(self.task).to_bytes(data)
+        elif isinstance(data, bytes):
+            data_bytes = data
+        else:
+            raise Exception("don't know how to serialize data passed to const_ptr", data)
+        if len(data_bytes) > MAX_CONST_SIZE:
+            return await self.ptr(data)
+        if self.const_cache.address_space() is not self.task.address_space:
+            self.const_cache = ConstPointerCache(self.task.address_space)
+        key = (type(data), data_bytes)
+        ptr = self.const_cache.get(key)
+        if ptr is None:
+            ptr = await self.ptr(data)
+            self.const_cache.put(key, ptr)
+        return ptr
+
     async def perform_batch(self, op: t.Callable[[RAM], t.Awaitable[T]],
                                   allocator: AllocatorInterface=None,
     ) -> T:
@@ -0,0 +1,107 @@
+"""Memory transport for remote memory which is also mapped into the local address space.
+
+If some file, such as a memfd, is mapped MAP.SHARED both in a remote
+address space and in our own, then reading and writing the remote
+mapping is just reading and writing our own mapping. No syscalls are
+needed at all; we can just memmove.
+
+We identify such mappings by their far.File, which is shared between
+all the mappings of the same open file description; this is the same
+identity that Pointer._with_mapping uses to move a pointer between
+two mappings of the same file. Like Pointer._with_mapping, we assume
+both mappings start at the same offset in the file.
+
+Pointers into mappings we don't know about are passed through to some
+other transport.
+
+A local mapping can be tied to the remote address space it mirrors
+with add_owned_mapping; then it's unmapped once that address space is
+gone.
+
+"""
+from __future__ import annotations
+from rsyscall._raw import ffi, lib # type: ignore
+from rsyscall.handle import MemoryTransport, MemoryMapping, Pointer, Task
+from rsyscall.sys.syscall import SYS
+import rsyscall.far as far
+import typing as t
+import weakref
+
+__all__ = [
+    "SharedMemoryTransport",
+]
+
+class SharedMemoryTransport(MemoryTransport):
+    """Read and write remote memory through local mappings of the same file, using memmove
+
+    "local" is the task for our own address space; local mappings
+    registered with add_mapping must be in its address space.
+
+    All pointers which aren't in a registered file are read or written
+    with "fallback", in a single batch.
+
+    """
+    def __init__(self, local: Task, fallback: MemoryTransport,
+                 mappings: t.Dict[far.File, MemoryMapping]=None) -> None:
+        self.local = local
+        self.fallback = fallback
+        self.mappings: t.Dict[far.File, MemoryMapping] = {} if mappings is None else mappings
+
+    def inherit(self, task: Task) -> SharedMemoryTransport:
+        return SharedMemoryTransport(self.local, self.fallback.inherit(task), self.mappings)
+
+    def add_mapping(self, mapping: MemoryMapping) -> None:
+        "Serve pointers into any other mapping of this mapping's file with memmove into this mapping"
+        if mapping.task.address_space != self.local.address_space:
+            raise Exception("mapping", mapping, "is not in the local address space")
+        self.mappings[mapping.file] = mapping
+
+    def add_owned_mapping(self, mapping: MemoryMapping, remote: far.AddressSpace) -> None:
+        """Like add_mapping, but unmap `mapping` once the address space `remote` is gone
+
+        `mapping` must be a mapping of memory which is also mapped in `remote`, and which
+        we use for nothing else. `remote` is gone when nothing refers to it any more, which
+        means every task in it has exec'd or exited and been dropped; then no pointer
+        into it can be used again, so we stop serving the file and unmap `mapping`.
+
+        """
+        self.add_mapping(mapping)
+        weakref.finalize(remote, _unmap_local, self.mappings, mapping)
+
+    def _local_address(self, ptr: Pointer) -> t.Optional[int]:
+        local_mapping = self.mappings.get(ptr.mapping.file)
+        if local_mapping is None:
+            return None
+        return local_mapping.near.address + ptr.allocation.offset()
+
+    async def batch_write(self, ops: t.List[t.Tuple[Pointer, bytes]]) -> None:
+        rest: t.List[t.Tuple[Pointer, bytes]] = []
+        for dest, data in ops:
+            address = self._local_address(dest)
+            if address is None:
+                rest.append((dest, data))
+            else:
+                ffi.memmove(ffi.cast('void*', address), data, len(data))
+        if rest:
+            await self.fallback.batch_write(rest)
+
+    async def batch_read(self, ops: t.List[Pointer]) -> t.List[bytes]:
+        ret: t.List[t.Optional[bytes]] = []
+        rest: t.List[Pointer] = []
+        for src in ops:
+            address = self._local_address(src)
+            if address is None:
+                ret.append(None)
+                rest.append(src)
+            else:
+                ret.append(bytes(ffi.buffer(ffi.cast('void*', address), src.size())))
+        if rest:
+            rest_data = iter(await self.fallback.batch_read(rest))
+            return [next(rest_data) if data is None else data for data in ret]
+        return t.cast(t.List[bytes], ret)
+
+def _unmap_local(mappings: t.Dict[far.File, MemoryMapping], mapping: MemoryMapping) -> None:
+    "Stop serving `mapping` and unmap it; it's in our own address space, so we can just munmap it here"
+    if mappings.get(mapping.file) is mapping:
+        del mappings[mapping.file]
+    lib.rsyscall_raw_syscall(int(mapping.near.address), mapping.near.length, 0, 0, 0, 0, SYS.munmap)
@@ -36,11 +36,13 @@ from rsyscall.memory.ram import RAM
 from rsyscall.epoller import AsyncFileDescriptor
 from rsyscall.handle import MemoryTransport
 import rsyscall.handle as handle
+import rsyscall.trace as trace
 import typing as t
 import trio
 
 from rsyscall.handle import AllocationInterface, Pointer, IovecList, FileDescriptor
 from rsyscall.memory.allocator import AllocatorInterface
+from rsyscall.sys.uio import IOV_MAX
 
 __all__ = [
     "SocketMemoryTransport",
@@ -235,17 +237,18 @@ def merge_adjacent_reads(read_ops: t.List[ReadOp]) -> t.List[t.Tuple[ReadOp, t.L
     groupings: t.List[t.List[ReadOp]] = []
     ops_to_merge = [read_ops[0]]
     for prev_op, op in zip(read_ops, read_ops[1:]):
-        if int(prev_op.src.near + prev_op.src.size()) == int(op.src.near):
-            # the current op is adjacent to the previous op, append it to
-            # the list of pending ops to merge together.
-            ops_to_merge.append(op)
-        elif int(prev_op.src.near + prev_op.src.size()) > int(op.src.near):
-            raise Exception("pointers passed to memcpy are overlapping!", prev_op.src, op.src)
-        else:
-            # the current op isn't adjacent to the previous op, so
-            # flush the list of ops_to_merge and start a new one.
-            groupings.append(ops_to_merge)
-            ops_to_merge = [op]
+        if prev_op.src.mapping is op.src.mapping:
+            if int(prev_op.src.near + prev_op.src.size()) == int(op.src.near):
+                # the current op is adjacent to the previous op, append it to
+                # the list of pending ops to merge together.
+                ops_to_merge.append(op)
+                continue
+            elif int(prev_op.src.near + prev_op.src.size()) > int(op.src.near):
+                raise Exception("pointers passed to memcpy are overlapping!", prev_op.src, op.src)
+        # the current op isn't adjacent to the previous op, so
+        # flush the list of ops_to_merge and start a new one.
+        groupings.append(ops_to_merge)
+        ops_to_merge = [op]
     groupings.append(ops_to_merge)
     outputs: t.List[t.Tuple[ReadOp, t.List[ReadOp]]] = []
     for group in groupings:
@@ -358,25 +361,35 @@ class SocketMemoryTransport(MemoryTransport):
                                      self.remote_allocator.inherit(task))
 
     async def _unlocked_batch_write(self, ops: t.List[t.Tuple[Pointer, bytes]]) -> None:
-        ops = sorted(ops, key=lambda op: int(op[0].near))
-        ops = merge_adjacent_writes(ops)
-        if len(ops) <= 1:
-            [(dest, data)] = ops
-            await self.primitive.write(dest, data)
-        else:
-            iovp = await self.primitive_remote_ram.ptr(IovecList([ptr for ptr, _ in ops]))
-            datap = await self.local.ram.ptr(b"".join([data for _, data in ops]))
-            async with trio.open_nursery() as nursery:
-                @nursery.start_soon
-                async def write() -> None:
-                    await self.local.write_all(datap)
-                rest = iovp
-                while rest.size() > 0:
-                    _, split, rest = await self.remote.readv(rest)
-                    if split:
-                        _, split_rest = split
-                        while split_rest.size() > 0:
-                            _, split_rest = await self.remote.read(split_rest)
+        with trace.span("batch_write", "transport", self.remote.task.process.near.id) as args:
+            if args is not None:
+                args["ops"] = len(ops)
+                args["bytes"] = sum(len(data) for _, data in ops)
+            ops = sorted(ops, key=lambda op: int(op[0].near))
+            ops = merge_adjacent_writes(ops)
+            if args is not None:
+                args["merged"] = len(ops)
+            if len(ops) <= 1:
+                [(dest, data)] = ops
+                await self.primitive.write(dest, data)
+            else:
+                for i in range(0, len(ops), IOV_MAX):
+                    await self._readv_chunk(ops[i:i+IOV_MAX])
+
+    async def _readv_chunk(self, ops: t.List[t.Tuple[Pointer, bytes]]) -> None:
+        iovp = await self.primitive_remote_ram.ptr(IovecList([ptr for ptr, _ in ops]))
+        datap = await self.local.ram.ptr(b"".join([data for _, data in ops]))
+        async with trio.open_nursery() as nursery:
+            @nursery.start_soon
+            async def write() -> None:
+                await self.local.write_all(datap)
+            rest = iovp
+            while rest.size() > 0:
+                _, split, rest = await self.remote.readv(rest)
+                if split:
+                    _, split_rest = split
+                    while split_rest.size() > 0:
+                        _, split_rest = await self.remote.read(split_rest)
 
     def _start_single_write(self, dest: Pointer, data: bytes) -> WriteOp:
         write = WriteOp(dest, data)
@@ -408,8 +421,40 @@ class SocketMemoryTransport(MemoryTransport):
                 raise
 
     async def _unlocked_batch_read(self, ops: t.List[ReadOp]) -> None:
+        if len(ops) <= 1:
+            for op in ops:
+                op.done = await self.primitive.read(op.src)
+        else:
+            for i in range(0, len(ops), IOV_MAX):
+                await self._writev_chunk(ops[i:i+IOV_MAX])
+
+    async def _writev_chunk(self, ops: t.List[ReadOp]) -> None:
+        iovp = await self.primitive_remote_ram.ptr(IovecList([op.src for op in ops]))
+        dest = await self.local.ram.malloc(bytes, sum(op.src.size() for op in ops))
+        async with trio.open_nursery() as nursery:
+            @nursery.start_soon
+            async def write() -> None:
+                rest = iovp
+                while rest.size() > 0:
+                    _, split, rest = await self.remote.writev(rest)
+                    if split:
+                        _, split_rest = split
+                        while split_rest.size() > 0:
+                            _, split_rest = await self.remote.write(split_rest)
+            read: t.Optional[Pointer[bytes]] = None
+            rest = dest
+            while rest.size() > 0:
+                more_read, rest = await self.local.read(rest)
+                if read is None:
+                    read = more_read
+                else:
+                    read = read.merge(more_read)
+        data = memoryview(b'' if read is None else await read.read())
+        offset = 0
         for op in ops:
-            op.done = await self.primitive.read(op.src)
+            size = op.src.size()
+            op.done = bytes(data[offset:offset+size])
+            offset += size
 
     def _start_single_read(self, dest: Pointer) -> ReadOp:
         op = ReadOp(dest)
@@ -425,14 +470,21 @@ class SocketMemoryTransport(MemoryTransport):
                 merged_ops = merge_adjacent_reads(ops)
                 # TODO we should not use a cancel scope shield, we should use the SyscallResponse API
                 with trio.CancelScope(shield=True):
-                    await self._unlocked_batch_read([op for op, _ in merged_ops])
+                    with trace.span("batch_read", "transport", self.remote.task.process.near.id) as args:
+                        if args is not None:
+                            args["ops"] = len(ops)
+                            args["bytes"] = sum(op.src.size() for op in ops)
+                            args["merged"] = len(merged_ops)
+                        await self._unlocked_batch_read([op for op, _ in merged_ops])
                 for op, orig_ops in merged_ops:
-                    data = op.data
+                    data = memoryview(op.data)
+                    offset = 0
                     for orig_op in orig_ops:
                         orig_size = orig_op.src.size()
-                        if len(data) < orig_size:
-                            raise Exception("insufficient data for original operation", len(data), orig_size)
-                        orig_op.done, data = data[:orig_size], data[orig_size:]
+                        if len(data) - offset < orig_size:
+                            raise Exception("insufficient data for original operation", len(data) - offset, orig_size)
+                        orig_op.done = bytes(data[offset:offset+orig_size])
+                        offset += orig_size
 
     async def batch_read(self, ops: t.List[Pointer]) -> t.List[bytes]:
         read_ops = [self._start_single_read(src) for src in ops]
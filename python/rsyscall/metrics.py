@@ -0,0 +1,182 @@
+"""Opt-in per-syscall metrics, for finding out which syscalls a task spends its time in
+
+Metrics are disabled by default. `enable_metrics` turns them on for one Task, after
+which each syscall made through the task's SyscallInterface is counted, along with
+whether it failed and how long it took from submission to response, per syscall
+number. For syscall interfaces which pipeline requests to an rsyscall server, we also
+record how many requests were in flight each time one was submitted.
+
+The metrics can be read through `SyscallMetrics.stats`, or dumped for all the tasks
+with metrics enabled, in the Prometheus text exposition format, with `prometheus_text`.
+
+Syscalls made by calling `submit_syscall` and receiving the response by hand, such as the
+epoll_wait made by EpollWaiter, aren't recorded; their latency is mostly time spent
+waiting for events anyway.
+
+"""
+from __future__ import annotations
+from dataclasses import dataclass, field
+from rsyscall.sys.syscall import SYS
+import bisect
+import typing as t
+import weakref
+if t.TYPE_CHECKING:
+    from rsyscall.handle import Task
+    from rsyscall.near.sysif import SyscallInterface
+
+__all__ = [
+    "LATENCY_BUCKETS",
+    "DEPTH_BUCKETS",
+    "Histogram",
+    "SyscallStats",
+    "SyscallMetrics",
+    "enable_metrics",
+    "disable_metrics",
+    "prometheus_text",
+]
+
+LATENCY_BUCKETS: t.Tuple[float, ...] = tuple(
+    float(f"{mantissa}e{exponent}") for exponent in range(-6, 1) for mantissa in (1, 2.5, 5)) + (10.0,)
+"The upper bounds, in seconds, of the buckets of the syscall latency histograms"
+
+DEPTH_BUCKETS: t.Tuple[float, ...] = tuple(float(2**i) for i in range(9))
+"The upper bounds of the buckets of the pipelining depth histogram"
+
+@dataclass
+class Histogram:
+    "A histogram with fixed bucket bounds, like a Prometheus histogram"
+    bounds: t.Tuple[float, ...]
+    counts: t.List[int] = field(init=False)
+    "The number of observations in each bucket; the last bucket is for those above all the bounds"
+    sum: float = 0.0
+
+    def __post_init__(self) -> None:
+        self.counts = [0]*(len(self.bounds) + 1)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def cumulative(self) -> t.List[t.Tuple[float, int]]:
+        "Return (upper bound, number of observations at or below it) pairs, ending with +Inf"
+        ret: t.List[t.Tuple[float, int]] = []
+        total = 0
+        for bound, count in zip((*self.bounds, float('inf')), self.counts):
+            total += count
+            ret.append((bound, total))
+        return ret
+
+@dataclass
+class SyscallStats:
+    "The metrics for one syscall number"
+    errors: int = 0
+    latency: Histogram = field(default_factory=lambda: Histogram(LATENCY_BUCKETS))
+
+    @property
+    def count(self) -> int:
+        return self.latency.count
+
+class SyscallMetrics:
+    "The metrics for all the syscalls made through one SyscallInterface"
+    def __init__(self, labels: t.Dict[str, str]={}) -> None:
+        self.labels = labels
+        self.syscalls: t.Dict[int, SyscallStats] = {}
+        self.depth = Histogram(DEPTH_BUCKETS)
+
+    def record(self, number: int, seconds: float, error: bool) -> None:
+        "Record a syscall which took `seconds` from submission to response"
+        try:
+            stats = self.syscalls[number]
+        except KeyError:
+            stats = self.syscalls[number] = SyscallStats()
+        stats.latency.observe(seconds)
+        if error:
+            stats.errors += 1
+
+    def record_depth(self, depth: int) -> None:
+        "Record that `depth` requests were in flight, including the one just submitted"
+        self.depth.observe(depth)
+
+    def stats(self) -> t.Dict[t.Union[SYS, int], SyscallStats]:
+        "Return the metrics for each syscall number made so far"
+        return {_sys(number): stats for number, stats in self.syscalls.items()}
+
+    def prometheus(self) -> str:
+        "Return these metrics in the Prometheus text exposition format"
+        return prometheus_text([self])
+
+def _sys(number: int) -> t.Union[SYS, int]:
+    try:
+        return SYS(number)
+    except ValueError:
+        return number
+
+def _syscall_labels(metrics: SyscallMetrics, number: int) -> t.Dict[str, str]:
+    sys = _sys(number)
+    return {**metrics.labels, "syscall": sys.name if isinstance(sys, SYS) else str(sys)}
+
+def _format_labels(labels: t.Dict[str, str]) -> str:
+    def escape(value: str) -> str:
+        return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels.items()) + '}'
+
+def _format_histogram(lines: t.List[str], name: str, labels: t.Dict[str, str], histogram: Histogram) -> None:
+    for bound, count in histogram.cumulative():
+        le = "+Inf" if bound == float('inf') else repr(bound)
+        lines.append(f"{name}_bucket{_format_labels({**labels, 'le': le})} {count}")
+    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum!r}")
+    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+
+_enabled: t.MutableSet[SyscallInterface] = weakref.WeakSet()
+
+def enable_metrics(task: Task) -> SyscallMetrics:
+    """Start recording metrics for the syscalls made by this task, returning them
+
+    The metrics are attached to the task's current SyscallInterface. The task's pid is
+    used as the "pid" label in the Prometheus output. If metrics are already enabled for
+    this task, we return the existing metrics.
+
+    """
+    if task.sysif.metrics is None:
+        task.sysif.metrics = SyscallMetrics({"pid": str(task.process.near.id)})
+        _enabled.add(task.sysif)
+    return task.sysif.metrics
+
+def disable_metrics(task: Task) -> None:
+    "Stop recording metrics for this task, and stop including it in prometheus_text"
+    _enabled.discard(task.sysif)
+    task.sysif.metrics = None
+
+def prometheus_text(metrics: t.Optional[t.Iterable[SyscallMetrics]]=None) -> str:
+    """Dump metrics in the Prometheus text exposition format
+
+    By default, we dump the metrics of all the tasks which have metrics enabled.
+
+    """
+    if metrics is None:
+        metrics = [sysif.metrics for sysif in list(_enabled) if sysif.metrics is not None]
+    else:
+        metrics = list(metrics)
+    lines: t.List[str] = []
+    lines.append("# HELP rsyscall_syscall_seconds Time from submitting a syscall to receiving its response.")
+    lines.append("# TYPE rsyscall_syscall_seconds histogram")
+    for metric in metrics:
+        for number, stats in sorted(metric.syscalls.items()):
+            labels = _syscall_labels(metric, number)
+            _format_histogram(lines, "rsyscall_syscall_seconds", labels, stats.latency)
+    lines.append("# HELP rsyscall_syscall_errors_total Syscalls which returned an error.")
+    lines.append("# TYPE rsyscall_syscall_errors_total counter")
+    for metric in metrics:
+        for number, stats in sorted(metric.syscalls.items()):
+            labels = _syscall_labels(metric, number)
+            lines.append(f"rsyscall_syscall_errors_total{_format_labels(labels)} {stats.errors}")
+    lines.append("# HELP rsyscall_pipeline_depth Requests in flight when a request was submitted.")
+    lines.append("# TYPE rsyscall_pipeline_depth histogram")
+    for metric in metrics:
+        if metric.depth.count:
+            _format_histogram(lines, "rsyscall_pipeline_depth", metric.labels, metric.depth)
+    return '\n'.join(lines) + '\n'
@@ -8,33 +8,39 @@ Our basic approach is to use a signalfd waiting for SIGCHLD to learn when a
 state change may have happened, then call waitid until we run out of state
 changes. This is a common way to handle it, but we have a few changes.
 
-Contrary to the obvious implementation, we don't use waitid(P.ALL).  Instead, we
-make an individual waitid(P.PID) call for each process we're currently
-monitoring for state changes.
-
-P.ALL is unrecoverably broken and racy in many situations. It's fundamentally
-the wrong API: You can't wait for only a subset of processes, you always have to
-handle every single state change that could happen for any process. And worse:
-When you handle the death state change for a child, that child pid is freed and
-can be reused; so you must synchronize against anything that wants to operate on
-child pids, to prevent pid wrap races.
-
-P.ALL is especially bad when considering the possibility of new children
-appearing.  If we call clone in two threads while a third calls waitid, and one
-of the created child processes dies immediately, there is no way to prevent a
-race where waitid gets the death state change before the second clone completes,
-the pid wraps, the same pid is returned for the second clone, and we don't know
-which child process is alive and which is dead. Similar races can happen if
-we're pid 1 or a subreaper and we call clone.
-
-Issuing a batch of P.PID calls instead is much better: We can wait for a subset
-of pids, and so all these worries about races go away.  We still need to
-synchronize between usage of the pid and calls to waitid, but that
-synchronization happens for the individual child process, not globally across
-all our child processes. And the implementation becomes much simpler: Each
-object monitoring an individual child process just calls waitid(P.PID) and
-checks the result, instead of having to wait on some central coordinator to call
-waitid(P.ALL) and send back the state changes.
+We used to make an individual waitid(P.PID) call for each process we were
+monitoring, after every SIGCHLD. That avoids some races, but it makes every
+SIGCHLD cost one waitid per live child; with a thousand children, that's a
+thousand syscalls to find the one child which changed state.
+
+So instead, each ChildReaper calls waitid(P.ALL) until it returns no more state
+changes, and routes each state change to the AsyncChildProcess for that pid,
+through a table indexed by pid. The cost of reaping is proportional to the
+number of state changes, not the number of children.
+
+P.ALL has some well-known problems, which we have to deal with:
+
+- You can't wait for only a subset of processes; you handle every state change
+  for every child. So every child of the monitoring task must be created through
+  its ChildProcessMonitor; state changes for any other children are discarded.
+  That's not true of the local thread, which is the Python process itself, where
+  any library may create children with subprocess or os.fork. So a ChildReaper
+  which doesn't exclusively own its task's children instead calls waitid(P.PID)
+  on each child it knows about, as we used to, and leaves the others alone.
+
+- A child can die and be reaped before the clone which created it has returned
+  its pid to us. While any clone is in progress, we hold on to state changes
+  for unknown pids, and hand them to the AsyncChildProcess when it's created.
+
+- When we reap a child's death, its pid is freed and can be reused; a kill
+  racing with the reap could hit some other process. Linux allocates pids
+  cyclically, so this would require the pid space to wrap around in the
+  meantime. We accept that risk, as do most other process supervisors.
+
+Alternatively, a ChildProcessMonitor made with make_pidfd uses a pidfd for each
+child, registered on an epoller, and calls waitid(P.PIDFD) on it when the child
+exits. That avoids both the signal mask setup and the problems with P.ALL, at the
+cost of a pidfd_open for each child; but pidfds only report exits, not stops.
 
 We also employ another trick: We use CLONE.PARENT to centralize child
 monitoring.  When thread A creates child thread B, we want thread B to be able
@@ -81,7 +87,8 @@ class AsyncSignalfd:
 
     It would be very nice if this bug in signalfd was fixed, that
     would allow a single central process to monitor for signals in
-    many other processes.
+    many other processes. For child processes in particular, pidfds
+    don't have this problem; see PidfdReaper.
 
     """
     @classmethod
@@ -126,51 +133,211 @@ class AsyncSignalfd:
         await self.afd.read(await self.afd.ram.malloc(SignalfdSiginfo))
         self.next_signal = MultiplexedEvent(self._wait_for_some_signal)
 
+class ChildReaper:
+    """Collects all the state changes for the children of one task, and routes them by pid
+
+    This is the signalfd-based backend for ChildProcessMonitor; see also PidfdReaper.
+
+    Only one caller at a time actually reaps; everyone else waits for that caller to
+    finish a round of reaping, then looks at the state changes they've been given.
+
+    If `exclusive` is False, other code may create children of the same task, so we
+    reap our children one pid at a time instead of with waitid(P.ALL).
+
+    """
+    reports = W.EXITED|W.STOPPED|W.CONTINUED
+
+    def __init__(self, sigfd: AsyncSignalfd, ram: RAM, exclusive: bool=True) -> None:
+        self.sigfd = sigfd
+        self.exclusive = exclusive
+        self.ram = ram
+        self.task = sigfd.afd.handle.task
+        self.children: t.Dict[int, AsyncChildProcess] = {}
+        self.clones_in_progress = 0
+        self.unclaimed: t.Dict[int, t.List[ChildState]] = {}
+        self.siginfo_buf: t.Optional[Pointer[Siginfo]] = None
+        self.next_reap = MultiplexedEvent(self._reap)
+
+    def add(self, process: ChildProcess) -> AsyncChildProcess:
+        "Start routing state changes for this child's pid to it, including any we've already reaped"
+        pid = process.near.id
+        child = AsyncChildProcess(process, self)
+        self.children[pid] = child
+        for state in self.unclaimed.pop(pid, []):
+            self._deliver(child, state)
+        return child
+
+    @contextlib.contextmanager
+    def cloning(self) -> t.Iterator[None]:
+        "Hold on to state changes for unknown pids while we're in this context manager"
+        self.clones_in_progress += 1
+        try:
+            yield
+        finally:
+            self.clones_in_progress -= 1
+            if self.clones_in_progress == 0:
+                self.unclaimed.clear()
+
+    def _deliver(self, child: AsyncChildProcess, state: ChildState) -> None:
+        if state.died():
+            child.process.mark_dead(state)
+            del self.children[state.pid]
+        else:
+            # like the kernel, we only keep a child's latest stop or continue
+            child.state_change = state
+
+    async def _waitid_nohang(self) -> t.Optional[ChildState]:
+        # Once waitid returns, the state change is gone from the kernel, so we
+        # must not be cancelled before we've read and recorded it.
+        with trio.CancelScope(shield=True):
+            if self.siginfo_buf is None:
+                self.siginfo_buf = await self.ram.malloc(Siginfo)
+            try:
+                await self.task.waitid(W.EXITED|W.STOPPED|W.CONTINUED|W.ALL|W.NOHANG, self.siginfo_buf)
+            except ChildProcessError:
+                # we have no children at all
+                return None
+            siginfo = await self.siginfo_buf.read()
+        if siginfo.pid == 0:
+            return None
+        return ChildState.make_from_siginfo(siginfo)
+
+    async def _waitid_child_nohang(self, child: AsyncChildProcess) -> t.Optional[ChildState]:
+        with trio.CancelScope(shield=True):
+            if self.siginfo_buf is None:
+                self.siginfo_buf = await self.ram.malloc(Siginfo)
+            await child.process.waitid(W.EXITED|W.STOPPED|W.CONTINUED|W.NOHANG, self.siginfo_buf)
+            return await child.process.read_siginfo()
+
+    async def _drain_each(self) -> int:
+        "Call waitid(P.PID) on each of our children until it has no more state changes"
+        count = 0
+        for child in list(self.children.values()):
+            while child.process.death_state is None:
+                state = await self._waitid_child_nohang(child)
+                if state is None:
+                    break
+                count += 1
+                self._deliver(child, state)
+        return count
+
+    async def _drain(self) -> int:
+        "Call waitid(P.ALL) until there are no more state changes, and return how many there were"
+        if not self.exclusive:
+            return await self._drain_each()
+        count = 0
+        while True:
+            state = await self._waitid_nohang()
+            if state is None:
+                return count
+            count += 1
+            child = self.children.get(state.pid)
+            if child is not None:
+                self._deliver(child, state)
+            elif self.clones_in_progress:
+                self.unclaimed.setdefault(state.pid, []).append(state)
+            else:
+                logger.debug("discarding state change for unknown child %s", state)
+
+    async def _reap(self) -> None:
+        """Reap until we've received at least one state change
+
+        We have to save the signal event before calling waitid, otherwise we may deadlock:
+        If a SIGCHLD is delivered while we're calling waitid, and we then wait for the
+        value of self.sigfd.next_signal after the waitid, we'll be waiting for a SIGCHLD
+        that will never come.
+
+        """
+        while True:
+            saved_sigchld = self.sigfd.next_signal
+            if await self._drain():
+                break
+            await saved_sigchld.wait()
+        self.next_reap = MultiplexedEvent(self._reap)
+
+class PidfdReaper:
+    """Reaps the children of one task through pidfds, one for each child
+
+    This is the pidfd-based backend for ChildProcessMonitor. Each child gets its own
+    pidfd, registered on an epoller, and we call waitid(P.PIDFD) on it once it becomes
+    readable. There's no signal mask to set up and no SIGCHLD to wait for, and a child
+    exiting only wakes up the waiters for that child.
+
+    Unlike signalfds, pidfds work fine with an epoller which is waited on in some other
+    process. But the kernel only makes pidfds readable when the child exits, so this
+    backend can't wait for the child to stop or continue.
+
+    """
+    def __init__(self, ram: RAM, task: Task, epoller: Epoller) -> None:
+        self.ram = ram
+        self.task = task
+        self.epoller = epoller
+
+    def add(self, process: ChildProcess) -> AsyncChildProcess:
+        "Make an AsyncChildProcess for this child; we open its pidfd the first time we wait on it"
+        return AsyncChildProcess(process, PidfdChildReaper(self, process))
+
+    @contextlib.contextmanager
+    def cloning(self) -> t.Iterator[None]:
+        "Nothing to do; a child's pid can't be freed until we reap it through its pidfd"
+        yield
+
+class PidfdChildReaper:
+    "Waits for one child to exit with a pidfd, then reaps it"
+    reports = W.EXITED
+
+    def __init__(self, reaper: PidfdReaper, process: ChildProcess) -> None:
+        self.reaper = reaper
+        self.process = process
+        self.pidfd: t.Optional[AsyncFileDescriptor] = None
+        self.next_reap = MultiplexedEvent(self._reap)
+
+    async def _reap(self) -> None:
+        if self.pidfd is None:
+            # the child can't be reaped by anyone but us, so even if it's already dead,
+            # its pid still refers to it.
+            self.pidfd = await AsyncFileDescriptor.make(
+                self.reaper.epoller, self.reaper.ram, await self.process.pidfd_open())
+        await self.pidfd.wait_for_readable()
+        with trio.CancelScope(shield=True):
+            await self.process.waitid(W.EXITED|W.ALL|W.NOHANG, await self.reaper.ram.malloc(Siginfo),
+                                      pidfd=self.pidfd.handle)
+            state = await self.process.read_siginfo()
+        if state is None:
+            raise Exception("pidfd for", self.process, "was readable, but it hasn't exited")
+        await self.pidfd.close()
+        self.next_reap = MultiplexedEvent(self._reap)
+
 class AsyncChildProcess:
     "A child process which can be monitored without blocking the thread"
-    def __init__(self, process: ChildProcess, ram: RAM, sigchld_sigfd: AsyncSignalfd) -> None:
+    def __init__(self, process: ChildProcess, reaper: t.Union[ChildReaper, PidfdChildReaper]) -> None:
         self.process = process
-        self.ram = ram
-        self.sigchld_sigfd = sigchld_sigfd
-        self.next_sigchld: t.Optional[MultiplexedEvent] = None
+        self.reaper = reaper
+        self.state_change: t.Optional[ChildState] = None
 
-    async def _waitid_nohang(self) -> t.Optional[ChildState]:
-        if self.process.unread_siginfo is None:
-            await self.process.waitid(W.EXITED|W.STOPPED|W.CONTINUED|W.ALL|W.NOHANG, await self.ram.malloc(Siginfo))
-        return await self.process.read_siginfo()
+    def _take_state_change(self, options: W) -> t.Optional[ChildState]:
+        state = self.state_change
+        if state is not None and state.state(options):
+            self.state_change = None
+            return state
+        return None
 
     async def waitpid(self, options: W) -> ChildState:
         "Wait for a child state change in this child, like waitid(P.PID)"
-        if options & W.EXITED and self.process.death_state:
-            # TODO this is not really the actual behavior of waitpid...
-            # if the child is already dead we'd get an ECHLD not the death state change again.
-            return self.process.death_state
+        unsupported = options & (W.EXITED|W.STOPPED|W.CONTINUED) & ~self.reaper.reports
+        if unsupported:
+            raise ValueError("can't wait for", unsupported, "with", self.reaper)
         while True:
-            # If a previous call has given us a next_sigchld to wait on, then wait we shall.
-            if self.next_sigchld:
-                await self.next_sigchld.wait()
-                # we shouldn't wait for SIGCHLD the next time we're called, we should eagerly call
-                # waitid, since there may still be state changes to fetch.
-                self.next_sigchld = None
-            # We have to save this signal event before calling waitid, otherwise we may deadlock: If
-            # a SIGCHLD is delivered while we're calling waitid, then saved_sigchld will be
-            # different from self.sigchld_sigfd.next_signal after the waitid; and if we use the
-            # value of self.sigchld_sigfd.next_signal after the waitid, we'll be waiting for a
-            # SIGCHLD that will never come.
-            saved_sigchld = self.sigchld_sigfd.next_signal
-            state_change = await self._waitid_nohang()
+            if options & W.EXITED and self.process.death_state:
+                # TODO this is not really the actual behavior of waitpid...
+                # if the child is already dead we'd get an ECHLD not the death state change again.
+                return self.process.death_state
+            state_change = self._take_state_change(options)
             if state_change is not None:
-                if state_change.state(options):
-                    return state_change
-                else:
-                    # TODO we shouldn't discard the state change here if we're not waiting for it;
-                    # unfortunately doing it right will require a lot of refactoring of waitid
-                    pass
-            else:
-                # we know for sure that there will only be state changes fetchable by waitid after
-                # waiting for this SIGCHLD event. note that this event may have already happened, if
-                # we received a SIGCHLD while calling waitid.
-                self.next_sigchld = saved_sigchld
+                return state_change
+            # we check our state changes and get next_reap without blocking in between,
+            # so we can't miss a round of reaping which delivered a state change to us.
+            await self.reaper.next_reap.wait()
 
     async def check(self) -> ChildState:
         "Wait for this child to die, and once it does, throw if it didn't exit cleanly"
@@ -180,8 +347,6 @@ class AsyncChildProcess:
 
     async def kill(self, sig: SIG=SIG.KILL) -> None:
         "Send a signal to this child"
-        if self.process.unread_siginfo:
-            await self.process.read_siginfo()
         await self.process.kill(sig)
 
     async def __aenter__(self) -> None:
@@ -203,23 +368,44 @@ class ChildProcessMonitor:
     Use ChildProcessMonitor.make to create.
 
     """
-    sigfd: AsyncSignalfd
+    reaper: t.Union[ChildReaper, PidfdReaper]
     ram: RAM
     cloning_task: Task
     use_clone_parent: bool
 
+    @property
+    def signal_blocks(self) -> t.List[SignalBlock]:
+        "The signals blocked for this monitor, which a child may need to keep blocked across exec"
+        if isinstance(self.reaper, ChildReaper):
+            return [self.reaper.sigfd.signal_block]
+        else:
+            return []
+
     @staticmethod
     async def make(ram: RAM, task: Task, epoller: Epoller,
-                   *, signal_block: SignalBlock=None,
+                   *, signal_block: SignalBlock=None, exclusive: bool=True,
     ) -> ChildProcessMonitor:
         """Make a ChildProcessMonitor, possibly blocking signals
 
         If the signals are already blocked, the user can pass in a SignalBlock to
         represent that, and save the need to make the SignalBlock.
 
+        Pass exclusive=False if something other than this monitor may create children
+        of `task`; see the module docstring.
+
         """
         sigfd = await AsyncSignalfd.make(ram, task, epoller, Sigset({SIG.CHLD}), signal_block=signal_block)
-        return ChildProcessMonitor(sigfd, ram, task, use_clone_parent=False)
+        return ChildProcessMonitor(ChildReaper(sigfd, ram, exclusive), ram, task, use_clone_parent=False)
+
+    @staticmethod
+    async def make_pidfd(ram: RAM, task: Task, epoller: Epoller) -> ChildProcessMonitor:
+        """Make a ChildProcessMonitor which monitors each child through its own pidfd
+
+        The epoller doesn't have to be waited on by `task`. Note that children monitored
+        this way can only be waited on for W.EXITED; see PidfdReaper.
+
+        """
+        return ChildProcessMonitor(PidfdReaper(ram, task, epoller), ram, task, use_clone_parent=False)
 
     def inherit_to_child(self, ram: RAM, child_task: Task) -> ChildProcessMonitor:
         """Create a new instance that will clone children from the passed-in task
@@ -230,15 +416,15 @@ class ChildProcessMonitor:
         thereby delegating responsibility for monitoring to the parent.
 
         """
-        if child_task.parent_task is not self.sigfd.afd.handle.task:
+        if child_task.parent_task is not self.reaper.task:
             raise Exception("task", child_task, "with parent_task", child_task.parent_task,
-                            "is not our child; we're", self.sigfd.afd.handle.task)
-        # 1. We know that child_task is a child process of self.sigfd.afd.handle.task.
+                            "is not our child; we're", self.reaper.task)
+        # 1. We know that child_task is a child process of self.reaper.task.
         # 2. That means if we use CLONE_PARENT in child_task, the resulting processes will also be
-        # child processes of self.sigfd.afd.handle.task.
-        # 3. Therefore self.sigfd will be notified if and when those future child processes have some state change.
-        # 4. Therefore we can use self.sigfd to create AsyncChildProcesses for those future child processes.
-        return ChildProcessMonitor(self.sigfd, ram, child_task, use_clone_parent=True)
+        # child processes of self.reaper.task.
+        # 3. Therefore self.reaper will be able to reap those future child processes.
+        # 4. Therefore we can use self.reaper to create AsyncChildProcesses for those future child processes.
+        return ChildProcessMonitor(self.reaper, ram, child_task, use_clone_parent=True)
 
     def add_child_process(self, process: ChildProcess) -> AsyncChildProcess:
         """Create an AsyncChildProcess which monitors the passed-in ChildProcess.
@@ -249,11 +435,10 @@ class ChildProcessMonitor:
         changes.
 
         """
-        if process.task is not self.sigfd.afd.handle.task:
+        if process.task is not self.reaper.task:
             raise Exception("process", process, "with parent task", process.task,
-                            "is not our child; we're", self.sigfd.afd.handle.task)
-        proc = AsyncChildProcess(process, self.ram, self.sigfd)
-        return proc
+                            "is not our child; we're", self.reaper.task)
+        return self.reaper.add(process)
 
     async def clone(self, flags: CLONE,
                     child_stack: t.Tuple[Pointer[Stack], WrittenPointer[Stack]],
@@ -266,5 +451,6 @@ class ChildProcessMonitor:
         """
         if self.use_clone_parent:
             flags |= CLONE.PARENT
-        process = await self.cloning_task.clone(flags|SIG.CHLD, child_stack, None, ctid, None)
-        return self.add_child_process(process)
+        with self.reaper.cloning():
+            process = await self.cloning_task.clone(flags|SIG.CHLD, child_stack, None, ctid, None)
+            return self.add_child_process(process)
@@ -48,6 +48,7 @@ from rsyscall.sys.prctl import PR
 from rsyscall.sys.socket import SHUT
 from rsyscall.sys.uio import RWF
 from rsyscall.sched import CLONE
+from rsyscall.unistd import CLOSE_RANGE
 from rsyscall.signal import HowSIG, SIG
 
 #### Syscalls (instructions)
@@ -91,6 +92,9 @@ async def clone(sysif: SyscallInterface, flags: int, child_stack: Address,
 async def close(sysif: SyscallInterface, fd: FileDescriptor) -> None:
     await sysif.syscall(SYS.close, fd)
 
+async def close_range(sysif: SyscallInterface, first: int, last: int, flags: CLOSE_RANGE) -> None:
+    await sysif.syscall(SYS.close_range, first, last, flags)
+
 async def connect(sysif: SyscallInterface, sockfd: FileDescriptor, addr: Address, addrlen: int) -> None:
     await sysif.syscall(SYS.connect, sockfd, addr, addrlen)
 
@@ -151,6 +155,22 @@ async def fcntl(sysif: SyscallInterface, fd: FileDescriptor, cmd: F, arg: t.Opti
 async def ftruncate(sysif: SyscallInterface, fd: FileDescriptor, length: int) -> None:
     await sysif.syscall(SYS.ftruncate, fd, length)
 
+async def futex(sysif: SyscallInterface, uaddr: Address, futex_op: int, val: int,
+                timeout: t.Optional[Address], uaddr2: t.Optional[Address], val3: int) -> int:
+    if timeout is None:
+        timeout = 0 # type: ignore
+    if uaddr2 is None:
+        uaddr2 = 0 # type: ignore
+    return (await sysif.syscall(SYS.futex, uaddr, futex_op, val, timeout, uaddr2, val3))
+
+async def futex_waitv(sysif: SyscallInterface, waiters: t.Optional[Address], nr_futexes: int, flags: int,
+                      timeout: t.Optional[Address], clockid: int) -> int:
+    if waiters is None:
+        waiters = 0 # type: ignore
+    if timeout is None:
+        timeout = 0 # type: ignore
+    return (await sysif.syscall(SYS.futex_waitv, waiters, nr_futexes, flags, timeout, clockid))
+
 async def getdents64(sysif: SyscallInterface, fd: FileDescriptor, dirp: Address, count: int) -> int:
     return (await sysif.syscall(SYS.getdents64, fd, dirp, count))
 
@@ -250,6 +270,9 @@ async def openat(sysif: SyscallInterface, dirfd: t.Optional[FileDescriptor],
         dirfd = AT.FDCWD # type: ignore
     return FileDescriptor(await sysif.syscall(SYS.openat, dirfd, path, flags, mode))
 
+async def pidfd_open(sysif: SyscallInterface, pid: Process, flags: int) -> FileDescriptor:
+    return FileDescriptor(await sysif.syscall(SYS.pidfd_open, pid, flags))
+
 async def pipe2(sysif: SyscallInterface, pipefd: Address, flags: int) -> None:
     await sysif.syscall(SYS.pipe2, pipefd, flags)
 
@@ -269,6 +292,16 @@ async def pread(sysif: SyscallInterface, fd: FileDescriptor, buf: Address, count
 async def preadv2(sysif: SyscallInterface, fd: FileDescriptor, iov: Address, iovcnt: int, offset: int, flags: RWF) -> int:
     return (await sysif.syscall(SYS.preadv2, fd, iov, iovcnt, offset, flags))
 
+async def process_vm_readv(sysif: SyscallInterface, pid: Process,
+                           local_iov: Address, liovcnt: int,
+                           remote_iov: Address, riovcnt: int, flags: int) -> int:
+    return (await sysif.syscall(SYS.process_vm_readv, pid, local_iov, liovcnt, remote_iov, riovcnt, flags))
+
+async def process_vm_writev(sysif: SyscallInterface, pid: Process,
+                            local_iov: Address, liovcnt: int,
+                            remote_iov: Address, riovcnt: int, flags: int) -> int:
+    return (await sysif.syscall(SYS.process_vm_writev, pid, local_iov, liovcnt, remote_iov, riovcnt, flags))
+
 async def pwritev2(sysif: SyscallInterface, fd: FileDescriptor, iov: Address, iovcnt: int, offset: int, flags: RWF) -> int:
     return (await sysif.syscall(SYS.pwritev2, fd, iov, iovcnt, offset, flags))
 
@@ -365,12 +398,14 @@ async def unshare(sysif: SyscallInterface, flags: CLONE) -> None:
     await sysif.syscall(SYS.unshare, flags)
 
 async def waitid(sysif: SyscallInterface,
-                 id: t.Union[Process, ProcessGroup, None], infop: t.Optional[Address], options: int,
+                 id: t.Union[Process, ProcessGroup, FileDescriptor, None], infop: t.Optional[Address], options: int,
                  rusage: t.Optional[Address]) -> int:
     if isinstance(id, Process):
         idtype = IdType.PID
     elif isinstance(id, ProcessGroup):
         idtype = IdType.PGID
+    elif isinstance(id, FileDescriptor):
+        idtype = IdType.PIDFD
     elif id is None:
         idtype = IdType.ALL
         id = 0 # type: ignore
@@ -15,20 +15,54 @@ SyscallInterface.
 
 """
 from __future__ import annotations
+from dataclasses import dataclass
+import errno
 import logging
+import os
+import time
 import trio
 import abc
 from rsyscall.sys.syscall import SYS
+import rsyscall.trace as trace
 import typing as t
 if t.TYPE_CHECKING:
     import rsyscall.handle as handle
+    from rsyscall.metrics import SyscallMetrics
 
 __all__ = [
     "SyscallInterface",
     "SyscallResponse",
     "SyscallHangup",
+    "ChainResult",
+    "CHAIN_MAX",
 ]
 
+CHAIN_MAX = 16
+"How many results at the start of a chain can be referred to by ChainResult; matches RSYSCALL_CHAIN_MAX in the server"
+
+@dataclass(frozen=True)
+class ChainResult:
+    """A syscall argument which stands for the result of an earlier syscall in the same chain
+
+    `index` counts from the start of the chain, so ChainResult(0) is the result of the first
+    syscall; it must be earlier than the syscall it's passed to. See SyscallInterface.syscall_chain.
+
+    """
+    index: int
+
+def check_chain(calls: t.Sequence[t.Tuple[t.Any, ...]]) -> None:
+    "Throw if this isn't a valid chain to pass to SyscallInterface.syscall_chain"
+    for i, (number, *args) in enumerate(calls):
+        if len(args) > 6:
+            raise ValueError("syscall has more than six arguments", number, args)
+        for arg in args:
+            if isinstance(arg, ChainResult) and not (0 <= arg.index < i):
+                raise ValueError("syscall argument refers to a result which isn't earlier in the chain",
+                                 i, number, arg)
+            if isinstance(arg, ChainResult) and arg.index >= CHAIN_MAX:
+                raise ValueError("syscall argument refers to a result past the ones the server keeps",
+                                 i, number, arg, CHAIN_MAX)
+
 class SyscallInterface:
     """The lowest-level interface for an object which lets us send syscalls to some process.
 
@@ -82,17 +116,115 @@ class SyscallInterface:
         to stop a deadlock.
 
         """
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        tracer = trace.tracer
+        if tracer is not None:
+            trace_start = tracer.now()
         response = await self.submit_syscall(number, arg1, arg2, arg3, arg4, arg5, arg6)
         try:
             with trio.CancelScope(shield=True):
                 result = await response.receive()
         except Exception as exn:
             self.logger.debug("%s -> %s", number, exn)
+            if metrics is not None:
+                metrics.record(number, time.perf_counter() - start, True)
+            if tracer is not None:
+                self._trace(tracer, trace_start, number, [arg1, arg2, arg3, arg4, arg5, arg6], exn)
             raise
         else:
             self.logger.debug("%s -> %s", number, result)
+            if metrics is not None:
+                metrics.record(number, time.perf_counter() - start, False)
+            if tracer is not None:
+                self._trace(tracer, trace_start, number, [arg1, arg2, arg3, arg4, arg5, arg6], result)
             return result
 
+    def _trace(self, tracer: trace.Tracer, start: float, number: SYS,
+               args: t.List[t.Any], result: t.Union[int, Exception]) -> None:
+        "Record a span for a syscall which was submitted at `start`"
+        if self.pid is not None:
+            tracer.name_process(self.pid, self.logger.name)
+        tracer.complete(getattr(number, "name", str(number)), "syscall", start, self.pid,
+                        {"args": [str(arg) for arg in args], "result": str(result)})
+
+    async def syscall_chain(self, calls: t.Sequence[t.Tuple[t.Any, ...]]) -> t.List[t.Union[int, Exception]]:
+        """Send a chain of syscalls, each performed only if all the ones before it succeeded
+
+        Each call is a tuple of a syscall number and up to six arguments. An argument may
+        be a ChainResult, which is replaced by the result of an earlier syscall in the
+        chain; for example, a chain can open a file, then pass the resulting fd to read and
+        close. A chain can be any length, but only the first CHAIN_MAX results can be
+        referred to.
+
+        We return one entry for each call: Its result, or the exception that receiving its
+        response threw. Once a syscall fails, the rest of the chain isn't performed, and
+        their entries are OSError(ECANCELED).
+
+        Like `syscall`, we shield against cancellation while waiting for the responses.
+
+        This implementation makes the syscalls one by one, and so is suitable for syscall
+        interfaces which have no latency to speak of; syscall interfaces which talk to an
+        rsyscall server override it to send the whole chain to the server at once.
+
+        """
+        check_chain(calls)
+        results: t.List[t.Union[int, Exception]] = []
+        with trio.CancelScope(shield=True):
+            for number, *args in calls:
+                if any(isinstance(result, Exception) for result in results):
+                    results.append(OSError(errno.ECANCELED, os.strerror(errno.ECANCELED)))
+                    continue
+                args = [results[arg.index] if isinstance(arg, ChainResult) else arg for arg in args]
+                try:
+                    results.append(await self.syscall(number, *args))
+                except Exception as exn:
+                    results.append(exn)
+        return results
+
+    async def syscall_batch(self, calls: t.Sequence[t.Tuple[t.Any, ...]]) -> t.List[t.Union[int, Exception]]:
+        """Send some independent syscalls all at once, then collect their responses
+
+        Each call is a tuple of a syscall number and up to six arguments. Unlike in a
+        chain, each syscall is performed whether or not the others fail, so a batch is for
+        syscalls which don't depend on each other, such as closing many fds.
+
+        We return one entry for each call: Its result, or the exception that submitting it
+        or receiving its response threw.
+
+        Like `syscall`, we shield against cancellation while waiting for the responses.
+
+        This implementation submits each syscall with `submit_syscall`, and only then
+        waits for the responses; syscall interfaces which talk to an rsyscall server
+        override it to send the whole batch to the server at once.
+
+        """
+        for number, *args in calls:
+            if len(args) > 6:
+                raise ValueError("syscall has more than six arguments", number, args)
+        responses: t.List[t.Union[SyscallResponse, Exception]] = []
+        results: t.List[t.Union[int, Exception]] = []
+        with trio.CancelScope(shield=True):
+            for number, *args in calls:
+                try:
+                    responses.append(await self.submit_syscall(number, *args))
+                except Exception as exn:
+                    responses.append(exn)
+            for (number, *_), response in zip(calls, responses):
+                if isinstance(response, Exception):
+                    results.append(response)
+                    continue
+                try:
+                    result = await response.receive()
+                except Exception as exn:
+                    self.logger.debug("%s -> %s", number, exn)
+                    results.append(exn)
+                else:
+                    self.logger.debug("%s -> %s", number, result)
+                    results.append(result)
+        return results
+
     @abc.abstractmethod
     async def submit_syscall(self, number, arg1=0, arg2=0, arg3=0, arg4=0, arg5=0, arg6=0) -> SyscallResponse:
         """Submit a syscall without immediately waiting for its response to come back.
@@ -121,6 +253,12 @@ class SyscallInterface:
 
     # non-syscall operations which we haven't figured out how to get rid of yet
     logger: logging.Logger
+    metrics: t.Optional[SyscallMetrics] = None
+    "If not None, we record each syscall we make here; see rsyscall.metrics"
+    pid: t.Optional[int] = None
+    "The pid of the process making our syscalls, if we know it; used only to label traces"
+    have_close_range: bool = True
+    "Cleared once close_range fails with ENOSYS through this interface; see rsyscall.handle.close_fds"
 
     @abc.abstractmethod
     async def close_interface(self) -> None:
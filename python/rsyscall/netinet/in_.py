@@ -1,6 +1,6 @@
 "#include <netinet/in.h>"
-from rsyscall._raw import ffi, lib # type: ignore
 from rsyscall.sys.socket import Address, AF, _register_sockaddr
+from rsyscall.struct import codec
 import ipaddress
 import socket
 import typing as t
@@ -11,6 +11,9 @@ __all__ = [
     'SockaddrIn6',
 ]
 
+_sockaddr_in = codec('struct sockaddr_in')
+_sockaddr_in6 = codec('struct sockaddr_in6')
+
 class SockaddrIn(Address):
     "Representation of struct sockaddr_in"
     family = AF.INET
@@ -20,21 +23,20 @@ class SockaddrIn(Address):
         self.addr = ipaddress.IPv4Address(addr)
 
     def to_bytes(self) -> bytes:
-        addr = ffi.new('struct sockaddr_in*', (AF.INET, socket.htons(self.port), (socket.htonl(int(self.addr)),)))
-        return ffi.buffer(addr)
+        return _sockaddr_in.pack(AF.INET, socket.htons(self.port), socket.htonl(int(self.addr)))
 
     T = t.TypeVar('T', bound='SockaddrIn')
     @classmethod
     def from_bytes(cls: t.Type[T], data: bytes) -> T:
         if len(data) < cls.sizeof():
             raise Exception("data too small", data)
-        struct = ffi.cast('struct sockaddr_in*', ffi.from_buffer(data))
-        cls.check_family(AF(struct.sin_family))
-        return cls(socket.ntohs(struct.sin_port), socket.ntohl(struct.sin_addr.s_addr))
+        family, port, addr = _sockaddr_in.unpack_from(data)
+        cls.check_family(AF(family))
+        return cls(socket.ntohs(port), socket.ntohl(addr))
 
     @classmethod
     def sizeof(cls) -> int:
-        return ffi.sizeof('struct sockaddr_in')
+        return _sockaddr_in.size
 
     def addr_as_string(self) -> str:
         "Returns the addr portion of this address in 127.0.0.1 form"
@@ -57,24 +59,21 @@ class SockaddrIn6(Address):
         self.scope_id = scope_id
 
     def to_bytes(self) -> bytes:
-        struct = ffi.new('struct sockaddr_in6*',
-                         (AF.INET6, socket.htons(self.port), self.flowinfo, (b'',), self.scope_id))
-        struct.sin6_addr.s6_addr = self.addr.packed
-        return bytes(ffi.buffer(struct))
+        return _sockaddr_in6.pack(AF.INET6, socket.htons(self.port), self.flowinfo,
+                                  self.addr.packed, self.scope_id)
 
     T = t.TypeVar('T', bound='SockaddrIn6')
     @classmethod
     def from_bytes(cls: t.Type[T], data: bytes) -> T:
         if len(data) < cls.sizeof():
             raise Exception("data too small", data)
-        struct = ffi.cast('struct sockaddr_in6*', ffi.from_buffer(data))
-        cls.check_family(AF(struct.sin6_family))
-        return cls(socket.ntohs(struct.sin6_port), ipaddress.IPv6Address(bytes(struct.sin6_addr.s6_addr)),
-                   struct.sin6_flowinfo, struct.sin6_scope_id)
+        family, port, flowinfo, addr, scope_id = _sockaddr_in6.unpack_from(data)
+        cls.check_family(AF(family))
+        return cls(socket.ntohs(port), ipaddress.IPv6Address(addr), flowinfo, scope_id)
 
     @classmethod
     def sizeof(cls) -> int:
-        return ffi.sizeof('struct sockaddr_in6')
+        return _sockaddr_in6.size
 
     def __str__(self) -> str:
         return f"SockaddrIn6({self.addr}:{self.port})"
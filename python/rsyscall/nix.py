@@ -228,7 +228,7 @@ class Store:
         try:
             await self.thread.task.access(ptr, OK.R)
         except (PermissionError, FileNotFoundError):
-            await nix_deploy(local_store, self, store_path)
+            await nix_deploy(_get_local_store(), self, store_path)
             return await self._create_root(store_path, ptr)
         else:
             return await self._create_root(store_path, ptr)
@@ -239,17 +239,35 @@ class Store:
         return Command(path/"bin"/name, [name], {})
 
 nix = StorePath._load_without_registering("nix")
-local_store = Store(local.thread, nix)
-
 _imported_store_paths: t.Dict[str, StorePath] = {"nix": nix}
+_local_store: t.Optional[Store] = None
+
+def _get_local_store() -> Store:
+    "Return the local store, creating it, and so the local thread, on first use"
+    global _local_store
+    if _local_store is None:
+        _local_store = Store(local.thread, nix)
+        # the local store has a root for every StorePath; that's where the
+        # paths actually originally are.
+        for store_path in _imported_store_paths.values():
+            _local_store._add_root(store_path, store_path.path)
+    return _local_store
+
+local_store: Store
+"The Store which the local thread uses, created on first access"
+
+def __getattr__(name: str) -> t.Any:
+    if name == "local_store":
+        return _get_local_store()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 def import_nix_dep(name: str) -> StorePath:
     "Import the Nixdep with this name, returning it as a StorePath"
     if name in _imported_store_paths:
         return _imported_store_paths[name]
     store_path = StorePath._load_without_registering(name)
-    # the local store has a root for every StorePath; that's where the
-    # paths actually originally are.
-    local_store._add_root(store_path, store_path.path)
+    if _local_store is not None:
+        _local_store._add_root(store_path, store_path.path)
     _imported_store_paths[name] = store_path
     return store_path
 
@@ -2,7 +2,7 @@
 from __future__ import annotations
 import typing as t
 from rsyscall._raw import ffi, lib # type: ignore
-from rsyscall.struct import Struct, bits
+from rsyscall.struct import Struct, bits, codec
 from dataclasses import dataclass, field
 import enum
 import contextlib
@@ -84,6 +84,8 @@ class Sighandler(enum.IntEnum):
     IGN = signal.Handlers.SIG_IGN
     DFL = signal.Handlers.SIG_DFL
 
+_siginfo = codec('struct siginfo')
+
 @dataclass
 class Siginfo(Struct):
     "struct siginfo, returned by many syscalls"
@@ -93,27 +95,17 @@ class Siginfo(Struct):
     status: int
 
     def to_bytes(self) -> bytes:
-        struct = ffi.new('struct siginfo*')
-        struct.si_code = self.code
-        struct.si_pid = self.pid
-        struct.si_uid = self.uid
-        struct.si_status = self.status
-        return bytes(ffi.buffer(struct))
+        return _siginfo.pack(0, self.code, self.pid, self.uid, self.status)
 
     T = t.TypeVar('T', bound='Siginfo')
     @classmethod
     def from_bytes(cls: t.Type[T], data: bytes) -> T:
-        struct = ffi.cast('struct siginfo const*', ffi.from_buffer(data))
-        return cls(
-            code=struct.si_code,
-            pid=struct.si_pid,
-            uid=struct.si_uid,
-            status=struct.si_status,
-        )
+        signo, code, pid, uid, status = _siginfo.unpack_from(data)
+        return cls(code=code, pid=pid, uid=uid, status=status)
 
     @classmethod
     def sizeof(cls) -> int:
-        return ffi.sizeof('struct siginfo')
+        return _siginfo.size
 
 class Sigset(t.Set[SIG], Struct):
     """A fixed-size 64-signal struct sigset
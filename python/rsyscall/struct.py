@@ -1,6 +1,8 @@
 "Interfaces and basic functionality for our serialization framework."
 from __future__ import annotations
+from rsyscall._raw import ffi # type: ignore
 import abc
+import functools
 import typing as t
 import struct
 from dataclasses import dataclass
@@ -103,23 +105,127 @@ def bits(n: int, one_indexed: bool=True) -> t.Iterator[int]:
         yield (b.bit_length() - (0 if one_indexed else 1))
         n ^= b
 
+#### Codecs ####
+_BYTE_TYPES = {'char', 'signed char', 'unsigned char', 'int8_t', 'uint8_t'}
+_INTEGER_FORMATS = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+
+def _primitive_format(ctype: t.Any) -> str:
+    if ctype.cname == 'char':
+        return 'c'
+    elif ctype.cname == '_Bool':
+        return '?'
+    elif ctype.cname == 'float':
+        return 'f'
+    elif ctype.cname == 'double':
+        return 'd'
+    size = ffi.sizeof(ctype)
+    if size not in _INTEGER_FORMATS:
+        raise TypeError("can't make a codec for primitive type", ctype.cname)
+    fmt = _INTEGER_FORMATS[size]
+    return fmt if int(ffi.cast(ctype, -1)) < 0 else fmt.upper()
+
+def _fields(ctype: t.Any, name: str, offset: int) -> t.Iterator[t.Tuple[int, str, str]]:
+    "Yield the offset, struct format, and name of each field that we pack for this cffi type"
+    if ctype.kind == 'primitive':
+        yield offset, _primitive_format(ctype), name
+    elif ctype.kind in ('pointer', 'function'):
+        # we don't deal in C pointers, only in addresses
+        yield offset, _INTEGER_FORMATS[ffi.sizeof(ctype)].upper(), name
+    elif ctype.kind == 'enum':
+        yield offset, _INTEGER_FORMATS[ffi.sizeof(ctype)], name
+    elif ctype.kind == 'array':
+        if ctype.length is None:
+            # a flexible array member isn't part of the fixed-size struct
+            return
+        if ctype.item.kind == 'primitive' and ctype.item.cname in _BYTE_TYPES:
+            yield offset, f'{ctype.length}s', name
+        else:
+            item_size = ffi.sizeof(ctype.item)
+            for i in range(ctype.length):
+                yield from _fields(ctype.item, f'{name}[{i}]', offset + i*item_size)
+    elif ctype.kind == 'struct':
+        for field_name, field in ctype.fields:
+            if field.bitsize != -1:
+                raise TypeError("can't make a codec for a struct with bitfields", ctype.cname)
+            yield from _fields(field.type, f'{name}.{field_name}' if name else field_name,
+                               offset + field.offset)
+    elif ctype.kind == 'union':
+        # we can only pack one member of a union; use the first which covers all of it
+        for field_name, field in ctype.fields:
+            if ffi.sizeof(field.type) == ffi.sizeof(ctype):
+                yield from _fields(field.type, f'{name}.{field_name}' if name else field_name, offset)
+                return
+        raise TypeError("no member of this union covers the whole union", ctype.cname)
+    else:
+        raise TypeError("can't make a codec for this type", ctype.cname)
+
+class Codec:
+    """A precompiled struct.Struct with the same layout as some fixed-size C type
+
+    The format is derived from the type's layout as declared in ffibuilder.py: one value
+    per primitive field, in order, with explicit padding for any gaps between them,
+    including the padding for fields which the cdef leaves out with `...`. Nested structs
+    and arrays are flattened, and arrays of bytes are packed as a single bytes value.
+    `names` holds the C name of each value, such as "args[0]" or "sin_addr.s_addr".
+
+    This is much cheaper than creating a cffi object for each value we serialize, and
+    with `pack_into` and `unpack_from`, we can work directly on a caller-provided buffer.
+
+    """
+    def __init__(self, ctype: str) -> None:
+        self.ctype = ctype
+        cffi_type = ffi.typeof(ctype)
+        fmt = '='
+        position = 0
+        self.names: t.List[str] = []
+        for offset, field_format, name in _fields(cffi_type, '', 0):
+            if offset < position:
+                raise TypeError("overlapping fields in type", ctype, name)
+            if offset > position:
+                fmt += f'{offset - position}x'
+            fmt += field_format
+            position = offset + struct.calcsize('=' + field_format)
+            self.names.append(name)
+        self.size = ffi.sizeof(cffi_type)
+        if self.size > position:
+            fmt += f'{self.size - position}x'
+        self.struct = struct.Struct(fmt)
+        if self.struct.size != self.size:
+            raise TypeError("derived format", fmt, "doesn't match the size of", ctype, self.size)
+        self.format = fmt
+        self.pack = self.struct.pack
+        self.pack_into = self.struct.pack_into
+        self.unpack = self.struct.unpack
+        self.unpack_from = self.struct.unpack_from
+        self.iter_unpack = self.struct.iter_unpack
+
+    def __repr__(self) -> str:
+        return f"Codec({self.ctype!r}, format={self.format!r})"
+
+@functools.lru_cache(maxsize=None)
+def codec(ctype: str) -> Codec:
+    "Return the Codec for this C type, as named in ffibuilder.py; each is only derived once"
+    return Codec(ctype)
+
+_int32 = codec('int')
+
 # mypy is very upset with me for inheriting from int and overriding int's methods in an incompatible way
 class Int32(Struct, int): # type: ignore
     "A 32-bit integer, as used by many syscalls"
     def to_bytes(self) -> bytes: # type: ignore
-        return struct.pack('i', self)
+        return _int32.pack(self)
 
     T = t.TypeVar('T', bound='Int32')
     @classmethod
     def from_bytes(cls: t.Type[T], data: bytes) -> T: # type: ignore
         if len(data) < cls.sizeof():
             raise Exception("data too small", data)
-        val, = struct.unpack_from('i', data)
+        val, = _int32.unpack_from(data)
         return cls(val)
-        
+
     @classmethod
     def sizeof(cls) -> int:
-        return struct.calcsize('i')
+        return _int32.size
 
 @dataclass
 class StructList(t.Generic[T_fixed_size], HasSerializer):
@@ -140,9 +246,47 @@ class StructListSerializer(t.Generic[T_fixed_size], Serializer[StructList[T_fixe
         return b"".join(self.ser.to_bytes(ent) for ent in val.elems)
 
     def from_bytes(self, data: bytes) -> StructList[T_fixed_size]:
-        entries = []
-        while len(data) > 0:
-            ent = self.ser.from_bytes(data)
-            entries.append(ent)
-            data = data[self.cls.sizeof():]
+        size = self.cls.sizeof()
+        entries = [self.ser.from_bytes(data[i:i+size]) for i in range(0, len(data), size)]
         return StructList(self.cls, entries)
+
+#### Tests ####
+from unittest import TestCase
+class TestCodec(TestCase):
+    def test_matches_cffi(self) -> None:
+        "Packing with a Codec gives the same bytes as filling in the cffi struct"
+        syscall = codec('struct rsyscall_syscall')
+        self.assertEqual(syscall.names, ['sys'] + [f'args[{i}]' for i in range(6)])
+        self.assertEqual(syscall.pack(1, 2, 3, 4, 5, 6, -7), bytes(ffi.buffer(ffi.new(
+            'struct rsyscall_syscall*', {"sys": 1, "args": (2, 3, 4, 5, 6, -7)}))))
+        siginfo = codec('struct siginfo')
+        cffi_siginfo = ffi.new('struct siginfo*')
+        cffi_siginfo.si_code = 3
+        cffi_siginfo.si_pid = 1234
+        cffi_siginfo.si_uid = 2**32 - 1
+        cffi_siginfo.si_status = -1
+        self.assertEqual(siginfo.pack(0, 3, 1234, 2**32 - 1, -1), bytes(ffi.buffer(cffi_siginfo)))
+        self.assertEqual(siginfo.unpack(bytes(ffi.buffer(cffi_siginfo))), (0, 3, 1234, 2**32 - 1, -1))
+
+    def test_nested(self) -> None:
+        "Nested structs and unions are flattened, and byte arrays are packed as bytes"
+        in6 = codec('struct sockaddr_in6')
+        self.assertEqual(in6.names, ['sin6_family', 'sin6_port', 'sin6_flowinfo',
+                                     'sin6_addr.s6_addr', 'sin6_scope_id'])
+        self.assertEqual(codec('struct epoll_event').names, ['events', 'data.u64'])
+
+    def test_flexible_array(self) -> None:
+        "A flexible array member isn't part of the Codec"
+        self.assertEqual(codec('struct inotify_event').size, ffi.sizeof('struct inotify_event'))
+
+    def test_pack_into(self) -> None:
+        "Many records can be packed into and unpacked from one buffer"
+        fdpair = codec('struct fdpair')
+        buf = bytearray(10 * fdpair.size)
+        for i in range(10):
+            fdpair.pack_into(buf, i * fdpair.size, i, -i)
+        self.assertEqual(list(fdpair.iter_unpack(buf)), [(i, -i) for i in range(10)])
+        self.assertEqual(fdpair.unpack_from(buf, 3 * fdpair.size), (3, -3))
+
+    def test_cached(self) -> None:
+        self.assertIs(codec('struct fdpair'), codec('struct fdpair'))
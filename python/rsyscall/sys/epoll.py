@@ -1,6 +1,6 @@
 from __future__ import annotations
 from rsyscall._raw import lib, ffi # type: ignore
-from rsyscall.struct import Struct, Serializable
+from rsyscall.struct import Struct, Serializable, codec
 import enum
 import os
 import select
@@ -27,40 +27,35 @@ class EPOLL(enum.IntFlag):
     # options
     ET = select.EPOLLET
 
+# struct epoll_event is packed on x86_64: events, then data.u64
+_epoll_event = codec('struct epoll_event')
+
 @dataclass
 class EpollEvent(Struct):
     data: int
     events: EPOLL
 
     def to_bytes(self) -> bytes:
-        return bytes(ffi.buffer(ffi.new('struct epoll_event const*', (self.events, (self.data,)))))
+        return _epoll_event.pack(self.events, self.data)
 
     T = t.TypeVar('T', bound='EpollEvent')
     @classmethod
     def from_bytes(cls: t.Type[T], data: bytes) -> T:
-        struct = ffi.cast('struct epoll_event*', ffi.from_buffer(data))
-        return cls(struct.data.u64, EPOLL(struct.events))
+        events, u64 = _epoll_event.unpack_from(data)
+        return cls(u64, EPOLL(events))
 
     @classmethod
     def sizeof(cls) -> int:
-        return ffi.sizeof('struct epoll_event')
+        return _epoll_event.size
 
 class EpollEventList(t.List[EpollEvent], Serializable):
     def to_bytes(self) -> bytes:
-        ret = b""
-        for ent in self:
-            ret += ent.to_bytes()
-        return ret
+        return b"".join([_epoll_event.pack(ent.events, ent.data) for ent in self])
 
     T = t.TypeVar('T', bound='EpollEventList')
     @classmethod
     def from_bytes(cls: t.Type[T], data: bytes) -> T:
-        entries = []
-        while len(data) > 0:
-            ent = EpollEvent.from_bytes(data)
-            entries.append(ent)
-            data = data[EpollEvent.sizeof():]
-        return cls(entries)
+        return cls([EpollEvent(u64, EPOLL(events)) for events, u64 in _epoll_event.iter_unpack(data)])
 
 
 #### Tests ####
@@ -70,3 +65,9 @@ class TestEpoll(TestCase):
         initial = EpollEventList([EpollEvent(42, EPOLL.IN|EPOLL.PRI)])
         output = EpollEventList.from_bytes(initial.to_bytes())
         self.assertEqual(initial, output)
+
+    def test_epoll_event_list_many(self) -> None:
+        initial = EpollEventList([EpollEvent(i, EPOLL.IN) for i in range(100)])
+        data = initial.to_bytes()
+        self.assertEqual(len(data), 100 * EpollEvent.sizeof())
+        self.assertEqual(initial, EpollEventList.from_bytes(data))
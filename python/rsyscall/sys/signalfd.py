@@ -1,6 +1,6 @@
 import typing as t
 from rsyscall._raw import ffi, lib # type: ignore
-from rsyscall.struct import Struct
+from rsyscall.struct import Struct, codec
 from dataclasses import dataclass
 
 from rsyscall.signal import SIG
@@ -11,6 +11,8 @@ class SFD(enum.IntFlag):
     NONBLOCK = lib.SFD_NONBLOCK
     CLOEXEC = lib.SFD_CLOEXEC
 
+_signalfd_siginfo = codec('struct signalfd_siginfo')
+
 @dataclass
 class SignalfdSiginfo(Struct):
     # TODO fill in the rest of the data
@@ -18,18 +20,16 @@ class SignalfdSiginfo(Struct):
     signo: SIG
 
     def to_bytes(self) -> bytes:
-        struct = ffi.new('struct signalfd_siginfo*')
-        struct.ssi_signo = self.signo
-        return bytes(ffi.buffer(struct))
+        return _signalfd_siginfo.pack(self.signo, *[0]*(len(_signalfd_siginfo.names) - 1))
 
     T = t.TypeVar('T', bound='SignalfdSiginfo')
     @classmethod
     def from_bytes(cls: t.Type[T], data: bytes) -> T:
-        struct = ffi.cast('struct signalfd_siginfo const*', ffi.from_buffer(data))
+        signo, *_ = _signalfd_siginfo.unpack_from(data)
         return cls(
-            signo=SIG(struct.ssi_signo),
+            signo=SIG(signo),
         )
 
     @classmethod
     def sizeof(cls) -> int:
-        return ffi.sizeof('struct signalfd_siginfo')
+        return _signalfd_siginfo.size
@@ -16,6 +16,7 @@ class SYS(enum.IntEnum):
     chdir = lib.SYS_chdir
     clone = lib.SYS_clone
     close = lib.SYS_close
+    close_range = lib.SYS_close_range
     connect = lib.SYS_connect
     dup3 = lib.SYS_dup3
     epoll_create1 = lib.SYS_epoll_create1
@@ -28,6 +29,8 @@ class SYS(enum.IntEnum):
     fchmod = lib.SYS_fchmod
     fcntl = lib.SYS_fcntl
     ftruncate = lib.SYS_ftruncate
+    futex = lib.SYS_futex
+    futex_waitv = lib.SYS_futex_waitv
     getdents64 = lib.SYS_getdents64
     getgid = lib.SYS_getgid
     getpeername = lib.SYS_getpeername
@@ -49,9 +52,12 @@ class SYS(enum.IntEnum):
     mount = lib.SYS_mount
     munmap = lib.SYS_munmap
     openat = lib.SYS_openat
+    pidfd_open = lib.SYS_pidfd_open
     pipe2 = lib.SYS_pipe2
     prctl = lib.SYS_prctl
     pread64 = lib.SYS_pread64
+    process_vm_readv = lib.SYS_process_vm_readv
+    process_vm_writev = lib.SYS_process_vm_writev
     preadv2 = lib.SYS_preadv2
     pwritev2 = lib.SYS_pwritev2
     read = lib.SYS_read
@@ -2,7 +2,7 @@ from __future__ import annotations
 from rsyscall._raw import lib, ffi # type: ignore
 import enum
 import typing as t
-from rsyscall.struct import Serializable
+from rsyscall.struct import Serializable, codec
 if t.TYPE_CHECKING:
     from rsyscall.handle import Pointer, WrittenPointer
 else:
@@ -14,6 +14,11 @@ class RWF(enum.IntFlag):
     HIPRI = lib.RWF_HIPRI
     SYNC = lib.RWF_SYNC
 
+# the kernel rejects calls with more iovecs than this, with EINVAL
+IOV_MAX = 1024
+
+_iovec = codec('struct iovec')
+
 class IovecList(t.List[Pointer], Serializable):
     def split(self, n: int) -> t.Tuple[IovecList, IovecList]:
         first, middle, second = self.split_with_middle(n)
@@ -40,13 +45,7 @@ class IovecList(t.List[Pointer], Serializable):
         return IovecList(valid), middle, IovecList(invalid)
 
     def to_bytes(self) -> bytes:
-        ret = b""
-        for ptr in self:
-            ret += bytes(ffi.buffer(ffi.new('struct iovec const*', {
-                "iov_base": ffi.cast('void*', int(ptr.near)),
-                "iov_len": ptr.size(),
-            })))
-        return ret
+        return b"".join([_iovec.pack(int(ptr.near), ptr.size()) for ptr in self])
 
     T = t.TypeVar('T', bound='IovecList')
     @classmethod
@@ -1,7 +1,7 @@
 from __future__ import annotations
 import typing as t
-from rsyscall._raw import ffi, lib # type: ignore
 from rsyscall.sys.socket import AF, Address, _register_sockaddr
+from rsyscall.struct import codec
 from rsyscall.path import Path
 from dataclasses import dataclass
 import os
@@ -18,6 +18,9 @@ __all__ = [
 class PathTooLongError(ValueError):
     pass
 
+_sockaddr_un = codec('struct sockaddr_un')
+_sa_family = codec('sa_family_t')
+
 @dataclass
 class SockaddrUn(Address):
     path: bytes
@@ -44,11 +47,12 @@ class SockaddrUn(Address):
     T = t.TypeVar('T', bound='SockaddrUn')
     @classmethod
     def from_bytes(cls: t.Type[T], data: bytes) -> T:
-        header = ffi.sizeof('sa_family_t')
+        header = _sa_family.size
         if len(data) < header:
             raise Exception("data too smalllll", data)
-        struct = ffi.cast('struct sockaddr_un*', ffi.from_buffer(data))
-        cls.check_family(AF(struct.sun_family))
+        family, = _sa_family.unpack_from(data)
+        cls.check_family(AF(family))
+        path = data[header:_sockaddr_un.size]
         if len(data) == header:
             # unnamed socket, name is empty
             # fffffff FFFFFFFFFFF FUUUUUUUUUUUUUUUUUUUUUUUU
@@ -56,23 +60,23 @@ class SockaddrUn(Address):
             # okay so... is there a way to figure this out without looking at socklen
             # fuuuu
             length = 0
-        elif struct.sun_path[0] == b'\0':
+        elif path[0] == 0:
             # abstract socket, entire buffer is part of path
-            length = len(data) - header
+            length = len(path)
         else:
-            # TODO handle the case where there's no null terminator
-            # pathname socket, path is null-terminated
-            length = lib.strlen(struct.sun_path)
-        return cls(bytes(ffi.buffer(struct.sun_path, length)))
+            # pathname socket, path is null-terminated, unless it fills the whole buffer
+            length = path.find(b'\0')
+            if length < 0:
+                length = len(path)
+        return cls(path[:length])
 
     def to_bytes(self) -> bytes:
-        addr = ffi.new('struct sockaddr_un*', (AF.UNIX, self.path))
-        real_length = ffi.sizeof('sa_family_t') + len(self.path) + 1
-        return bytes(ffi.buffer(addr))[:real_length]
+        real_length = _sa_family.size + len(self.path) + 1
+        return _sockaddr_un.pack(AF.UNIX, self.path)[:real_length]
 
     @classmethod
     def sizeof(cls) -> int:
-        return ffi.sizeof('struct sockaddr_un')
+        return _sockaddr_un.size
 
     def __str__(self) -> str:
         return f"SockaddrUn({self.path})"
@@ -101,4 +105,14 @@ class TestUn(TestCase):
         from rsyscall.sys.socket import GenericSockaddr
         out = GenericSockaddr.from_bytes(initial.to_bytes()).parse()
         self.assertEqual(initial, output)
+
+    def test_abstract(self) -> None:
+        initial = SockaddrUn(b"\0abstract")
+        self.assertEqual(initial, SockaddrUn.from_bytes(initial.to_bytes()[:-1]))
+
+    def test_full_length(self) -> None:
+        "A path which fills the whole of sun_path has no null terminator"
+        initial = SockaddrUn(b"a" * 108)
+        self.assertEqual(len(initial.to_bytes()), SockaddrUn.sizeof())
+        self.assertEqual(initial, SockaddrUn.from_bytes(initial.to_bytes()))
         
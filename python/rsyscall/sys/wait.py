@@ -9,6 +9,7 @@ class IdType(enum.IntEnum):
     PID = lib.P_PID # Wait for the child whose process ID matches id.
     PGID = lib.P_PGID # Wait for any child whose process group ID matches id.
     ALL = lib.P_ALL # Wait for any child; id is ignored.
+    PIDFD = lib.P_PIDFD # Wait for the child referred to by the pidfd id.
 
 class CLD(enum.IntEnum):
     EXITED = lib.CLD_EXITED # child called _exit(2)
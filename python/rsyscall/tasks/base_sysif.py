@@ -1,10 +1,15 @@
 import abc
-from rsyscall.near.sysif import SyscallInterface, SyscallResponse
+import errno
+import trio
+from rsyscall._raw import lib # type: ignore
+from rsyscall.near.sysif import SyscallInterface, SyscallResponse, ChainResult, check_chain
 from rsyscall.tasks.connection import Syscall, SyscallConnection, ConnectionResponse
 from rsyscall.tasks.util import log_syscall, raise_if_error
 from rsyscall.handle import FileDescriptor
 from dataclasses import dataclass
 import logging
+import rsyscall.trace as trace
+import time
 import typing as t
 
 @dataclass
@@ -72,5 +77,84 @@ class BaseSyscallInterface(SyscallInterface):
             number,
             arg1=int(arg1), arg2=int(arg2), arg3=int(arg3),
             arg4=int(arg4), arg5=int(arg5), arg6=int(arg6)))
+        if self.metrics is not None:
+            self.metrics.record_depth(len(self.rsyscall_connection.pending_responses))
         response = BaseSyscallResponse(self._read_pending_responses, conn_response)
         return response
+
+    async def syscall_chain(self, calls: t.Sequence[t.Tuple[t.Any, ...]]) -> t.List[t.Union[int, Exception]]:
+        """Write the whole chain to the rsyscall server at once, then collect the responses
+
+        The server performs the chain itself, marking each request after the first with
+        RSYSCALL_CHAINED, and ChainResult arguments with RSYSCALL_ARG_RESULT; so the chain
+        takes a single round trip.
+
+        """
+        check_chain(calls)
+        syscalls: t.List[Syscall] = []
+        for i, (number, *args) in enumerate(calls):
+            args = [*args, *[0]*(6 - len(args))]
+            log_syscall(self.logger, number, *args)
+            flags = lib.RSYSCALL_CHAINED if i else 0
+            raw_args = [0]*6
+            for j, arg in enumerate(args):
+                if isinstance(arg, ChainResult):
+                    flags |= 1 << (lib.RSYSCALL_ARG_RESULT_SHIFT + j)
+                    raw_args[j] = arg.index
+                else:
+                    raw_args[j] = int(arg)
+            syscalls.append(Syscall(int(number) | flags, *raw_args))
+        return await self._send_requests(calls, syscalls, chained=True)
+
+    async def syscall_batch(self, calls: t.Sequence[t.Tuple[t.Any, ...]]) -> t.List[t.Union[int, Exception]]:
+        """Write the whole batch to the rsyscall server at once, then collect the responses
+
+        None of the requests are marked with RSYSCALL_CHAINED, so the server performs each
+        of them regardless of the others' results; the batch still takes a single round
+        trip.
+
+        """
+        syscalls: t.List[Syscall] = []
+        for number, *args in calls:
+            if len(args) > 6:
+                raise ValueError("syscall has more than six arguments", number, args)
+            args = [*args, *[0]*(6 - len(args))]
+            log_syscall(self.logger, number, *args)
+            syscalls.append(Syscall(int(number), *[int(arg) for arg in args]))
+        return await self._send_requests(calls, syscalls, chained=False)
+
+    async def _send_requests(self, calls: t.Sequence[t.Tuple[t.Any, ...]], syscalls: t.List[Syscall],
+                             chained: bool) -> t.List[t.Union[int, Exception]]:
+        "Write these requests back to back, then collect a result or exception for each"
+        metrics = self.metrics
+        if metrics is not None:
+            start = time.perf_counter()
+        tracer = trace.tracer
+        if tracer is not None:
+            trace_start = tracer.now()
+        conn_responses = await self.rsyscall_connection.write_requests(syscalls)
+        if metrics is not None:
+            metrics.record_depth(len(self.rsyscall_connection.pending_responses))
+        results: t.List[t.Union[int, Exception]] = []
+        with trio.CancelScope(shield=True):
+            for (number, *_), conn_response in zip(calls, conn_responses):
+                try:
+                    result = await BaseSyscallResponse(self._read_pending_responses, conn_response).receive()
+                except Exception as exn:
+                    self.logger.debug("%s -> %s", number, exn)
+                    results.append(exn)
+                    # a syscall which wasn't performed because an earlier one failed wasn't made at all
+                    if metrics is not None and not (chained and isinstance(exn, OSError) and exn.errno == errno.ECANCELED):
+                        metrics.record(number, time.perf_counter() - start, True)
+                else:
+                    self.logger.debug("%s -> %s", number, result)
+                    results.append(result)
+                    if metrics is not None:
+                        metrics.record(number, time.perf_counter() - start, False)
+        if tracer is not None:
+            if self.pid is not None:
+                tracer.name_process(self.pid, self.logger.name)
+            tracer.complete("chain" if chained else "batch", "syscall", trace_start, self.pid, {
+                "syscalls": [getattr(number, "name", str(number)) for number, *_ in calls],
+                "results": [str(result) for result in results]})
+        return results
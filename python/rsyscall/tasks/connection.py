@@ -8,19 +8,28 @@ Still, it's not completely trivial, because we do pipelining of syscall
 requests, and we also batch together multiple requests so they can be written
 out all at once.
 
+When the rsyscall server shares memory with us, we can instead pass requests
+and responses through a ring in shared memory, using the connection only to
+wake each other up; that's RingSyscallConnection.
+
 """
-from rsyscall._raw import ffi # type: ignore
+from rsyscall._raw import ffi, lib # type: ignore
 from dataclasses import dataclass
-from rsyscall.handle import Pointer, Task
+from rsyscall.handle import Pointer, Task, MemoryMapping
 from rsyscall.concurrency import OneAtATime
-from rsyscall.struct import T_fixed_size, Struct, Int32, StructList
+from rsyscall.struct import T_fixed_size, Struct, Codec, codec
 from rsyscall.epoller import AsyncFileDescriptor
 from rsyscall.near.sysif import SyscallHangup
+from rsyscall.sys.epoll import EPOLL
+from rsyscall.sys.syscall import SYS
+import errno
+import os
 import typing as t
 import trio
 
 __all__ = [
     "SyscallConnection",
+    "RingSyscallConnection",
     "ConnectionResponse",
     "Syscall",
 ]
@@ -29,6 +38,9 @@ class ConnectionError(Exception):
     "Something has gone wrong with the rsyscall connection"
     pass
 
+_syscall = codec('struct rsyscall_syscall')
+_response = codec('long')
+
 @dataclass
 class Syscall(Struct):
     "The struct representing a syscall request"
@@ -41,22 +53,21 @@ class Syscall(Struct):
     arg6: int
 
     def to_bytes(self) -> bytes:
-        return bytes(ffi.buffer(ffi.new('struct rsyscall_syscall const*', {
-            "sys": self.number,
-            "args": (self.arg1, self.arg2, self.arg3, self.arg4, self.arg5, self.arg6),
-        })))
+        return _syscall.pack(self.number, self.arg1, self.arg2, self.arg3, self.arg4, self.arg5, self.arg6)
+
+    def pack_into(self, buf: bytearray, offset: int) -> None:
+        "Serialize this request into `buf` at `offset`"
+        _syscall.pack_into(buf, offset,
+                           self.number, self.arg1, self.arg2, self.arg3, self.arg4, self.arg5, self.arg6)
 
     T = t.TypeVar('T', bound='Syscall')
     @classmethod
     def from_bytes(cls: t.Type[T], data: bytes) -> T:
-        struct = ffi.cast('struct rsyscall_syscall*', ffi.from_buffer(data))
-        return cls(struct.sys,
-                   struct.args[0], struct.args[1], struct.args[2],
-                   struct.args[3], struct.args[4], struct.args[5])
+        return cls(*_syscall.unpack_from(data))
 
     @classmethod
     def sizeof(cls) -> int:
-        return ffi.sizeof('struct rsyscall_syscall')
+        return _syscall.size
 
 @dataclass
 class SyscallResponse(Struct):
@@ -64,17 +75,17 @@ class SyscallResponse(Struct):
     value: int
 
     def to_bytes(self) -> bytes:
-        return bytes(ffi.buffer(ffi.new('long const*', self.value)))
+        return _response.pack(self.value)
 
     T = t.TypeVar('T', bound='SyscallResponse')
     @classmethod
     def from_bytes(cls: t.Type[T], data: bytes) -> T:
-        struct = ffi.cast('long*', ffi.from_buffer(data))
-        return cls(struct[0])
+        value, = _response.unpack_from(data)
+        return cls(value)
 
     @classmethod
     def sizeof(cls) -> int:
-        return ffi.sizeof('long')
+        return _response.size
 
 @dataclass
 class ConnectionResponse:
@@ -87,34 +98,58 @@ class ConnectionRequest:
     response: t.Optional[ConnectionResponse] = None
 
 class ReadBuffer:
-    "A simple buffer for deserializing structs"
+    """A simple buffer for deserializing structs
+
+    Like AsyncReadBuffer, we consume structs by advancing an offset into a bytearray,
+    and only discard the consumed prefix once it's more than half the bytearray.
+
+    """
     def __init__(self, task: Task) -> None:
         # To read and write structures, we have to know what task
         # they're coming from.
         self.task = task
-        self.buf = b""
+        self.buf = bytearray()
+        self.start = 0
 
     def feed_bytes(self, data: bytes) -> None:
         self.buf += data
 
+    def _consume(self, length: int) -> None:
+        self.start += length
+        if self.start*2 > len(self.buf):
+            del self.buf[:self.start]
+            self.start = 0
+
     def read_struct(self, cls: t.Type[T_fixed_size]) -> t.Optional[T_fixed_size]:
         "Read one fixed-size struct from the buffer, or return None if that's not possible"
         length = cls.sizeof()
-        if length <= len(self.buf):
-            section = self.buf[:length]
-            self.buf = self.buf[length:]
+        if length <= len(self.buf) - self.start:
+            with memoryview(self.buf) as view:
+                section = bytes(view[self.start:self.start+length])
+            self._consume(length)
             return cls.get_serializer(self.task).from_bytes(section)
         else:
             return None
 
     def read_all_structs(self, cls: t.Type[T_fixed_size]) -> t.List[T_fixed_size]:
         "Read as many fixed-size structs from the buffer as possible"
-        ret: t.List[T_fixed_size] = []
-        while True:
-            x = self.read_struct(cls)
-            if x is None:
-                return ret
-            ret.append(x)
+        length = cls.sizeof()
+        count = (len(self.buf) - self.start) // length
+        serializer = cls.get_serializer(self.task)
+        with memoryview(self.buf) as view:
+            ret = [serializer.from_bytes(bytes(view[offset:offset+length]))
+                   for offset in range(self.start, self.start + count*length, length)]
+        self._consume(count*length)
+        return ret
+
+    def unpack_all(self, codec: Codec) -> t.List[t.Tuple[t.Any, ...]]:
+        "Unpack as many fixed-size records as possible from the buffer with this Codec"
+        count = (len(self.buf) - self.start) // codec.size
+        end = self.start + count*codec.size
+        with memoryview(self.buf) as view, view[self.start:end] as records:
+            ret = list(codec.iter_unpack(records))
+        self._consume(count*codec.size)
+        return ret
 
 class SyscallConnection:
     "A connection to some rsyscall server where we can make syscalls"
@@ -125,9 +160,12 @@ class SyscallConnection:
         self.tofd = tofd
         self.fromfd = fromfd
         self.buffer = ReadBuffer(self.fromfd.handle.task)
-        self.valid: t.Optional[Pointer[bytes]] = None
+        self.read_buf: t.Optional[Pointer[bytes]] = None
+        self.valid: t.Optional[t.Tuple[Pointer[bytes], Pointer[bytes]]] = None
         self.sending_requests = OneAtATime()
         self.pending_requests: t.List[ConnectionRequest] = []
+        # reused for serializing each batch of requests; grows to fit the largest batch
+        self.write_buf = bytearray()
         self.reading_responses = OneAtATime()
         self.pending_responses: t.List[ConnectionResponse] = []
 
@@ -149,15 +187,24 @@ class SyscallConnection:
         the connection until that happens.
 
         """
-        request = ConnectionRequest(syscall)
-        self.pending_requests.append(request)
+        [response] = await self.write_requests([syscall])
+        return response
+
+    async def write_requests(self, syscalls: t.List[Syscall]) -> t.List[ConnectionResponse]:
+        """Write some syscall requests back to back, returning a ConnectionResponse for each
+
+        No other requests are written in between these, so they can form a chain.
+
+        """
+        requests = [ConnectionRequest(syscall) for syscall in syscalls]
+        self.pending_requests.extend(requests)
         # TODO as a hack, so we don't have to figure it out now, we don't allow
         # a syscall request to be cancelled before it's actually made. we could
         # make this work later, and that would reduce some blocking from waitid
         with trio.CancelScope(shield=True):
-            while request.response is None:
+            while any(request.response is None for request in requests):
                 await self._write_pending_requests()
-        return request.response
+        return [t.cast(ConnectionResponse, request.response) for request in requests]
 
     async def read_pending_responses(self) -> None:
         "Process some syscall responses, setting their values on the appropriate ConnectionResponse"
@@ -166,29 +213,35 @@ class SyscallConnection:
                 await self._read_pending_responses_direct()
 
     async def _read_pending_responses_direct(self) -> None:
-        vals = self.buffer.read_all_structs(SyscallResponse)
+        vals = self._unpack_responses()
         if vals:
             self._got_responses(vals)
             return
-        buf = await self.fromfd.ram.malloc(bytes, 1024)
         while not vals:
             if self.valid is None:
+                # if we're cancelled while reading, read_buf stays None, and we'll allocate a new one next time
+                buf = self.read_buf or await self.fromfd.ram.malloc(bytes, 1024)
+                self.read_buf = None
                 valid, rest = await self.fromfd.read(buf)
                 if valid.size() == 0:
                     raise SyscallHangup()
-                self.valid = valid
-            data = await self.valid.read()
+                self.valid = valid, rest
+            valid, rest = self.valid
+            data = await valid.read()
             self.valid = None
+            self.read_buf = valid.merge(rest)
             self.buffer.feed_bytes(data)
-            buf = valid.merge(rest)
-            vals = self.buffer.read_all_structs(SyscallResponse)
+            vals = self._unpack_responses()
         self._got_responses(vals)
 
-    def _got_responses(self, vals: t.List[SyscallResponse]) -> None:
+    def _unpack_responses(self) -> t.List[int]:
+        return [value for value, in self.buffer.unpack_all(_response)]
+
+    def _got_responses(self, vals: t.List[int]) -> None:
         responses = self.pending_responses[:len(vals)]
         self.pending_responses = self.pending_responses[len(vals):]
         for response, val in zip(responses, vals):
-            response.result = val.value
+            response.result = val
 
     async def _write_pending_requests(self) -> None:
         "Batch together all pending requests and write them out"
@@ -199,9 +252,15 @@ class SyscallConnection:
     async def _write_pending_requests_direct(self) -> None:
         requests = self.pending_requests
         self.pending_requests = []
-        syscalls = StructList(Syscall, [request.syscall for request in requests])
+        length = len(requests) * _syscall.size
+        if len(self.write_buf) < length:
+            self.write_buf = bytearray(length)
+        for i, request in enumerate(requests):
+            request.syscall.pack_into(self.write_buf, i * _syscall.size)
+        with memoryview(self.write_buf) as view:
+            data = bytes(view[:length])
         try:
-            ptr = await self.tofd.ram.ptr(syscalls)
+            ptr = await self.tofd.ram.ptr(data)
             # TODO should mark the requests complete incrementally as we write them out,
             # instead of only once all requests have been written out
             to_write: Pointer = ptr
@@ -218,3 +277,159 @@ class SyscallConnection:
         for request, response in zip(requests, responses):
             request.response = response
         self.pending_responses += responses
+
+class RingSyscallConnection(SyscallConnection):
+    """A SyscallConnection which passes requests and responses through shared memory
+
+    The requests and responses live in a `struct rsyscall_ring`, which the
+    rsyscall server (running rsyscall_ring_server) shares with us. Both sides
+    spin for a while before going to sleep: The server sleeps on a futex, which
+    we wake when we submit a request, and we sleep waiting for a doorbell byte
+    on fromfd, which the server writes when it completes a request. So in the
+    common case, a syscall makes no syscalls on our side at all.
+
+    We operate on the ring by calling directly into librsyscall, so the ring
+    must be mapped in our own address space, and tofd must be in our own fd
+    table. Once the server has left our address space, by exiting or calling
+    exec, the owner of this connection calls unmap_ring.
+
+    Our busy-wait runs on the trio thread, so we only spin when no other trio
+    task is waiting to run, and we adapt how long we spin: each time spinning
+    fails to find a response we halve the budget, and each time a response
+    arrives we double it, up to `spins`.
+
+    """
+    spins = 2000
+    "How long each side busy-waits for the other before going to sleep"
+
+    def __init__(self,
+                 tofd: AsyncFileDescriptor,
+                 fromfd: AsyncFileDescriptor,
+                 ring: MemoryMapping,
+    ) -> None:
+        super().__init__(tofd, fromfd)
+        self.ring_mapping: t.Optional[MemoryMapping] = ring
+        self.ring = ffi.cast('struct rsyscall_ring*', int(ring.near.address))
+        if len(os.sched_getaffinity(0)) < 2:
+            # with only one CPU, spinning just keeps the other side from running
+            self.spins = 0
+        self.ring.spins = self.spins
+        self.spin_budget = self.spins
+        self.request_buf = ffi.new('struct rsyscall_syscall*')
+        self.response_buf = ffi.new('int64_t[]', lib.RSYSCALL_RING_SIZE)
+        self.doorbell_buf: t.Optional[Pointer[bytes]] = None
+        # set while a batch too long to fit in the ring is being submitted
+        self.writing_chain: t.Optional[trio.Event] = None
+
+    async def close(self) -> None:
+        await super().close()
+        if self.ring_mapping is not None:
+            # the server will notice the hangup when it wakes up
+            lib.rsyscall_ring_wake(self.ring)
+
+    def unmap_ring(self) -> None:
+        """Unmap the ring, now that the server has left our address space
+
+        After this, requests fail with SyscallHangup instead of touching the ring.
+
+        """
+        if self.ring_mapping is not None:
+            mapping, self.ring_mapping = self.ring_mapping, None
+            lib.rsyscall_raw_syscall(int(mapping.near.address), mapping.near.length, 0, 0, 0, 0, SYS.munmap)
+
+    async def detach_ring(self) -> SyscallConnection:
+        """Stop using the ring, and return a plain SyscallConnection over the same fds
+
+        This is for when the server has called exec; the ring is in its old
+        address space, and the new server will speak the rsyscall protocol over
+        the connection itself. Any doorbells the old server sent are already
+        waiting on fromfd, so we discard them.
+
+        """
+        self.unmap_ring()
+        buf = self.doorbell_buf or await self.fromfd.ram.malloc(bytes, 64)
+        self.doorbell_buf = None
+        while True:
+            try:
+                valid, rest = await self.fromfd.handle.read(buf)
+            except OSError as e:
+                if e.errno == errno.EAGAIN:
+                    self.fromfd.status.negedge(EPOLL.IN)
+                    break
+                raise
+            if valid.size() == 0:
+                break
+            buf = valid.merge(rest)
+        connection = SyscallConnection(self.tofd, self.fromfd)
+        connection.pending_responses = self.pending_responses
+        return connection
+
+    async def write_request(self, syscall: Syscall) -> ConnectionResponse:
+        while self.writing_chain is not None:
+            await self.writing_chain.wait()
+        return await self._submit(syscall)
+
+    async def _submit(self, syscall: Syscall) -> ConnectionResponse:
+        while True:
+            if self.ring_mapping is None:
+                raise SyscallHangup()
+            # request_buf is shared with other writers, so fill it in right before each submission
+            self.request_buf.sys = syscall.number
+            self.request_buf.args = (syscall.arg1, syscall.arg2, syscall.arg3,
+                                     syscall.arg4, syscall.arg5, syscall.arg6)
+            ret = lib.rsyscall_ring_submit(self.ring, self.request_buf, int(self.tofd.handle.near))
+            if ret < 0:
+                raise ConnectionError() from OSError(-ret, os.strerror(-ret))
+            elif ret > 0:
+                break
+            # the ring is full; wait for the server to complete some requests
+            await self.read_pending_responses()
+        response = ConnectionResponse()
+        self.pending_responses.append(response)
+        return response
+
+    async def write_requests(self, syscalls: t.List[Syscall]) -> t.List[ConnectionResponse]:
+        while True:
+            if self.writing_chain is not None:
+                await self.writing_chain.wait()
+            elif self.ring_mapping is None:
+                raise SyscallHangup()
+            elif len(syscalls) > lib.RSYSCALL_RING_SIZE:
+                break
+            elif ((self.ring.submitted - self.ring.collected) % 2**32) + len(syscalls) > lib.RSYSCALL_RING_SIZE:
+                # wait until there's room for all of them, so that _submit won't wait
+                # partway through and let some other requests in between
+                await self.read_pending_responses()
+            else:
+                return [await self._submit(syscall) for syscall in syscalls]
+        # These don't fit in the ring at once, so _submit will wait for the server to
+        # complete some of them partway through; until we're done, other writers wait
+        # on writing_chain. Like SyscallConnection, we don't let a partially submitted
+        # batch be cancelled.
+        self.writing_chain = trio.Event()
+        try:
+            with trio.CancelScope(shield=True):
+                return [await self._submit(syscall) for syscall in syscalls]
+        finally:
+            self.writing_chain.set()
+            self.writing_chain = None
+
+    async def _read_pending_responses_direct(self) -> None:
+        if self.ring_mapping is None:
+            raise SyscallHangup()
+        spins = 0 if trio.hazmat.current_statistics().tasks_runnable else self.spin_budget
+        count = lib.rsyscall_ring_collect(self.ring, self.response_buf, spins)
+        if count:
+            self.spin_budget = min(self.spins, max(1, self.spin_budget*2))
+        elif spins:
+            self.spin_budget //= 2
+        while count == 0:
+            # the server will write a doorbell byte to fromfd when it completes a request
+            buf = self.doorbell_buf or await self.fromfd.ram.malloc(bytes, 64)
+            self.doorbell_buf = None
+            valid, rest = await self.fromfd.read(buf)
+            if valid.size() == 0:
+                raise SyscallHangup()
+            self.doorbell_buf = valid.merge(rest)
+            count = lib.rsyscall_ring_collect(self.ring, self.response_buf, 0)
+        self._got_responses(ffi.unpack(self.response_buf, count))
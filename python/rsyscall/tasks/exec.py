@@ -15,9 +15,12 @@ from rsyscall.handle import WrittenPointer, Pointer, MemoryTransport, Task, File
 from rsyscall.thread import ChildThread, Thread
 from rsyscall.loader import NativeLoader
 from rsyscall.memory.socket_transport import SocketMemoryTransport
+from rsyscall.memory.process_vm_transport import ProcessVMMemoryTransport
+from rsyscall.memory.shared_transport import SharedMemoryTransport
+from rsyscall.tasks.util import is_local
 from rsyscall.monitor import AsyncChildProcess
-from rsyscall.tasks.fork import launch_futex_monitor, ChildSyscallInterface
-from rsyscall.tasks.connection import SyscallConnection
+from rsyscall.tasks.fork import ChildSyscallInterface, FutexWatcher
+from rsyscall.tasks.connection import SyscallConnection, RingSyscallConnection
 from rsyscall.memory.ram import RAM
 import rsyscall.far as far
 import rsyscall.memory.allocator as memory
@@ -88,6 +91,26 @@ async def setup_shared_memory_robust_futex(
     parent_futex_node = child_futex_node._with_mapping(parent_mapping)
     return parent_futex_node, child_futex_node
 
+async def setup_shared_arena(
+        parent_memfd: FileDescriptor,
+        child_memfd: FileDescriptor,
+        size: int=1024*1024,
+) -> t.Tuple[MemoryMapping, MemoryMapping]:
+    """Map the same memory into `parent` and `child`, and return (parent mapping, child mapping)
+
+    The child can allocate from its mapping, and if the parent is in our local address
+    space, we can read and write the child's allocations through the parent mapping with
+    SharedMemoryTransport.
+
+    """
+    await parent_memfd.ftruncate(size)
+    file = far.File()
+    parent_mapping = await parent_memfd.mmap(size, PROT.READ|PROT.WRITE, MAP.SHARED, file=file)
+    await parent_memfd.close()
+    child_mapping = await child_memfd.mmap(size, PROT.READ|PROT.WRITE, MAP.SHARED, file=file)
+    await child_memfd.close()
+    return parent_mapping, child_mapping
+
 @dataclass
 class RsyscallServerExecutable:
     """A standalone representation of the rsyscall-server executable
@@ -115,14 +138,13 @@ async def rsyscall_exec(
 
     This is of fairly limited use except as a stress-test for our primitives.
 
-    We need to know about our parent thread because we need to create a new futex child
-    process to wait for the child calling exec. We can't have the child itself create this
-    futex process because the whole point of the futex process is to monitor for the child
-    calling exec or exit; see ChildSyscallInterface. That futex process can be a child of
-    anyone, so technically `parent` doesn't have to be our parent, it just needs to
-    currently share its fd table with us.
+    We need to know about our parent thread because we need to watch a new futex to wait
+    for the child calling exec. We can't have the child itself watch this futex because
+    the whole point of the futex is to monitor for the child calling exec or exit; see
+    ChildSyscallInterface. The futex can be watched by anyone, so technically `parent`
+    doesn't have to be our parent, it just needs to currently share its fd table with us.
 
-    For the new futex process, we need to use a robust futex, registered on the
+    For the new futex, we need to use a robust futex, registered on the
     robust_list.  The robust_list is, unfortunately, the only truly robust way to get
     notified of a process calling exec. We use ctid elsewhere, but the kernel has an
     irritating check where it only does a futex wakeup on ctid if the process's memory
@@ -135,6 +157,12 @@ async def rsyscall_exec(
     child_futex_memfd = await child.task.memfd_create(
         await child.ram.ptr(Path("child_robust_futex_list")))
     parent_futex_memfd = child_futex_memfd.for_task(parent.task)
+    shared_arena_memfds: t.Optional[t.Tuple[FileDescriptor, FileDescriptor]] = None
+    if is_local(parent.task):
+        # memory which the child can allocate from and we can access directly
+        child_arena_memfd = await child.task.memfd_create(
+            await child.ram.ptr(Path("child_shared_arena")))
+        shared_arena_memfds = (child_arena_memfd.for_task(parent.task), child_arena_memfd)
     if isinstance(child.task.sysif, ChildSyscallInterface):
         syscall = child.task.sysif
     else:
@@ -142,7 +170,7 @@ async def rsyscall_exec(
     # unshare files so we can unset cloexec on fds to inherit
     await child.unshare_files(going_to_exec=True)
     # unset cloexec on all the fds we want to copy to the new space
-    for fd in child.task.fd_handles:
+    for fd in list(child.task.fd_handles):
         await fd.fcntl(F.SETFD, 0)
     def encode(fd: FileDescriptor) -> bytes:
         return str(int(fd.near)).encode()
@@ -150,7 +178,7 @@ async def rsyscall_exec(
     await child.exec(executable.command.args(
         encode(passed_data_sock), encode(syscall.infd), encode(syscall.outfd),
         *[encode(fd) for fd in child.task.fd_handles],
-    ), [child.monitor.sigfd.signal_block])
+    ), child.monitor.signal_blocks)
     if len(syscall.rsyscall_connection.pending_responses) == 1:
         # remove execve from pending_responses, we're never going to get a response to it
         syscall.rsyscall_connection.pending_responses = []
@@ -158,26 +186,42 @@ async def rsyscall_exec(
         raise Exception("syscall connection in bad state; " +
                         "expected one pending response for execve, instead got",
                         syscall.rsyscall_connection.pending_responses)
+    if isinstance(syscall.rsyscall_connection, RingSyscallConnection):
+        # the ring was in the old address space; rsyscall-server uses the connection directly
+        syscall.rsyscall_connection = await syscall.rsyscall_connection.detach_ring()
     # a new address space needs a new allocator and transport; we mutate the RAM so things
     # that have stored the RAM continue to work.
-    child.ram.allocator = memory.AllocatorClient.make_allocator(child.task)
-    child.ram.transport = SocketMemoryTransport(
+    allocator = memory.AllocatorClient.make_allocator(child.task)
+    child.ram.allocator = allocator
+    transport: MemoryTransport = SocketMemoryTransport(
         access_data_sock, passed_data_sock, child.ram.allocator)
+    if is_local(access_data_sock.handle.task):
+        transport = ProcessVMMemoryTransport(access_data_sock.handle.task, child.task, transport)
+    child.ram.transport = transport
     # rsyscall-server will write the symbol table to passed_data_sock, and we'll read it
     # from access_data sock to set up the symbol table for the new address space
     child.loader = NativeLoader.make_from_symbols(
         child.task, await AsyncReadBuffer(access_data_sock).read_cffi('struct rsyscall_symbol_table'))
 
-    #### make new futex process
-    # The futex process we used before is dead now that we've exec'd. We need to make some
-    # syscalls in the child to set up the new futex process. ChildSyscallInterface would
-    # throw immediately on seeing the current dead futex_process, so we need to null it out.
-    syscall.futex_process = None
-    # We have to use a robust futex now for our futex_process, see docstring
+    #### watch a new futex
+    # The futex we watched before was woken by the exec. We need to make some syscalls
+    # in the child to set up the new futex. ChildSyscallInterface would throw
+    # immediately on seeing the old woken futex, so we need to null it out.
+    syscall.futex = None
+    # We have to use a robust futex now, see docstring
     parent_futex_ptr, child_futex_ptr = await setup_shared_memory_robust_futex(
         parent, parent_futex_memfd, child, child_futex_memfd)
-    syscall.futex_process = await launch_futex_monitor(
-        parent.ram, parent.loader, parent.monitor, parent_futex_ptr)
+    syscall.futex = await parent.futex_watcher.watch(parent, parent_futex_ptr)
+    # the child is in a new address space, so the threads it forks need a new watcher
+    child.futex_watcher = FutexWatcher(child)
+    if shared_arena_memfds is not None:
+        # prefer allocating from the shared arena, which we can access without any syscalls
+        parent_mapping, child_mapping = await setup_shared_arena(*shared_arena_memfds)
+        allocator.add_arena(child_mapping)
+        shared_transport = SharedMemoryTransport(parent.task, transport)
+        # the child's tasks all share child.task.address_space until they exec or exit
+        shared_transport.add_owned_mapping(parent_mapping, child.task.address_space)
+        child.ram.transport = shared_transport
     # now we are alive and fully working again, we can be used for GC
     child.task._add_to_active_fd_table_tasks()
 
@@ -6,25 +6,30 @@ That is to say, make a new thread the normal way.
 from __future__ import annotations
 from dataclasses import dataclass
 from rsyscall._raw import ffi # type: ignore
-from rsyscall.concurrency import OneAtATime
+from rsyscall.concurrency import OneAtATime, MultiplexedEvent
 from rsyscall.epoller import AsyncFileDescriptor
-from rsyscall.handle import Stack, WrittenPointer, Pointer, FutexNode, FileDescriptor, Task, FutexNode
+from rsyscall.handle import Stack, WrittenPointer, Pointer, FutexNode, FileDescriptor, Task, FutexNode, MemoryMapping
 from rsyscall.loader import Trampoline, NativeLoader
-from rsyscall.memory.allocator import Arena
+from rsyscall.memory.allocator import Arena, align
 from rsyscall.memory.ram import RAM
 from rsyscall.monitor import AsyncChildProcess, ChildProcessMonitor
-from rsyscall.struct import Int32
+from rsyscall.struct import Int32, StructList
 from rsyscall.tasks.base_sysif import BaseSyscallInterface
-from rsyscall.tasks.connection import SyscallConnection
-from rsyscall.near.sysif import SyscallHangup
+from rsyscall.tasks.connection import SyscallConnection, RingSyscallConnection
+from rsyscall.near.sysif import SyscallHangup, SyscallResponse
+from rsyscall.tasks.util import is_local
 import contextlib
+import errno
 import logging
 import rsyscall.far as far
+import rsyscall.near as near
 import trio
 import typing as t
 
 from rsyscall.sched import CLONE
+from rsyscall.linux.futex import FutexWaitv, FUTEX_WAKE, FUTEX_WAITV_MAX
 from rsyscall.signal import SIG
+from rsyscall.sys.syscall import SYS
 from rsyscall.sys.mman import PROT, MAP
 from rsyscall.sys.wait import W
 
@@ -33,6 +38,9 @@ __all__ = [
     'MMRelease',
     'ChildSyscallInterface',
     'launch_futex_monitor',
+    'FutexProcess',
+    'WatchedFutex',
+    'FutexWatcher',
     'clone_child_task',
     'ForkThread',
 ]
@@ -74,12 +82,16 @@ class ChildSyscallInterface(BaseSyscallInterface):
     to exit() was successful, and rsyscall.near.exit treats receiving an
     RsycallHangup as successful.
 
-    We also take a futex_process: AsyncChildProcess. This is also used for
-    normal functionality: futex_process should exit when the process has
-    successfully called exec. This is again our only way of detecting a
-    successful call to exec, and rsyscall.near.execve treats receiving an
-    RsycallHangup as successful. (Concretely, futex_process will also exit when
-    the process exits, not just when it execs, but that's harmless)
+    We also take a futex: something with a `wait` method which returns once
+    the process has left its address space. This is also used for normal
+    functionality: futex.wait should return when the process has successfully
+    called exec. This is again our only way of detecting a successful call to
+    exec, and rsyscall.near.execve treats receiving an RsycallHangup as
+    successful. (Concretely, futex.wait will also return when the process
+    exits, not just when it execs, but that's harmless)
+
+    The futex is usually a WatchedFutex, watched by a thread shared with many
+    other children, and sometimes a FutexProcess; see FutexWatcher.
 
     A better way of detecting exec success would be great...
 
@@ -87,12 +99,13 @@ class ChildSyscallInterface(BaseSyscallInterface):
     def __init__(self,
                  rsyscall_connection: SyscallConnection,
                  server_process: AsyncChildProcess,
-                 futex_process: t.Optional[AsyncChildProcess],
+                 futex: t.Optional[t.Union[WatchedFutex, FutexProcess]],
     ) -> None:
         super().__init__(rsyscall_connection)
         self.server_process = server_process
-        self.futex_process = futex_process
-        self.logger = logging.getLogger(f"rsyscall.ChildSyscallInterface.{int(self.server_process.process.near)}")
+        self.futex = futex
+        self.pid = int(self.server_process.process.near)
+        self.logger = logging.getLogger(f"rsyscall.ChildSyscallInterface.{self.pid}")
         self.running_read = OneAtATime()
 
     @contextlib.asynccontextmanager
@@ -122,8 +135,8 @@ class ChildSyscallInterface(BaseSyscallInterface):
                 child_exited = True
                 nursery.cancel_scope.cancel()
             async def futex_exit() -> None:
-                if self.futex_process is not None:
-                    await self.futex_process.waitpid(W.EXITED)
+                if self.futex is not None:
+                    await self.futex.wait()
                     nonlocal futex_exited
                     futex_exited = True
                     nursery.cancel_scope.cancel()
@@ -134,7 +147,10 @@ class ChildSyscallInterface(BaseSyscallInterface):
             nursery.cancel_scope.cancel()
         if got_result:
             return
-        elif child_exited:
+        if (child_exited or futex_exited) and isinstance(self.rsyscall_connection, RingSyscallConnection):
+            # either way, the server has left our address space and is done with the ring
+            self.rsyscall_connection.unmap_ring()
+        if child_exited:
             # this takes precedence over MMRelease, since it gives us more information
             raise ChildExit()
         elif futex_exited:
@@ -190,27 +206,242 @@ async def launch_futex_monitor(ram: RAM,
     # TODO uh we need to actually call something to free the stack
     return futex_process
 
+class FutexProcess:
+    "A futex monitored by a futex process started with launch_futex_monitor"
+    def __init__(self, process: AsyncChildProcess) -> None:
+        self.process = process
+
+    async def wait(self) -> None:
+        "Wait until the futex has been woken, which is when the futex process exits"
+        await self.process.waitpid(W.EXITED)
+
+class WatchedFutex:
+    "A futex watched by a FutexWaiter; wait returns once the futex has been woken"
+    def __init__(self, waiter: FutexWaiter, futex_pointer: WrittenPointer[FutexNode]) -> None:
+        self.waiter = waiter
+        self.futex_pointer = futex_pointer
+        self.woken = False
+
+    def _waitv(self) -> FutexWaitv:
+        return FutexWaitv(self.futex_pointer.value.futex,
+                          int(self.futex_pointer.near + ffi.offsetof('struct futex_node', 'futex')))
+
+    async def wait(self) -> None:
+        "Wait until the futex has been woken"
+        while not self.woken:
+            await self.waiter.next_wake.wait()
+
+class FutexWaiter:
+    """A thread which sleeps in futex_waitv on many futexes at once
+
+    The first futex in the array we pass to futex_waitv is a control futex, which
+    holds a generation counter; we bump it and wake it whenever we want the waiter to
+    pick up a change to the set of futexes it's watching.
+
+    We submit the futex_waitv call once and keep the pending response around; whoever
+    is waiting on next_wake receives it, and if they're cancelled, the next waiter
+    just picks up receiving the same response.
+
+    This thread spends its whole life blocked in futex_waitv, so we take it out of the
+    fd table's active tasks; otherwise we might try to use it to close fds.
+
+    """
+    def __init__(self, root: ForkThread, process: AsyncChildProcess, task: Task,
+                 control: WrittenPointer[FutexNode]) -> None:
+        self.root = root
+        self.process = process
+        self.task = task
+        self.control = control
+        self.futexes: t.List[WatchedFutex] = []
+        self.submitted: t.List[WatchedFutex] = []
+        self.waitv_buf: t.Optional[WrittenPointer[StructList[FutexWaitv]]] = None
+        self.pending: t.Optional[SyscallResponse] = None
+        self.submitting = False
+        self.interrupt_lock = trio.Lock()
+        self.next_wake = MultiplexedEvent(self._wait)
+
+    @staticmethod
+    async def make(root: ForkThread) -> FutexWaiter:
+        process, task = await clone_child_task(
+            root, CLONE.NONE, lambda sock: Trampoline(root.loader.server_func, [sock, sock]),
+            watch_futex=False)
+        task._remove_from_active_fd_table_tasks()
+        # futexes must be 4-byte aligned, which our normal allocator doesn't guarantee
+        arena = Arena(await root.task.mmap(4096, PROT.READ|PROT.WRITE, MAP.SHARED))
+        async def op(sem: RAM) -> WrittenPointer[FutexNode]:
+            return await sem.ptr(FutexNode(None, Int32(0)))
+        control = await root.ram.perform_batch(op, arena)
+        return FutexWaiter(root, process, task, control)
+
+    def full(self) -> bool:
+        # one slot is taken by the control futex
+        return len(self.futexes) >= FUTEX_WAITV_MAX - 1
+
+    async def add(self, futex_pointer: WrittenPointer[FutexNode]) -> WatchedFutex:
+        futex = WatchedFutex(self, futex_pointer)
+        self.futexes.append(futex)
+        if self.pending is not None or self.submitting:
+            await self._interrupt()
+        return futex
+
+    def _control_waitv(self) -> FutexWaitv:
+        return FutexWaitv(self.control.value.futex,
+                          int(self.control.near + ffi.offsetof('struct futex_node', 'futex')))
+
+    async def _interrupt(self) -> None:
+        "Make the pending futex_waitv return, so that we resubmit it with the current futexes"
+        async with self.interrupt_lock:
+            await self._bump_control()
+
+    async def _bump_control(self) -> None:
+        self.control = await self.control.write(FutexNode(None, Int32(self.control.value.futex + 1)))
+        with self.control.borrow(self.root.task) as control_n:
+            await near.futex(self.root.task.sysif, control_n + ffi.offsetof('struct futex_node', 'futex'),
+                             FUTEX_WAKE, 1, None, None, 0)
+
+    async def _submit(self) -> None:
+        # if a futex is added after we take this snapshot, it will bump the control
+        # futex, and our futex_waitv will fail with EAGAIN or be woken.
+        self.submitting = True
+        try:
+            self._forget_freed()
+            self.submitted = list(self.futexes)
+            waitvs = StructList(FutexWaitv, [self._control_waitv(), *[futex._waitv() for futex in self.submitted]])
+            self.waitv_buf = await self.root.ram.ptr(waitvs)
+            with self.waitv_buf.borrow(self.task) as waitv_n:
+                # we call submit_syscall directly so that waiting on the response is cancellable
+                self.pending = await self.task.sysif.submit_syscall(
+                    SYS.futex_waitv, waitv_n, len(waitvs.elems), 0, 0, 0)
+        finally:
+            self.submitting = False
+
+    def _woke(self, futex: WatchedFutex) -> None:
+        futex.woken = True
+        self.futexes.remove(futex)
+
+    def _forget_freed(self) -> None:
+        # a futex is freed once its process is known to have exited or exec'd, at which
+        # point it's already been woken, even if we haven't seen it yet.
+        for futex in list(self.futexes):
+            if not futex.futex_pointer.valid:
+                self._woke(futex)
+
+    async def _wake_changed(self) -> None:
+        "Mark all the submitted futexes whose values no longer match what we waited on as woken"
+        self._forget_freed()
+        futexes = [futex for futex in self.submitted if not futex.woken]
+        # the futexes are all in root's address space, but their pointers might have
+        # transports for some other task which has since left it, so we use root's transport
+        datas = await self.root.ram.transport.batch_read([futex.futex_pointer for futex in futexes])
+        for futex, data in zip(futexes, datas):
+            if ffi.cast('struct futex_node*', ffi.from_buffer(data)).futex != futex.futex_pointer.value.futex:
+                self._woke(futex)
+
+    async def _wait(self) -> None:
+        if self.pending is None:
+            with trio.CancelScope(shield=True):
+                await self._submit()
+        response = t.cast(SyscallResponse, self.pending)
+        try:
+            ret = await response.receive()
+        except OSError as e:
+            self.pending = None
+            if e.errno not in (errno.EAGAIN, errno.EINTR):
+                raise
+            # some futex didn't have the value we expected; probably it was
+            # already woken before we started waiting
+            await self._wake_changed()
+        else:
+            self.pending = None
+            if ret > 0:
+                self._woke(self.submitted[ret - 1])
+        self.next_wake = MultiplexedEvent(self._wait)
+
+class FutexWatcher:
+    """Watches ctid and robust futexes in some address space, to detect exit and exec
+
+    Each thread needs one futex watched, as described in ChildSyscallInterface. We used
+    to launch one futex process per thread, doubling the cost of each fork; now all the
+    threads in an address space share one FutexWatcher, which watches up to
+    FUTEX_WAITV_MAX-1 futexes with each FutexWaiter thread, started lazily from `root`.
+
+    If the kernel doesn't have futex_waitv, or the futex isn't in root's address space,
+    we fall back to launching a futex process with launch_futex_monitor.
+
+    """
+    def __init__(self, root: ForkThread) -> None:
+        self.root = root
+        self.supported: t.Optional[bool] = None
+        self.waiters: t.List[FutexWaiter] = []
+        self.lock = trio.Lock()
+
+    async def _check_supported(self) -> bool:
+        try:
+            # this call is always invalid; we just want to know whether it's EINVAL or ENOSYS
+            await near.futex_waitv(self.root.task.sysif, None, 0, 0, None, 0)
+        except OSError as e:
+            return e.errno == errno.EINVAL
+        return False
+
+    async def _get_waiter(self) -> t.Optional[FutexWaiter]:
+        async with self.lock:
+            if self.supported is None:
+                self.supported = await self._check_supported()
+            if not self.supported:
+                return None
+            for waiter in self.waiters:
+                if not waiter.full():
+                    return waiter
+            waiter = await FutexWaiter.make(self.root)
+            self.waiters.append(waiter)
+            return waiter
+
+    async def watch(self, parent: ForkThread,
+                    futex_pointer: WrittenPointer[FutexNode]) -> t.Union[WatchedFutex, FutexProcess]:
+        "Watch this futex, which must be in the address space of `parent`"
+        if futex_pointer.mapping.task.address_space is self.root.task.address_space:
+            waiter = await self._get_waiter()
+            if waiter is not None:
+                return await waiter.add(futex_pointer)
+        return FutexProcess(await launch_futex_monitor(
+            parent.ram, parent.loader, parent.monitor, futex_pointer))
+
 async def clone_child_task(
         parent: ForkThread,
         flags: CLONE,
         trampoline_func: t.Callable[[FileDescriptor], Trampoline],
+        ring_trampoline_func: t.Optional[t.Callable[[MemoryMapping, FileDescriptor], Trampoline]]=None,
+        watch_futex: bool=True,
 ) -> t.Tuple[AsyncChildProcess, Task]:
     """Clone a new child process and setup the sysif and task to manage it
 
     We rely on trampoline_func to take a socket and give us a native function call with
     arguments that will speak the rsyscall protocol over that socket.
 
-    We also create a futex process, which we use to monitor the ctid futex.
-    This process allows us to detect when the child successfully finishes an
-    exec; see the docstring of ChildSyscallInterface.  Because we set
-    CLONE.CHILD_CLEARTID, the ctid futex will receive a FUTEX_WAKE when the
-    child process exits or execs, and the futex process will accordingly exit.
+    If ring_trampoline_func is passed, and the child will share memory with us,
+    we instead map a `struct rsyscall_ring` and use ring_trampoline_func to make
+    a native function call that will serve syscalls from that ring, using the
+    socket only for wakeups; see RingSyscallConnection. Otherwise, we fall back
+    to trampoline_func.
+
+    We also watch the ctid futex with parent.futex_watcher, which allows us to
+    detect when the child successfully finishes an exec; see the docstring of
+    ChildSyscallInterface.  Because we set CLONE.CHILD_CLEARTID, the ctid futex
+    will be set to zero and receive a FUTEX_WAKE when the child process exits or
+    execs. If watch_futex is False, we don't watch the futex at all; that's only
+    useful for threads which will never exec.
 
     """
     # Open a channel which we'll use for the rsyscall connection
     [(access_sock, remote_sock)] = await parent.connection.open_async_channels(1)
     # Create a trampoline that will start the new process running an rsyscall server
-    trampoline = trampoline_func(remote_sock)
+    ring: t.Optional[MemoryMapping] = None
+    if (ring_trampoline_func is not None and is_local(access_sock.handle.task)
+        and parent.task.address_space is access_sock.handle.task.address_space):
+        ring = await parent.task.mmap(align(ffi.sizeof('struct rsyscall_ring'), 4096), PROT.READ|PROT.WRITE, MAP.SHARED)
+        trampoline = ring_trampoline_func(ring, remote_sock)
+    else:
+        trampoline = trampoline_func(remote_sock)
     # Force these flags to be used
     flags |= CLONE.VM|CLONE.FILES|CLONE.IO|CLONE.SYSVSEM
     # TODO it is unclear why we sometimes need to make a new mapping here, instead of
@@ -222,20 +453,21 @@ async def clone_child_task(
         stack_value = parent.loader.make_trampoline_stack(trampoline)
         stack_buf = await sem.malloc(Stack, 4096)
         stack = await stack_buf.write_to_end(stack_value, alignment=16)
-        futex_pointer = await sem.ptr(FutexNode(None, Int32(0)))
+        futex_pointer = await sem.ptr(FutexNode(None, Int32(1)))
         return stack, futex_pointer
-    # Create the stack we'll need, and the zero-initialized futex
+    # Create the stack we'll need, and the futex, which is nonzero until the kernel clears it
     stack, futex_pointer = await parent.ram.perform_batch(op, arena)
     # it's important to start the processes in this order, so that the thread
     # process is the first process started; this is relevant in several
     # situations, including unshare(NEWPID) and manipulation of ns_last_pid
     child_process = await parent.monitor.clone(flags|CLONE.CHILD_CLEARTID, stack, ctid=futex_pointer)
-    futex_process = await launch_futex_monitor(
-        parent.ram, parent.loader, parent.monitor, futex_pointer)
+    futex = await parent.futex_watcher.watch(parent, futex_pointer) if watch_futex else None
     # Create the new syscall interface, which needs to use not just the connection,
-    # but also the child process and the futex process.
-    syscall = ChildSyscallInterface(SyscallConnection(access_sock, access_sock),
-                                    child_process, futex_process)
+    # but also the child process and the futex.
+    # ChildSyscallInterface unmaps the ring once it sees the child exit or exec
+    connection = (SyscallConnection(access_sock, access_sock) if ring is None
+                  else RingSyscallConnection(access_sock, access_sock, ring))
+    syscall = ChildSyscallInterface(connection, child_process, futex)
     # Set up the new task with appropriately inherited namespaces, tables, etc.
     # TODO correctly track all the namespaces we're in
     if flags & CLONE.NEWPID:
@@ -264,13 +496,16 @@ class ForkThread(ConnectionThread):
         super().__init__(task, ram, epoller, connection)
         self.loader = loader
         self.monitor = monitor
+        self.futex_watcher = FutexWatcher(self)
 
     def _init_from(self, thr: ForkThread) -> None: # type: ignore
         super()._init_from(thr)
         self.loader = thr.loader
         self.monitor = thr.monitor
+        self.futex_watcher = thr.futex_watcher
 
     async def _fork_task(self, flags: CLONE) -> t.Tuple[AsyncChildProcess, Task]:
         return await clone_child_task(
-            self, flags, lambda sock: Trampoline(self.loader.server_func, [sock, sock]))
+            self, flags, lambda sock: Trampoline(self.loader.server_func, [sock, sock]),
+            lambda ring, sock: Trampoline(self.loader.ring_server_func, [int(ring.near.address), sock, sock]))
 
@@ -3,6 +3,11 @@
 The local thread is the thread that every rsyscall program has available from the
 start. From this thread, we create all the others.
 
+The local thread allocates some resources when it's created: an epollfd, a socketpair for
+passing fds, and a signalfd for SIGCHLD, with SIGCHLD blocked. So that merely importing
+rsyscall doesn't do that, it's created lazily, on first access to `thread`. A program
+which would rather control when that happens can call `initialize` from its own trio run.
+
 """
 from __future__ import annotations
 from rsyscall.thread import Thread
@@ -14,14 +19,19 @@ from rsyscall.near.sysif import SyscallInterface, SyscallResponse
 import rsyscall.near.types as near
 import rsyscall.handle as handle
 import rsyscall.loader as loader
+import importlib.abc
 import logging
 import os
+import signal
+import sys
+import threading
 import typing as t
 from dataclasses import dataclass
 import rsyscall.memory.allocator as memory
 from rsyscall.memory.ram import RAM
 from rsyscall.handle import Pointer, Task, MemoryMapping
-from rsyscall.signal import SIG, Sigaction, Sighandler
+from rsyscall.signal import SIG, Sigaction, Sighandler, Sigset
+from rsyscall.sys.syscall import SYS
 from rsyscall.sys.socket import AF, SOCK
 from rsyscall.network.connection import FDPassConnection
 from rsyscall.environ import Environment
@@ -35,6 +45,7 @@ logger = logging.getLogger(__name__)
 
 __all__ = [
     "thread",
+    "initialize",
 ]
 
 async def _direct_syscall(number, arg1=0, arg2=0, arg3=0, arg4=0, arg5=0, arg6=0):
@@ -53,6 +64,7 @@ class LocalSyscall(SyscallInterface):
     "Makes syscalls in the local, Python interpreter thread."
     def __init__(self) -> None:
         self.logger = logger
+        self.pid = os.getpid()
 
     def get_activity_fd(self) -> None:
         return None
@@ -129,7 +141,8 @@ async def _make_local_thread() -> Thread:
         await FDPassConnection.make(task, ram, epoller),
         NativeLoader.make_from_symbols(task, lib),
         epoller,
-        await ChildProcessMonitor.make(ram, task, epoller),
+        # the rest of the Python process may create and reap children of its own
+        await ChildProcessMonitor.make(ram, task, epoller, exclusive=False),
         Environment(task, ram, {key.encode(): value.encode() for key, value in os.environ.items()}),
         stdin=task.make_fd_handle(near.FileDescriptor(0)),
         stdout=task.make_fd_handle(near.FileDescriptor(1)),
@@ -137,17 +150,111 @@ async def _make_local_thread() -> Thread:
     )
     return thread
 
+def _reset_sigwinch() -> None:
+    "Set SIGWINCH back to the default disposition, with a direct syscall so it works from any OS thread."
+    act = Sigaction(Sighandler.DFL).to_bytes()
+    raise_if_error(lib.rsyscall_raw_syscall(
+        SIG.WINCH, int(ffi.cast('long', ffi.from_buffer(act))), 0, Sigset.sizeof(), 0, 0,
+        SYS.rt_sigaction))
+
+class _ReadlineLoader(importlib.abc.Loader):
+    "Wraps readline's real loader, and wipes out its SIGWINCH handler as soon as it's installed."
+    def __init__(self, loader: t.Any) -> None:
+        self.loader = loader
+
+    def create_module(self, spec: t.Any) -> t.Any:
+        module = self.loader.create_module(spec)
+        _reset_sigwinch()
+        return module
+
+    def exec_module(self, module: t.Any) -> None:
+        self.loader.exec_module(module)
+
+class _ReadlineFinder(importlib.abc.MetaPathFinder):
+    "Finds readline with the other finders, and wraps its loader in _ReadlineLoader."
+    def find_spec(self, fullname: str, path: t.Any, target: t.Any=None) -> t.Any:
+        if fullname != "readline":
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                spec.loader = _ReadlineLoader(spec.loader)
+                return spec
+        return None
+
 async def _initialize() -> Thread:
     thr = await _make_local_thread()
     # Wipe out the SIGWINCH handler that the readline module installs.
     # We do this because otherwise this handler will be inherited down to our
     # children, where it will segfault on run due to the environment being
-    # totally different (lacking TLS for one). I'm not sure if there's any
-    # alternative; wiping out the signal handlers from within the children after
-    # they've been created still leaves a window for the signal handler to run.
-    import readline
-    await thr.task.sigaction(SIG.WINCH, await thr.ram.ptr(Sigaction(Sighandler.DFL)), None)
+    # totally different (lacking TLS for one). With the default CLONE.SIGHAND,
+    # our children share our signal handlers, so this has to happen in our own
+    # process before there's any chance for the handler to run in a child.
+    # readline installs the handler when it's imported, which may have already
+    # happened (the interactive interpreter imports it at startup) or may happen
+    # later (pdb and breakpoint import it on first use), so we handle both cases.
+    if "readline" in sys.modules:
+        _reset_sigwinch()
+    else:
+        sys.meta_path.insert(0, _ReadlineFinder())
     return thr
 
-thread: Thread = trio.run(_initialize)
-"The local thread, fully initialized at import time"
+_thread: t.Optional[Thread] = None
+
+async def initialize() -> Thread:
+    """Create the local thread in the caller's trio run, if it hasn't been created yet, and return it
+
+    After this, `thread` is the returned Thread.
+
+    """
+    global _thread
+    if _thread is None:
+        _thread = await _initialize()
+    return _thread
+
+def _initialize_sync() -> Thread:
+    """Create the local thread without awaiting, even if we're already in a trio run
+
+    trio runs can't be nested, so if we're in one, we create the local thread in a trio run
+    on a new OS thread. Everything we set up there belongs to the whole process, except
+    the signal mask, which is per OS thread; so we copy it back to this OS thread.
+
+    Either way, SIGCHLD ends up blocked only in the calling OS thread, and in OS threads
+    it starts afterwards, which inherit its mask. There's no way to block a signal in
+    other, already running OS threads; if one of them has SIGCHLD unblocked, SIGCHLD may
+    be delivered to it and never reach our signalfd. So the local thread should be first
+    accessed, or `initialize` called, before starting other OS threads, such as trio's
+    worker threads.
+
+    """
+    try:
+        trio.hazmat.current_task()
+    except RuntimeError:
+        return trio.run(initialize)
+    results: t.List[t.Any] = []
+    def run() -> None:
+        try:
+            results.append(trio.run(initialize))
+            results.append(signal.pthread_sigmask(signal.SIG_BLOCK, []))
+        except BaseException as exn:
+            results.append(exn)
+    os_thread = threading.Thread(target=run, name="rsyscall local thread initialization")
+    os_thread.start()
+    os_thread.join()
+    if isinstance(results[-1], BaseException):
+        raise results[-1]
+    thr, sigmask = results
+    signal.pthread_sigmask(signal.SIG_SETMASK, sigmask)
+    return thr
+
+thread: Thread
+"The local thread, created on first access"
+
+def __getattr__(name: str) -> t.Any:
+    if name == "thread":
+        if _thread is None:
+            return _initialize_sync()
+        return _thread
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -18,6 +18,7 @@ class NonChildSyscallInterface(BaseSyscallInterface):
                  # usually the same pid that's inside the namespaces
                  identifier_process: near.Process) -> None:
         super().__init__(rsyscall_connection)
+        self.pid = identifier_process.id
         self.logger = logging.getLogger(f"rsyscall.SyscallConnection.{identifier_process.id}")
 
     async def _read_pending_responses(self) -> None:
@@ -62,8 +62,9 @@ While CLONE_THREAD could allow the better model for persistent threads, it comes
 host of other disadvantages and complexities, so we're just biting the bullet and
 accepting the worse model.
 
-The recent feature of pidfds will likely allow a better model, once we're able to wait on
-pidfds, which hasn't yet been added.
+Pidfds may eventually allow a better model. We can now wait on pidfds through epoll (see
+ChildProcessMonitor.make_pidfd), but waitid(P.PIDFD) still only works on our own children,
+so it doesn't help with inheriting child processes.
 
 """
 from __future__ import annotations
@@ -78,8 +79,10 @@ from rsyscall.tasks.non_child import NonChildSyscallInterface
 from rsyscall.tasks.fork import ChildSyscallInterface, clone_child_task
 from rsyscall.loader import NativeLoader, Trampoline
 from rsyscall.sched import Stack
-from rsyscall.handle import WrittenPointer, ThreadProcess, Pointer, Task, FileDescriptor
+from rsyscall.handle import WrittenPointer, ThreadProcess, Pointer, Task, FileDescriptor, MemoryTransport
 from rsyscall.memory.socket_transport import SocketMemoryTransport
+from rsyscall.memory.process_vm_transport import ProcessVMMemoryTransport
+from rsyscall.tasks.util import is_local
 import contextlib
 
 import trio
@@ -131,7 +134,7 @@ async def fork_persistent(
         parent, CLONE.FS|CLONE.SIGHAND,
         lambda sock: Trampoline(parent.loader.persistent_server_func, [sock, sock, listening_sock]))
     listening_sock_handle = listening_sock.move(task)
-    ram = RAM(task, parent.ram.transport, parent.ram.allocator.inherit(task))
+    ram = RAM(task, parent.ram.transport, parent.ram.allocator.inherit(task), parent.ram.const_cache)
 
     ## create the new persistent task
     epoller = await Epoller.make_root(ram, task)
@@ -239,7 +242,9 @@ class PersistentThread(Thread):
         # Fix up RAM with new transport
         # TODO technically this could still be in the same address space - that's the case in our tests.
         # we should figure out a way to use a LocalMemoryTransport here so it can copy efficiently
-        transport = SocketMemoryTransport(access_data_sock, remote_data_sock, self.ram.allocator)
+        transport: MemoryTransport = SocketMemoryTransport(access_data_sock, remote_data_sock, self.ram.allocator)
+        if is_local(access_data_sock.handle.task):
+            transport = ProcessVMMemoryTransport(access_data_sock.handle.task, self.task, transport)
         self.ram.transport = transport
         self.transport = transport
         # Fix up epoller with new activity fd
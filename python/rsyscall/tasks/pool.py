@@ -0,0 +1,106 @@
+"""A pool of pre-forked threads, so launching a command doesn't have to wait for a fork
+
+Forking a ChildThread isn't free: we open a connection, allocate and write a stack,
+clone, and set up a ChildSyscallInterface. When launching many short-lived commands, that
+work sits right on the launch latency path, even though none of it depends on the command.
+
+A ThreadPool keeps some number of forked threads ready in the background, and forks more as
+they're taken. Consumers take a thread, exec in it (or otherwise use it up), and the pool
+refills itself concurrently.
+
+"""
+from __future__ import annotations
+from rsyscall.command import Command
+from rsyscall.monitor import AsyncChildProcess
+from rsyscall.thread import Thread, ChildThread
+import contextlib
+import trio
+import typing as t
+
+from rsyscall.sched import CLONE
+from rsyscall.sys.wait import ChildState, W
+
+__all__ = [
+    "ThreadPool",
+    "make_thread_pool",
+]
+
+class ThreadPool:
+    """Keeps `size` threads, forked from `parent` with `flags`, ready to be taken
+
+    The threads are forked by a background task started with `start`, which forks one
+    thread at a time and blocks until there's room for it. Since that task holds on to one
+    thread while it blocks, the channel buffers one less than `size`.
+
+    Prefer make_thread_pool, which runs the background task and closes unused threads at
+    the end.
+
+    """
+    def __init__(self, parent: Thread, size: int, flags: CLONE=CLONE.NONE) -> None:
+        if size < 1:
+            raise ValueError("a ThreadPool must keep at least one thread", size)
+        self.parent = parent
+        self.size = size
+        self.flags = flags
+        self.send: trio.abc.SendChannel[ChildThread]
+        self.receive: trio.abc.ReceiveChannel[ChildThread]
+        self.send, self.receive = trio.open_memory_channel(size - 1)
+
+    async def start(self, *, task_status=trio.TASK_STATUS_IGNORED) -> None:
+        "Fork threads into the pool forever; run this in a nursery"
+        task_status.started()
+        while True:
+            # a fork interrupted halfway would leave parent in an unknown state
+            with trio.CancelScope(shield=True):
+                thread = await self.parent.fork(self.flags)
+            try:
+                await self.send.send(thread)
+            except BaseException:
+                with trio.CancelScope(shield=True):
+                    await thread.close()
+                raise
+
+    async def take(self) -> ChildThread:
+        "Take a ready thread from the pool, waiting for one to be forked if none are ready"
+        return await self.receive.receive()
+
+    async def exec(self, command: Command) -> AsyncChildProcess:
+        "Take a thread from the pool and exec this command in it"
+        thread = await self.take()
+        return await thread.exec(command)
+
+    async def run(self, command: Command, check=True,
+                  *, task_status=trio.TASK_STATUS_IGNORED) -> ChildState:
+        """Run the passed command to completion in a pooled thread, like Thread.run
+
+        If check is False, we won't throw if the end state is unclean.
+
+        """
+        child = await self.exec(command)
+        task_status.started(child)
+        exit_state = await child.waitpid(W.EXITED)
+        if check:
+            exit_state.check()
+        return exit_state
+
+    async def close(self) -> None:
+        "Close all the threads currently ready in the pool"
+        while True:
+            try:
+                thread = self.receive.receive_nowait()
+            except trio.WouldBlock:
+                return
+            await thread.close()
+
+@contextlib.asynccontextmanager
+async def make_thread_pool(parent: Thread, size: int, flags: CLONE=CLONE.NONE) -> t.AsyncGenerator[ThreadPool, None]:
+    "Start a ThreadPool refilling in the background; on exit, stop it and close its unused threads"
+    pool = ThreadPool(parent, size, flags)
+    async with trio.open_nursery() as nursery:
+        await nursery.start(pool.start)
+        try:
+            yield pool
+        finally:
+            nursery.cancel_scope.cancel()
+    with trio.CancelScope(shield=True):
+        await pool.close()
@@ -13,11 +13,13 @@ from dataclasses import dataclass
 from rsyscall.command import Command
 from rsyscall.environ import Environment
 from rsyscall.epoller import Epoller, AsyncReadBuffer
-from rsyscall.handle import WrittenPointer, Task
+from rsyscall.handle import WrittenPointer, Task, MemoryTransport
 from rsyscall.thread import Thread
 from rsyscall.loader import NativeLoader
 from rsyscall.memory.ram import RAM
 from rsyscall.memory.socket_transport import SocketMemoryTransport
+from rsyscall.memory.process_vm_transport import ProcessVMMemoryTransport
+from rsyscall.tasks.util import is_local
 from rsyscall.monitor import AsyncChildProcess, ChildProcessMonitor
 from rsyscall.tasks.connection import SyscallConnection
 from rsyscall.tasks.non_child import NonChildSyscallInterface
@@ -121,11 +123,11 @@ async def stdin_bootstrap(
     syscall.store_remote_side_handles(handle_remote_syscall_fd, handle_remote_syscall_fd)
     allocator = memory.AllocatorClient.make_allocator(base_task)
     # we assume our SignalMask is zero'd before being started, so we don't inherit it
-    ram = RAM(base_task,
-               SocketMemoryTransport(access_data_sock,
-                                     base_task.make_fd_handle(near.FileDescriptor(describe_struct.data_fd)),
-                                     allocator),
-               allocator)
+    transport: MemoryTransport = SocketMemoryTransport(
+        access_data_sock, base_task.make_fd_handle(near.FileDescriptor(describe_struct.data_fd)), allocator)
+    if is_local(access_data_sock.handle.task):
+        transport = ProcessVMMemoryTransport(access_data_sock.handle.task, base_task, transport)
+    ram = RAM(base_task, transport, allocator)
     # TODO I think I can maybe elide creating this epollcenter and instead inherit it or share it, maybe?
     epoller = await Epoller.make_root(ram, base_task)
     child_monitor = await ChildProcessMonitor.make(ram, base_task, epoller)
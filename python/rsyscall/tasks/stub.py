@@ -50,10 +50,12 @@ from rsyscall.epoller import Epoller, AsyncFileDescriptor, AsyncReadBuffer
 from rsyscall.monitor import ChildProcessMonitor
 from rsyscall.command import Command
 from rsyscall.memory.socket_transport import SocketMemoryTransport
+from rsyscall.memory.process_vm_transport import ProcessVMMemoryTransport
+from rsyscall.tasks.util import is_local
 
 import rsyscall.struct
 from rsyscall.environ import Environment
-from rsyscall.handle import WrittenPointer, FileDescriptor, Task
+from rsyscall.handle import WrittenPointer, FileDescriptor, Task, MemoryTransport
 
 from rsyscall.path import Path
 from rsyscall.sched import CLONE
@@ -160,11 +162,11 @@ async def _setup_stub(
     syscall.store_remote_side_handles(handle_remote_syscall_fd, handle_remote_syscall_fd)
     allocator = memory.AllocatorClient.make_allocator(base_task)
     base_task.sigmask = Sigset({SIG(bit) for bit in rsyscall.struct.bits(describe_struct.sigmask)})
-    ram = RAM(base_task,
-              SocketMemoryTransport(access_data_sock,
-                                    base_task.make_fd_handle(near.FileDescriptor(describe_struct.data_fd)),
-                                    allocator),
-              allocator)
+    transport: MemoryTransport = SocketMemoryTransport(
+        access_data_sock, base_task.make_fd_handle(near.FileDescriptor(describe_struct.data_fd)), allocator)
+    if is_local(access_data_sock.handle.task):
+        transport = ProcessVMMemoryTransport(access_data_sock.handle.task, base_task, transport)
+    ram = RAM(base_task, transport, allocator)
     # TODO I think I can maybe elide creating this epollcenter and instead inherit it or share it, maybe?
     # I guess I need to write out the set too in describe
     epoller = await Epoller.make_root(ram, base_task)
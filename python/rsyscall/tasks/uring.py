@@ -0,0 +1,168 @@
+"""A SyscallInterface which makes I/O syscalls in our own process through an io_uring
+
+The local thread makes its syscalls directly, which blocks the whole Python interpreter
+until the syscall returns; that's fine for most syscalls, which return promptly, but
+I/O can take arbitrarily long. An io_uring lets us instead queue up I/O requests, have
+the kernel perform them asynchronously, and collect the results when they're done,
+waiting for them with trio like any other event.
+
+io_uring performs requests in the fd table and address space of the process which
+submits them, which is always our own process; so this only makes sense for threads
+whose syscalls are made in our own process, which in practice means the local thread.
+Other threads on the same host already avoid most per-syscall overhead with
+RingSyscallConnection.
+
+"""
+from __future__ import annotations
+from rsyscall._raw import ffi, lib # type: ignore
+from rsyscall.concurrency import OneAtATime
+from rsyscall.near.sysif import SyscallInterface, SyscallResponse
+from rsyscall.tasks.util import log_syscall, raise_if_error
+import errno
+import logging
+import os
+import trio
+import typing as t
+if t.TYPE_CHECKING:
+    from rsyscall.handle import FileDescriptor
+    from rsyscall.thread import Thread
+
+__all__ = [
+    "UringSyscall",
+    "use_uring",
+]
+
+logger = logging.getLogger(__name__)
+
+class UringSyscallResponse(SyscallResponse):
+    "A pending response to a syscall submitted through an io_uring"
+    def __init__(self, sysif: UringSyscall) -> None:
+        self.sysif = sysif
+        self.result: t.Optional[int] = None
+
+    async def receive(self) -> int:
+        while self.result is None:
+            await self.sysif._process_completions()
+        raise_if_error(self.result)
+        return self.result
+
+class UringSyscall(SyscallInterface):
+    """Makes syscalls in our own process, sending I/O syscalls through an io_uring
+
+    The syscalls which io_uring supports (read, write, readv, writev, accept4, connect,
+    sendmsg, recvmsg, openat, close and fsync) are queued on the ring, and all the
+    requests queued by the time someone waits for a response are submitted to the
+    kernel together. Everything else is passed to `fallback`, after submitting any
+    queued requests so that they're at least started first; that includes I/O on
+    nonblocking fds, which io_uring would wait on instead of failing with EAGAIN.
+
+    Requests on the ring are performed asynchronously, so a blocking read doesn't block
+    the interpreter; but that also means they aren't necessarily performed in order.
+    Callers which wait for each response before making the next syscall, as `syscall`
+    does, don't notice.
+
+    """
+    completions_per_call = 64
+    "The most completions we'll collect at once"
+
+    def __init__(self, ring: t.Any, fallback: SyscallInterface) -> None:
+        self.ring = ring
+        self.fallback = fallback
+        self.logger = logger
+        self.pid = os.getpid()
+        self.request_buf = ffi.new('struct rsyscall_syscall*')
+        self.user_data_buf = ffi.new('uint64_t[]', self.completions_per_call)
+        self.results_buf = ffi.new('int64_t[]', self.completions_per_call)
+        self.next_user_data = 0
+        self.pending: t.Dict[int, UringSyscallResponse] = {}
+        self.processing = OneAtATime()
+        self.waiting = False
+
+    @staticmethod
+    def make(fallback: SyscallInterface, entries: int=64) -> UringSyscall:
+        "Set up an io_uring with room for `entries` queued requests"
+        ring = ffi.new('struct rsyscall_uring*')
+        raise_if_error(lib.rsyscall_uring_setup(ring, entries))
+        return UringSyscall(ring, fallback)
+
+    def get_activity_fd(self) -> t.Optional[FileDescriptor]:
+        return self.fallback.get_activity_fd()
+
+    async def close_interface(self) -> None:
+        if self.pending:
+            raise Exception("can't close while there are pending requests", self.pending)
+        lib.rsyscall_uring_close(self.ring)
+        await self.fallback.close_interface()
+
+    async def submit_syscall(self, number, arg1=0, arg2=0, arg3=0, arg4=0, arg5=0, arg6=0) -> SyscallResponse:
+        self.request_buf.sys = number
+        self.request_buf.args = (int(arg1), int(arg2), int(arg3), int(arg4), int(arg5), int(arg6))
+        user_data = self.next_user_data
+        while True:
+            ret = lib.rsyscall_uring_prep(self.ring, self.request_buf, user_data)
+            if ret > 0:
+                break
+            elif ret == -errno.ENOSYS:
+                self._enter()
+                return await self.fallback.submit_syscall(number, arg1, arg2, arg3, arg4, arg5, arg6)
+            # the submission queue is full; submitting it makes room
+            self._enter()
+        log_syscall(self.logger, number, arg1, arg2, arg3, arg4, arg5, arg6)
+        self.next_user_data += 1
+        response = UringSyscallResponse(self)
+        self.pending[user_data] = response
+        if self.metrics is not None:
+            self.metrics.record_depth(len(self.pending))
+        if self.waiting:
+            # whoever's waiting for completions won't notice this request, so submit it now
+            self._enter()
+        return response
+
+    def _enter(self) -> None:
+        "Submit all the queued requests to the kernel"
+        while self.ring.unsubmitted:
+            ret = lib.rsyscall_uring_enter(self.ring)
+            if ret in (-errno.EAGAIN, -errno.EBUSY):
+                # the kernel wants us to collect some completions first
+                self._collect()
+            elif ret != -errno.EINTR:
+                raise_if_error(ret)
+
+    def _collect(self) -> int:
+        "Set the results of all the completed requests, returning how many there were"
+        total = 0
+        while True:
+            count = lib.rsyscall_uring_collect(self.ring, self.user_data_buf, self.results_buf,
+                                               self.completions_per_call)
+            for i in range(count):
+                self.pending.pop(self.user_data_buf[i]).result = self.results_buf[i]
+            total += count
+            if count < self.completions_per_call:
+                return total
+
+    async def _process_completions(self) -> None:
+        async with self.processing.needs_run() as needs_run:
+            if needs_run:
+                if self.ring.unsubmitted:
+                    # let other coroutines queue up their requests, so we submit them all at once
+                    await trio.hazmat.checkpoint()
+                    self._enter()
+                self.waiting = True
+                try:
+                    while not self._collect():
+                        await trio.hazmat.wait_readable(self.ring.fd)
+                finally:
+                    self.waiting = False
+
+def use_uring(thread: Thread, entries: int=64) -> UringSyscall:
+    """Make this thread's I/O syscalls through an io_uring
+
+    The thread must make its syscalls in our own process; see the module docstring.
+
+    """
+    task = thread.task
+    if task.process.near.id != os.getpid():
+        raise Exception("io_uring can only make syscalls in our own process, not", task.process)
+    sysif = UringSyscall.make(task.sysif, entries)
+    task.sysif = sysif
+    return sysif
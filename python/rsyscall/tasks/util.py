@@ -1,4 +1,7 @@
 import os
+import typing as t
+if t.TYPE_CHECKING:
+    from rsyscall.handle import Task
 
 def raise_if_error(response: int) -> None:
     "Raise an OSError if this integer is in the error range for syscall return values"
@@ -6,6 +9,12 @@ def raise_if_error(response: int) -> None:
         err = -response
         raise OSError(err, os.strerror(err))
 
+def is_local(task: "Task") -> bool:
+    "Whether syscalls on this task are made directly in our own Python thread"
+    from rsyscall.tasks.local import LocalSyscall
+    from rsyscall.tasks.uring import UringSyscall
+    return isinstance(task.sysif, (LocalSyscall, UringSyscall))
+
 def log_syscall(logger, number, arg1, arg2, arg3, arg4, arg5, arg6) -> None:
     "Log this syscall prettily"
     if arg6 == 0:
@@ -0,0 +1,57 @@
+import unittest
+from rsyscall.handle import MemoryMapping, Task
+from rsyscall.memory.allocator import Arena, OutOfSpaceError
+import rsyscall.far as far
+import rsyscall.near.types as near
+import typing as t
+
+def fake_mapping(length: int) -> MemoryMapping:
+    "A mapping which is never touched, for exercising the Arena's bookkeeping alone"
+    return MemoryMapping(t.cast(Task, None), near.MemoryMapping(0, length, 4096), far.File())
+
+class TestArena(unittest.TestCase):
+    def test_fill(self) -> None:
+        arena = Arena(fake_mapping(4096))
+        alloc = arena.allocate(4096, 16)
+        with self.assertRaises(OutOfSpaceError):
+            arena.allocate(1, 1)
+        alloc.free()
+        self.assertEqual(arena.allocate(4096, 16).size(), 4096)
+
+    def test_alignment(self) -> None:
+        arena = Arena(fake_mapping(4096))
+        first = arena.allocate(1, 1)
+        second = arena.allocate(1, 64)
+        self.assertEqual(second.offset() % 64, 0)
+        self.assertNotEqual(first.offset(), second.offset())
+
+    def test_coalesce(self) -> None:
+        arena = Arena(fake_mapping(4096))
+        allocs = [arena.allocate(1024, 1) for _ in range(4)]
+        for alloc in allocs[::2] + allocs[1::2]:
+            alloc.free()
+        self.assertEqual(arena.free_by_start, {0: 4096})
+
+    def test_split_merge(self) -> None:
+        arena = Arena(fake_mapping(4096))
+        first, second = arena.allocate(4096, 1).split(1000)
+        self.assertEqual((first.size(), second.size()), (1000, 3096))
+        merged = first.merge(second)
+        self.assertEqual(merged.size(), 4096)
+        merged.free()
+        self.assertEqual(arena.free_by_start, {0: 4096})
+
+    def test_fit_in_lower_class(self) -> None:
+        "An extent well below the size class that's sure to fit is still used if it fits"
+        arena = Arena(fake_mapping(4096))
+        first = arena.allocate(100, 64)
+        rest = arena.allocate(4096 - 100, 1)
+        first.free()
+        self.assertEqual(arena.allocate(100, 64).offset(), 0)
+        # a lower-class extent which is too small once aligned doesn't fit
+        arena = Arena(fake_mapping(4096))
+        first, second = arena.allocate(4096, 1).split(1)
+        middle, rest = second.split(100)
+        middle.free()
+        with self.assertRaises(OutOfSpaceError):
+            arena.allocate(100, 64)
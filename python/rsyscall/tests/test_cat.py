@@ -1,6 +1,11 @@
+from rsyscall._raw import lib # type: ignore
 from rsyscall.trio_test_case import TrioTestCase
 import rsyscall.tasks.local as local
 
+from rsyscall.command import Command
+from rsyscall.near.sysif import CHAIN_MAX
+from rsyscall.path import Path
+from rsyscall.signal import Sigset
 from rsyscall.unistd import Pipe
 from rsyscall.fcntl import O
 
@@ -36,3 +41,58 @@ class TestCat(TrioTestCase):
         
         await self.pipe_in.write.close()
         await self.child.check()
+
+class TestSpawn(TrioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.thr = local.thread
+        self.pipe_out = await (await self.thr.task.pipe(await self.thr.ram.malloc(Pipe))).read()
+
+    async def test_spawn(self) -> None:
+        tmpdir = await self.thr.mkdtemp()
+        async with tmpdir:
+            child = await self.thr.spawn(
+                self.thr.environ.sh.args('-c', 'echo "$FOO" && pwd'),
+                fds={1: self.pipe_out.write}, cwd=tmpdir.path, env={'FOO': 'bar'})
+            await self.pipe_out.write.close()
+            await child.check()
+            out = await self.thr.read_to_eof(self.pipe_out.read)
+            self.assertEqual(out, b"bar\n" + bytes(tmpdir.path) + b"\n")
+
+    async def test_spawn_many_fds(self) -> None:
+        "Spawning with more fds than fit in CHAIN_MAX, or in the ring of a forked thread, works"
+        last = max(CHAIN_MAX, lib.RSYSCALL_RING_SIZE) + 8
+        fds = {num: self.pipe_out.write for num in range(3, last+1)}
+        child = await self.thr.spawn(
+            self.thr.environ.sh.args('-c', f'test -e /proc/self/fd/{last} && echo ok'),
+            fds={1: self.pipe_out.write, **fds})
+        await self.pipe_out.write.close()
+        await child.check()
+        self.assertEqual(await self.thr.read_to_eof(self.pipe_out.read), b"ok\n")
+
+    async def test_setup_and_exec_handles(self) -> None:
+        "Like unshare_files_and_replace, setup_and_exec consumes its copies of the source fds"
+        thread = await self.thr.fork()
+        child = await thread.setup_and_exec(self.thr.environ.sh.args('-c', 'echo hi'),
+                                            fds={thread.stdout: self.pipe_out.write})
+        self.assertTrue(thread.stdout.valid)
+        self.assertEqual([fd for fd in thread.task.fd_handles if fd.near == self.pipe_out.write.near], [])
+        await self.pipe_out.write.close()
+        await child.check()
+        self.assertEqual(await self.thr.read_to_eof(self.pipe_out.read), b"hi\n")
+
+    async def test_spawn_bad_cwd(self) -> None:
+        with self.assertRaises(FileNotFoundError):
+            await self.thr.spawn(self.thr.environ.sh.args('-c', 'true'), cwd=Path("/nonexistent"))
+
+    async def test_spawn_noent(self) -> None:
+        with self.assertRaises(FileNotFoundError):
+            await self.thr.spawn(Command(Path("/nonexistent"), ["nonexistent"], {}))
+
+    async def test_setup_and_exec_failed_sigmask(self) -> None:
+        "If the exec fails after setup changed our signal mask, we still track the new mask"
+        thread = await self.thr.fork()
+        with self.assertRaises(FileNotFoundError):
+            await thread.setup_and_exec(Command(Path("/nonexistent"), ["nonexistent"], {}))
+        oldset = await thread.task.sigprocmask(None, await thread.ram.malloc(Sigset))
+        self.assertEqual(await oldset.read(), thread.task.sigmask)
+        await thread.exit(0)
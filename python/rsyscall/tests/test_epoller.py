@@ -6,6 +6,10 @@ from rsyscall.epoller import *
 import trio
 
 from rsyscall.tests.utils import do_async_things
+from rsyscall.unistd import Pipe
+from rsyscall.sys.epoll import EPOLL
+from rsyscall.fcntl import O
+import typing as t
 
 class TestEpoller(TrioTestCase):
     async def asyncSetUp(self) -> None:
@@ -25,3 +29,61 @@ class TestEpoller(TrioTestCase):
         async with trio.open_nursery() as nursery:
             nursery.start_soon(do_async_things, self, epoller, thread)
             nursery.start_soon(do_async_things, self, thread.epoller, thread)
+
+    async def test_adaptive_maxevents(self) -> None:
+        thread = await self.thr.fork()
+        async with thread:
+            epoller = await Epoller.make_root(thread.ram, thread.task)
+            waiter = epoller.epoll_waiter
+            pipes = [await (await thread.task.pipe(await thread.ram.malloc(Pipe))).read()
+                     for _ in range(waiter.min_maxevents * 2)]
+            ready: t.List[EPOLL] = []
+            for pipe in pipes:
+                await epoller.register(pipe.write, EPOLL.OUT|EPOLL.ET, ready.append)
+            await waiter.do_wait()
+            self.assertEqual(waiter.full_waits, 1)
+            self.assertEqual(waiter.maxevents, waiter.min_maxevents * 2)
+            await waiter.do_wait()
+            self.assertEqual(len(ready), len(pipes))
+            # the level-triggered activity fd is also returned by each wait
+            self.assertEqual(waiter.events, len(pipes) + waiter.waits)
+
+    async def test_read_buffer(self) -> None:
+        pipe = await (await self.thr.task.pipe(await self.thr.ram.malloc(Pipe), O.NONBLOCK)).read()
+        async_read = await self.thr.make_afd(pipe.read, nonblock=True)
+        buf = AsyncReadBuffer(async_read)
+        records = [str(i).encode() * (i % 7) for i in range(1000)]
+        data = b"".join(b"%d:%s,%s\n" % (len(record), record, record) for record in records)
+        async with trio.open_nursery() as nursery:
+            @nursery.start_soon
+            async def write() -> None:
+                async_write = await self.thr.make_afd(pipe.write)
+                await async_write.write_all_bytes(data)
+                await async_write.handle.close()
+            for record in records:
+                self.assertEqual(await buf.read_netstring(), record)
+                self.assertEqual(await buf.read_line(), record)
+            self.assertIsNone(await buf.read_length(1))
+        # the consumed prefix of the bytearray has been discarded
+        self.assertEqual(len(buf.buf), 0)
+        await async_read.close()
+
+    async def test_write_all_full_pipe(self) -> None:
+        "write_all waits for the fd to become writable again when the pipe fills up"
+        pipe = await (await self.thr.task.pipe(await self.thr.ram.malloc(Pipe), O.NONBLOCK)).read()
+        async_read = await self.thr.make_afd(pipe.read, nonblock=True)
+        async_write = await self.thr.make_afd(pipe.write, nonblock=True)
+        data = b"x" * (1024 * 1024)
+        async with trio.open_nursery() as nursery:
+            @nursery.start_soon
+            async def write() -> None:
+                await async_write.write_all_bytes(data)
+                await async_write.close()
+            received = b""
+            while True:
+                chunk = await async_read.read_some_bytes(65536)
+                if not chunk:
+                    break
+                received += chunk
+            self.assertEqual(received, data)
+        await async_read.close()
@@ -3,10 +3,14 @@ from __future__ import annotations
 from rsyscall.trio_test_case import TrioTestCase
 from rsyscall.nix import local_store
 from rsyscall.tasks.exec import *
+from rsyscall.memory.process_vm_transport import ProcessVMMemoryTransport
+from rsyscall.memory.shared_transport import SharedMemoryTransport
+from rsyscall.memory.socket_transport import SocketMemoryTransport
+from rsyscall.sys.uio import IOV_MAX
 
 import rsyscall.tasks.local as local
 
-from rsyscall.tests.utils import assert_thread_works
+from rsyscall.tests.utils import assert_thread_works, do_syscall_chain
 
 class TestExec(TrioTestCase):
     async def asyncSetUp(self) -> None:
@@ -26,9 +30,84 @@ class TestExec(TrioTestCase):
     async def test_basic(self) -> None:
         await assert_thread_works(self, self.child)
 
+    async def test_syscall_chain(self) -> None:
+        thread = await self.local.fork()
+        async with thread:
+            await rsyscall_exec(self.local, thread, self.executables)
+            await do_syscall_chain(self, thread)
+
     async def test_nest(self) -> None:
         thread = await self.child.fork()
         async with thread:
             await rsyscall_exec(self.child, thread, self.executables)
             await assert_thread_works(self, thread)
     
+
+    async def test_process_vm_transport(self) -> None:
+        thread = await self.local.fork()
+        async with thread:
+            await rsyscall_exec(self.local, thread, self.executables)
+            transport = thread.ram.transport.fallback
+            self.assertIsInstance(transport, ProcessVMMemoryTransport)
+            data = bytes(range(256)) * 1024
+            ptrs = [await thread.ram.ptr(data), await thread.ram.ptr(b"small")]
+            self.assertEqual(await transport.batch_read(ptrs), [data, b"small"])
+
+    async def test_shared_transport(self) -> None:
+        thread = await self.local.fork()
+        async with thread:
+            await rsyscall_exec(self.local, thread, self.executables)
+            self.assertIsInstance(thread.ram.transport, SharedMemoryTransport)
+            ptr = await thread.ram.ptr(b"hello world")
+            self.assertIn(ptr.mapping.file, thread.ram.transport.mappings)
+            self.assertEqual(await ptr.read(), b"hello world")
+            await assert_thread_works(self, thread)
+
+    async def test_shared_arena_unmapped_after_exec(self) -> None:
+        thread = await self.local.fork()
+        await rsyscall_exec(self.local, thread, self.executables)
+        transport = thread.ram.transport
+        self.assertIsInstance(transport, SharedMemoryTransport)
+        [file] = transport.mappings
+        child = await thread.exec(self.local.environ.sh.args('-c', 'true'))
+        # once the child has left its address space, we stop serving it and unmap our side
+        self.assertNotIn(file, transport.mappings)
+        await child.check()
+
+    async def test_socket_transport_batch_read(self) -> None:
+        thread = await self.local.fork()
+        async with thread:
+            await rsyscall_exec(self.local, thread, self.executables)
+            transport = thread.ram.transport.fallback.fallback
+            self.assertIsInstance(transport, SocketMemoryTransport)
+            ptrs = [await thread.ram.ptr(bytes([i])*64) for i in range(10)]
+            # non-adjacent reads, so they can't be merged into one read
+            ptrs = ptrs[::2]
+            self.assertEqual(await transport.batch_read(ptrs), [bytes([i])*64 for i in range(0, 10, 2)])
+
+    async def test_socket_transport_many_ops(self) -> None:
+        thread = await self.local.fork()
+        async with thread:
+            await rsyscall_exec(self.local, thread, self.executables)
+            transport = thread.ram.transport.fallback.fallback
+            self.assertIsInstance(transport, SocketMemoryTransport)
+            count = IOV_MAX * 2 + 10
+            rest = await thread.ram.malloc(bytes, count * 2)
+            ptrs = []
+            for _ in range(count):
+                # keep every other byte, so the ops can't be merged
+                ptr, rest = rest.split(1)
+                ptrs.append(ptr)
+                _, rest = rest.split(1)
+            data = [bytes([i % 256]) for i in range(count)]
+            await transport.batch_write(list(zip(ptrs, data)))
+            self.assertEqual(await transport.batch_read(ptrs), data)
+
+    async def test_const_ptr_after_exec(self) -> None:
+        thread = await self.local.fork()
+        async with thread:
+            ptr = await thread.ram.const_ptr(b"hello")
+            await rsyscall_exec(self.local, thread, self.executables)
+            new_ptr = await thread.ram.const_ptr(b"hello")
+            self.assertIsNot(new_ptr, ptr)
+            self.assertEqual(await new_ptr.read(), b"hello")
@@ -1,11 +1,23 @@
+import errno
+import subprocess
+import unittest
+from rsyscall._raw import lib # type: ignore
 from rsyscall.trio_test_case import TrioTestCase
 import rsyscall.tasks.local as local
-from rsyscall.tests.utils import do_async_things
+import trio
+from rsyscall.tests.utils import do_async_things, do_syscall_chain
 from rsyscall.epoller import Epoller
-from rsyscall.monitor import AsyncSignalfd
+from rsyscall.monitor import AsyncSignalfd, ChildProcessMonitor
+from rsyscall.handle import Stack
+from rsyscall.loader import Trampoline
+from rsyscall.sched import CLONE
+from rsyscall.tasks.connection import RingSyscallConnection
+from rsyscall.tasks.fork import WatchedFutex
 
 from rsyscall.signal import SIG, Sigset
 from rsyscall.sys.signalfd import SignalfdSiginfo
+from rsyscall.sys.syscall import SYS
+from rsyscall.sys.wait import W
 
 class TestFork(TrioTestCase):
     async def asyncSetUp(self) -> None:
@@ -41,6 +53,48 @@ class TestFork(TrioTestCase):
             await thread.unshare_files()
             await do_async_things(self, epoller, thread)
 
+    async def test_ring(self) -> None:
+        self.assertIsInstance(self.thr.task.sysif.rsyscall_connection, RingSyscallConnection)
+        # more concurrent syscalls than fit in the ring at once
+        async with trio.open_nursery() as nursery:
+            for _ in range(lib.RSYSCALL_RING_SIZE * 3):
+                nursery.start_soon(self.thr.task.getuid)
+        # a chain longer than the ring stays intact, even with other syscalls competing
+        async def long_chain() -> None:
+            failed, *skipped = await self.thr.task.sysif.syscall_chain(
+                [(SYS.close, -1)] + [(SYS.getuid,)] * (lib.RSYSCALL_RING_SIZE * 3))
+            self.assertEqual(failed.errno, errno.EBADF)
+            self.assertEqual({result.errno for result in skipped}, {errno.ECANCELED})
+        async with trio.open_nursery() as nursery:
+            for _ in range(lib.RSYSCALL_RING_SIZE):
+                nursery.start_soon(self.thr.task.getuid)
+            nursery.start_soon(long_chain)
+            for _ in range(lib.RSYSCALL_RING_SIZE):
+                nursery.start_soon(self.thr.task.getuid)
+
+    async def test_ring_unmapped(self) -> None:
+        "The ring is unmapped once the server exits or execs"
+        def mapped(address: int) -> bool:
+            with open("/proc/self/maps") as maps:
+                return any(int(line.split("-")[0], 16) == address for line in maps)
+        for leave in [lambda thr: thr.exit(0),
+                      lambda thr: thr.exec(thr.environ.sh.args('-c', 'true'))]:
+            thr = await self.local.fork()
+            connection = thr.task.sysif.rsyscall_connection
+            address = int(connection.ring_mapping.near.address)
+            self.assertTrue(mapped(address))
+            await leave(thr)
+            self.assertIsNone(connection.ring_mapping)
+            self.assertFalse(mapped(address))
+
+    async def test_syscall_chain(self) -> None:
+        await do_syscall_chain(self, self.local)
+        # chains must stay intact when the ring fills up, so run lots of them concurrently
+        async with trio.open_nursery() as nursery:
+            for _ in range(lib.RSYSCALL_RING_SIZE):
+                nursery.start_soon(do_syscall_chain, self, self.thr)
+                nursery.start_soon(self.thr.task.getuid)
+
     async def test_exec(self) -> None:
         child = await self.thr.exec(self.thr.environ.sh.args('-c', 'true'))
         await child.check()
@@ -57,3 +111,74 @@ class TestFork(TrioTestCase):
         buf = await self.thr.ram.malloc(SignalfdSiginfo)
         sigdata, _ = await sigfd.afd.read(buf)
         self.assertEqual((await sigdata.read()).signo, SIG.INT)
+
+    async def test_const_ptr(self) -> None:
+        ptr = await self.local.ram.const_ptr(Sigset({SIG.INT}))
+        self.assertIs(await self.thr.ram.const_ptr(Sigset({SIG.INT})), ptr)
+        self.assertIsNot(await self.thr.ram.const_ptr(Sigset({SIG.TERM})), ptr)
+        self.assertEqual(await ptr.read(), Sigset({SIG.INT}))
+
+    async def test_reap_many(self) -> None:
+        children = [await (await self.thr.fork()).exec(self.thr.environ.sh.args('-c', f'exit {i}'))
+                    for i in range(8)]
+        reaper = self.thr.monitor.reaper
+        for i, child in reversed(list(enumerate(children))):
+            self.assertEqual((await child.waitpid(W.EXITED)).exit_status, i)
+        for child in children:
+            self.assertNotIn(child.process.near.id, reaper.children)
+
+    async def test_stop_continue_unwaited(self) -> None:
+        "We only keep the latest stop or continue of a child nobody is waiting on"
+        child = await (await self.thr.fork()).exec(self.thr.environ.sh.args('-c', 'exec sleep inf'))
+        async def reap_until(options: W) -> None:
+            # waiting on some other child reaps every child, including this one
+            while child.state_change is None or not child.state_change.state(options):
+                await (await (await self.thr.fork()).exec(self.thr.environ.sh.args('-c', 'true'))).check()
+        async with child:
+            for _ in range(3):
+                await child.kill(SIG.STOP)
+                await reap_until(W.STOPPED)
+                await child.kill(SIG.CONT)
+                await reap_until(W.CONTINUED)
+            with trio.move_on_after(0.1) as cancel_scope:
+                await child.waitpid(W.STOPPED)
+            self.assertTrue(cancel_scope.cancelled_caught)
+            self.assertTrue((await child.waitpid(W.CONTINUED)).state(W.CONTINUED))
+
+    async def test_subprocess_alongside(self) -> None:
+        "Reaping our children on the local thread leaves other children of the process alone"
+        popen = subprocess.Popen(["sh", "-c", "exit 3"])
+        child = await self.local.spawn(self.local.environ.sh.args('-c', 'sleep 0.2'))
+        # by the time our child exits and we reap it, the subprocess has exited too
+        await child.check()
+        self.assertEqual(popen.wait(), 3)
+
+    async def test_pidfd_monitor(self) -> None:
+        # the epoller is waited on by the local thread, which is fine for pidfds
+        monitor = await ChildProcessMonitor.make_pidfd(self.thr.ram, self.thr.task, self.thr.epoller)
+        # with no connection, the rsyscall server returns immediately, and the trampoline exits
+        stack_value = self.thr.loader.make_trampoline_stack(Trampoline(self.thr.loader.server_func, [-1, -1]))
+        stack = await (await self.thr.ram.malloc(Stack, 4096)).write_to_end(stack_value, alignment=16)
+        child = await monitor.clone(CLONE.VM|CLONE.FILES, stack)
+        with self.assertRaises(ValueError):
+            await child.waitpid(W.STOPPED)
+        await child.check()
+        self.assertIsNotNone(child.process.death_state)
+
+    async def test_shared_futex_waiter(self) -> None:
+        watcher = self.thr.futex_watcher
+        self.assertIs(watcher, self.local.futex_watcher)
+        threads = [await self.thr.fork() for _ in range(4)]
+        if not watcher.supported:
+            raise unittest.SkipTest("Requires futex_waitv")
+        for thread in threads:
+            self.assertIsInstance(thread.task.sysif.futex, WatchedFutex)
+            self.assertIs(thread.futex_watcher, watcher)
+        # all the ctid futexes are watched by one thread, not a process each
+        self.assertEqual(len(watcher.waiters), 1)
+        # and exec and exit are still detected
+        children = [await thread.exec(self.thr.environ.sh.args('-c', 'true')) for thread in threads[:2]]
+        for child in children:
+            await child.check()
+        for thread in threads[2:]:
+            await thread.exit(0)
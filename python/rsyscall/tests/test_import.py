@@ -0,0 +1,66 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import unittest
+
+def run_python(code: str) -> str:
+    "Run this code in a new Python interpreter, which can import rsyscall, and return its stdout"
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)}
+    # if an earlier test created the local thread, SIGCHLD is blocked here; a fresh
+    # interpreter wouldn't start with it blocked, so don't let it inherit our mask
+    return subprocess.run([sys.executable, "-W", "ignore", "-c", code],
+                          env=env, stdout=subprocess.PIPE, check=True,
+                          preexec_fn=lambda: signal.pthread_sigmask(signal.SIG_SETMASK, []),
+    ).stdout.decode()
+
+class TestImport(unittest.TestCase):
+    # generous, so that this only fails if importing starts doing real work
+    budget = 2.0
+
+    def test_import_is_cheap(self) -> None:
+        "Importing rsyscall neither creates the local thread nor has other side effects"
+        result = json.loads(run_python("""if True:
+            import json, signal, sys, time
+            start = time.perf_counter()
+            import rsyscall.tasks.local, rsyscall.nix, rsyscall.wish
+            elapsed = time.perf_counter() - start
+            print(json.dumps({
+                "elapsed": elapsed,
+                "initialized": rsyscall.tasks.local._thread is not None,
+                "readline": "readline" in sys.modules,
+                "sigchld_blocked": signal.SIGCHLD in signal.pthread_sigmask(signal.SIG_BLOCK, []),
+            }))
+        """))
+        self.assertFalse(result["initialized"])
+        self.assertFalse(result["readline"])
+        self.assertFalse(result["sigchld_blocked"])
+        self.assertLess(result["elapsed"], self.budget)
+
+    def test_lazy_in_trio(self) -> None:
+        "The local thread can be first accessed from inside a trio run, and can then wait for children"
+        output = run_python("""if True:
+            import rsyscall.tasks.local as local
+            from rsyscall.sys.wait import W
+            import trio
+            async def main():
+                thread = local.thread
+                child = await thread.spawn(await thread.environ.which("true"))
+                print((await child.waitpid(W.EXITED)).exit_status)
+            trio.run(main)
+        """)
+        self.assertEqual(output, "0\n")
+
+    def test_readline_imported_later(self) -> None:
+        "readline's SIGWINCH handler is wiped even if readline is imported after the local thread is created"
+        output = run_python("""if True:
+            import rsyscall.tasks.local as local
+            def sigwinch_caught() -> bool:
+                caught = [line.split()[1] for line in open("/proc/self/status") if line.startswith("SigCgt:")]
+                return bool(int(caught[0], 16) & (1 << 27))
+            local.thread
+            import readline
+            print(sigwinch_caught())
+        """)
+        self.assertEqual(output, "False\n")
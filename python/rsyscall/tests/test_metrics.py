@@ -0,0 +1,40 @@
+from rsyscall.trio_test_case import TrioTestCase
+import rsyscall.tasks.local as local
+from rsyscall.metrics import enable_metrics, disable_metrics, prometheus_text
+from rsyscall.tests.utils import do_syscall_chain
+from rsyscall.sys.syscall import SYS
+import trio
+
+class TestMetrics(TrioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.local = local.thread
+        self.thr = await self.local.fork()
+        self.metrics = enable_metrics(self.thr.task)
+
+    async def asyncTearDown(self) -> None:
+        disable_metrics(self.thr.task)
+        await self.thr.close()
+
+    async def test_metrics(self) -> None:
+        for _ in range(5):
+            await self.thr.task.getuid()
+        await do_syscall_chain(self, self.thr)
+        stats = self.metrics.stats()
+        self.assertGreaterEqual(stats[SYS.getuid].count, 5)
+        self.assertEqual(stats[SYS.getuid].errors, 0)
+        # the second close in the chain fails with EBADF
+        self.assertGreaterEqual(stats[SYS.close].errors, 1)
+        self.assertGreater(stats[SYS.getuid].latency.sum, 0)
+
+        text = prometheus_text()
+        pid = self.thr.task.process.near.id
+        self.assertIn(f'rsyscall_syscall_seconds_count{{pid="{pid}",syscall="getuid"}}', text)
+        self.assertIn(f'rsyscall_syscall_seconds_bucket{{pid="{pid}",syscall="getuid",le="+Inf"}}', text)
+        self.assertIn(f'rsyscall_syscall_errors_total{{pid="{pid}",syscall="close"}}', text)
+
+    async def test_pipeline_depth(self) -> None:
+        async with trio.open_nursery() as nursery:
+            for _ in range(10):
+                nursery.start_soon(self.thr.task.getuid)
+        self.assertGreater(sum(self.metrics.depth.counts[1:]), 0)
+        self.assertIn("rsyscall_pipeline_depth_count", self.metrics.prometheus())
@@ -8,9 +8,13 @@ from rsyscall.tasks.exec import *
 import rsyscall.tasks.local as local
 
 from rsyscall.thread import do_cloexec_except
+from rsyscall.handle import fd_table_to_garbage, fd_table_to_near_to_handles, run_fd_table_gc
 
 from rsyscall.tests.utils import do_async_things
-from rsyscall.fcntl import O
+from rsyscall.fcntl import O, F
+from rsyscall.path import Path
+import errno
+import rsyscall.near as near
 from rsyscall.unistd import Pipe
 
 class TestMisc(TrioTestCase):
@@ -23,14 +27,56 @@ class TestMisc(TrioTestCase):
     async def asyncTearDown(self) -> None:
         await self.thr.close()
 
+    async def test_fd_gc(self) -> None:
+        pipe = await (await self.thr.task.pipe(await self.thr.ram.malloc(Pipe))).read()
+        read_near, write = pipe.read.near, pipe.write
+        # dropping the last reference to the read side puts it on the garbage list
+        del pipe
+        fd_table = self.thr.task.fd_table
+        self.assertIn(read_near, fd_table_to_garbage[fd_table])
+        await run_fd_table_gc(fd_table)
+        self.assertNotIn(read_near, fd_table_to_near_to_handles[fd_table])
+        with self.assertRaises(BrokenPipeError):
+            await write.write(await self.thr.ram.ptr(b"foo"))
+
+    async def test_fd_gc_many(self) -> None:
+        path = await self.thr.ram.ptr(Path("/dev/null"))
+        fds = [await self.thr.task.open(path, O.RDONLY) for _ in range(40)]
+        nears = [fd.near for fd in fds]
+        del fds
+        await run_fd_table_gc(self.thr.task.fd_table)
+        for fd in nears:
+            with self.assertRaises(OSError) as cm:
+                await near.fcntl(self.thr.task.sysif, fd, F.GETFD)
+            self.assertEqual(cm.exception.errno, errno.EBADF)
+
+    async def test_fd_gc_without_close_range(self) -> None:
+        "Without close_range, each fd is closed individually; other interfaces still use close_range"
+        self.thr.task.sysif.have_close_range = False
+        self.assertTrue(self.local.task.sysif.have_close_range)
+        path = await self.thr.ram.ptr(Path("/dev/null"))
+        fds = [await self.thr.task.open(path, O.RDONLY) for _ in range(8)]
+        nears = [fd.near for fd in fds]
+        del fds
+        await run_fd_table_gc(self.thr.task.fd_table)
+        for fd in nears:
+            with self.assertRaises(OSError) as cm:
+                await near.fcntl(self.thr.task.sysif, fd, F.GETFD)
+            self.assertEqual(cm.exception.errno, errno.EBADF)
+
     async def test_do_cloexec_except(self) -> None:
         # do_cloexec_except breaks trio when run locally
         await rsyscall_exec(self.local, self.thr, self.executables)
 
         pipe = await (await self.thr.task.pipe(await self.thr.ram.malloc(Pipe))).read()
+        kept = await (await self.thr.task.pipe(await self.thr.ram.malloc(Pipe))).read()
+        await kept.write.disable_cloexec()
         close_set = set([fd.near for fd in self.thr.task.fd_handles])
         close_set.remove(pipe.read.near)
+        close_set.remove(kept.write.near)
         await do_cloexec_except(self.thr, close_set)
+        # this fd isn't CLOEXEC, so it wasn't closed
+        self.assertEqual(await kept.write.fcntl(F.GETFD), 0)
 
         data = await self.thr.ram.ptr(b"foo")
         with self.assertRaises(OSError):
@@ -0,0 +1,31 @@
+from rsyscall.trio_test_case import TrioTestCase
+import rsyscall.tasks.local as local
+from rsyscall.tasks.pool import ThreadPool, make_thread_pool
+from rsyscall.tests.utils import assert_thread_works
+import trio
+
+class TestPool(TrioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.thr = local.thread
+
+    async def test_run(self) -> None:
+        async with make_thread_pool(self.thr, 2) as pool:
+            for i in range(5):
+                state = await pool.run(self.thr.environ.sh.args('-c', f'exit {i}'), check=False)
+                self.assertEqual(state.exit_status, i)
+
+    async def test_take(self) -> None:
+        async with make_thread_pool(self.thr, 1) as pool:
+            thread = await pool.take()
+            async with thread:
+                await assert_thread_works(self, thread)
+
+    async def test_refill(self) -> None:
+        pool = ThreadPool(self.thr, 3)
+        async with trio.open_nursery() as nursery:
+            await nursery.start(pool.start)
+            while pool.receive.statistics().current_buffer_used < 2:
+                await trio.sleep(0.01)
+            nursery.cancel_scope.cancel()
+        await pool.close()
+        self.assertEqual(pool.receive.statistics().current_buffer_used, 0)
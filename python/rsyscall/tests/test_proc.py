@@ -47,5 +47,6 @@ class TestProc(TrioTestCase):
         pg_two = await self.init.fork()
         with self.assertRaises(ProcessLookupError):
             await self.init.task._make_process(2).kill(SIG.NONE)
-        # Linux skips right over process 2, even though it's dead, because it's still used by the process group
-        self.assertEqual(int(pg_two.task.process.near), 3)
+        # Linux skips right over process 2, even though it's dead, because it's still used by the process group;
+        # and process 3 is pgflr.
+        self.assertEqual(int(pg_two.task.process.near), 4)
@@ -0,0 +1,60 @@
+from rsyscall.trio_test_case import TrioTestCase
+from rsyscall.nix import local_store
+from rsyscall.tasks.exec import RsyscallServerExecutable, rsyscall_exec
+from rsyscall.memory.socket_transport import SocketMemoryTransport
+import rsyscall.tasks.local as local
+from rsyscall.trace import tracing, span
+import io
+import json
+import trio
+
+from rsyscall.unistd import Pipe
+
+class TestTrace(TrioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.local = local.thread
+        executables = await RsyscallServerExecutable.from_store(local_store)
+        self.thr = await self.local.fork()
+        # an exec'd thread has its own address space; we skip the faster transports
+        # layered on top, so that its memory is accessed through a SocketMemoryTransport
+        await rsyscall_exec(self.local, self.thr, executables)
+        transport = self.thr.ram.transport
+        while not isinstance(transport, SocketMemoryTransport):
+            transport = transport.fallback # type: ignore
+        self.thr.ram.transport = transport
+
+    async def asyncTearDown(self) -> None:
+        await self.thr.close()
+
+    async def test_trace(self) -> None:
+        pid = self.thr.task.process.near.id
+        with tracing() as tracer:
+            pipe = await (await self.thr.task.pipe(await self.thr.ram.malloc(Pipe))).read()
+            async_read = await self.thr.make_afd(pipe.read, nonblock=True)
+            async with trio.open_nursery() as nursery:
+                @nursery.start_soon
+                async def reader() -> None:
+                    self.assertEqual(await async_read.read_some_bytes(), b"hello")
+                await trio.sleep(0)
+                await pipe.write.write(await self.thr.ram.ptr(b"hello"))
+            await async_read.close()
+            await pipe.write.close()
+        out = io.StringIO()
+        tracer.dump(out)
+        events = json.loads(out.getvalue())["traceEvents"]
+        spans = [event for event in events if event["ph"] == "X"]
+        categories = set(span["cat"] for span in spans)
+        self.assertLessEqual({"syscall", "transport", "epoll"}, categories)
+        self.assertIn("pipe2", [span["name"] for span in spans if span["pid"] == pid])
+        for span in spans:
+            self.assertGreaterEqual(span["dur"], 0)
+            if span["cat"] == "transport":
+                self.assertEqual(span["pid"], pid)
+                self.assertLessEqual({"ops", "bytes", "merged"}, set(span["args"]))
+        self.assertIn("process_name", [event["name"] for event in events if event["ph"] == "M"])
+
+    async def test_disabled(self) -> None:
+        "With tracing disabled, span does no work, and yields no args to fill in"
+        self.assertIs(span("a", "test"), span("b", "test"))
+        with span("a", "test") as args:
+            self.assertIsNone(args)
@@ -0,0 +1,54 @@
+from rsyscall._raw import lib # type: ignore
+from rsyscall.trio_test_case import TrioTestCase
+import rsyscall.tasks.local as local
+from rsyscall.tasks.uring import use_uring
+from rsyscall.tests.utils import assert_thread_works, do_syscall_chain
+import trio
+
+from rsyscall.fcntl import O
+from rsyscall.unistd import Pipe
+
+class TestUring(TrioTestCase):
+    async def asyncSetUp(self) -> None:
+        self.thr = local.thread
+        self.fallback = self.thr.task.sysif
+        self.sysif = use_uring(self.thr)
+
+    async def asyncTearDown(self) -> None:
+        self.thr.task.sysif = self.fallback
+        self.assertFalse(self.sysif.pending)
+        lib.rsyscall_uring_close(self.sysif.ring)
+
+    async def test_basic(self) -> None:
+        await assert_thread_works(self, self.thr)
+        await do_syscall_chain(self, self.thr)
+
+    async def test_files(self) -> None:
+        async with (await self.thr.mkdtemp()) as path:
+            data = b"hello world" * 1000
+            await self.thr.spit(path/"file", data)
+            fd = await self.thr.task.open(await self.thr.ram.ptr(path/"file"), O.RDONLY)
+            self.assertEqual(await self.thr.read_to_eof(fd), data)
+            await fd.close()
+
+    async def test_blocking_read(self) -> None:
+        "A read on an empty blocking pipe doesn't block the interpreter"
+        pipe = await (await self.thr.task.pipe(await self.thr.ram.malloc(Pipe))).read()
+        data = b"hello"
+        async with trio.open_nursery() as nursery:
+            @nursery.start_soon
+            async def reader() -> None:
+                valid, _ = await pipe.read.read(await self.thr.ram.malloc(bytes, 64))
+                self.assertEqual(await valid.read(), data)
+            await trio.sleep(0.01)
+            self.assertTrue(self.sysif.pending)
+            await pipe.write.write(await self.thr.ram.ptr(data))
+        await pipe.read.close()
+        await pipe.write.close()
+
+    async def test_fork(self) -> None:
+        thread = await self.thr.fork()
+        async with thread:
+            with self.assertRaises(Exception):
+                use_uring(thread)
+            await assert_thread_works(self, thread)
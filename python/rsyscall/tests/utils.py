@@ -4,6 +4,10 @@ from rsyscall.epoller import Epoller, AsyncFileDescriptor, EpollThread
 from rsyscall.memory.ram import RAMThread
 from rsyscall.unistd import Pipe
 from rsyscall.fcntl import O
+from rsyscall.sys.epoll import EpollFlag
+from rsyscall.near.sysif import ChainResult
+from rsyscall.sys.syscall import SYS
+import errno
 
 import logging
 logger = logging.getLogger(__name__)
@@ -33,3 +37,25 @@ async def do_async_things(self: unittest.TestCase, epoller: Epoller, thr: RAMThr
 
 async def assert_thread_works(self: unittest.TestCase, thr: EpollThread) -> None:
     await do_async_things(self, thr.epoller, thr)
+
+async def do_syscall_chain(self: unittest.TestCase, thr: RAMThread) -> None:
+    epfd, close, close_again = await thr.task.sysif.syscall_chain([
+        (SYS.epoll_create1, EpollFlag.CLOEXEC),
+        (SYS.close, ChainResult(0)),
+        (SYS.close, ChainResult(0)),
+    ])
+    self.assertIsInstance(epfd, int)
+    self.assertEqual(close, 0)
+    self.assertIsInstance(close_again, OSError)
+    self.assertEqual(close_again.errno, errno.EBADF)
+    # the rest of the chain is skipped after a failure
+    failed, skipped = await thr.task.sysif.syscall_chain([(SYS.close, -1), (SYS.getuid,)])
+    self.assertEqual(failed.errno, errno.EBADF)
+    self.assertEqual(skipped.errno, errno.ECANCELED)
+    # but the next chain starts afresh
+    [uid] = await thr.task.sysif.syscall_chain([(SYS.getuid,)])
+    self.assertIsInstance(uid, int)
+    # in a batch, a failure doesn't stop the rest
+    failed, uid = await thr.task.sysif.syscall_batch([(SYS.close, -1), (SYS.getuid,)])
+    self.assertEqual(failed.errno, errno.EBADF)
+    self.assertIsInstance(uid, int)
@@ -2,20 +2,23 @@
 from __future__ import annotations
 from dataclasses import dataclass
 from rsyscall.command import Command
-from rsyscall.handle import FileDescriptor, Path, WrittenPointer, Pointer, Task
+from rsyscall.handle import FileDescriptor, Path, WrittenPointer, Pointer, Task, close_fds
 from rsyscall.memory.ram import RAM, RAMThread
 from rsyscall.mktemp import mkdtemp, TemporaryDirectory
+from rsyscall.monitor import AsyncChildProcess
 from rsyscall.unix_thread import UnixThread, ChildUnixThread
+import errno
 import os
 import rsyscall.near.types as near
-import rsyscall.near as syscalls
 import trio
 import typing as t
 
 from rsyscall.fcntl import O, F, FD_CLOEXEC
 from rsyscall.linux.dirent import DirentList
 from rsyscall.sched import CLONE
+from rsyscall.signal import SIG, SignalBlock
 from rsyscall.sys.mount import MS
+from rsyscall.sys.syscall import SYS
 from rsyscall.sys.wait import ChildState, W
 from rsyscall.unistd import Arg
 
@@ -44,26 +47,45 @@ async def write_user_mappings(thr: RAMThread, uid: int, gid: int,
     await gid_map.close()
 
 async def do_cloexec_except(thr: RAMThread, excluded_fds: t.Set[near.FileDescriptor]) -> None:
-    "Close all CLOEXEC file descriptors, except for those in a whitelist. Would be nice to have a syscall for this."
+    """Close all CLOEXEC file descriptors, except for those in a whitelist. Would be nice to have a syscall for this.
+
+    close_range comes close, but it can't skip the fds which aren't CLOEXEC. So we list
+    the fds in /proc/self/fd, check which are CLOEXEC with one batch of fcntl calls, and
+    then close those with close_fds, which uses one close_range per run of consecutive
+    fds.
+
+    """
     buf = await thr.ram.malloc(DirentList, 4096)
     dirfd = await thr.task.open(await thr.ram.ptr(Path("/proc/self/fd")), O.DIRECTORY)
-    async def maybe_close(fd: near.FileDescriptor) -> None:
-        flags = await syscalls.fcntl(thr.task.sysif, fd, F.GETFD)
-        if (flags & FD_CLOEXEC) and (fd not in excluded_fds):
-            await syscalls.close(thr.task.sysif, fd)
-    async with trio.open_nursery() as nursery:
-        while True:
-            valid, rest = await dirfd.getdents(buf)
-            if valid.size() == 0:
-                break
-            dents = await valid.read()
-            for dent in dents:
-                try:
-                    num = int(dent.name)
-                except ValueError:
-                    continue
-                nursery.start_soon(maybe_close, near.FileDescriptor(num))
-            buf = valid.merge(rest)
+    fds: t.List[near.FileDescriptor] = []
+    while True:
+        valid, rest = await dirfd.getdents(buf)
+        if valid.size() == 0:
+            break
+        dents = await valid.read()
+        for dent in dents:
+            try:
+                fd = near.FileDescriptor(int(dent.name))
+            except ValueError:
+                continue
+            if fd not in excluded_fds and fd != dirfd.near:
+                fds.append(fd)
+        buf = valid.merge(rest)
+    await dirfd.close()
+    # the F_GETFDs don't depend on each other, so one fd failing mustn't stop the rest
+    results = await thr.task.sysif.syscall_batch([(SYS.fcntl, fd, F.GETFD) for fd in fds])
+    to_close: t.List[near.FileDescriptor] = []
+    for fd, result in zip(fds, results):
+        if isinstance(result, OSError):
+            # this fd was closed after we listed it
+            pass
+        elif isinstance(result, Exception):
+            raise result
+        elif result & FD_CLOEXEC:
+            to_close.append(fd)
+    failed = await close_fds(thr.task.sysif, to_close)
+    if failed:
+        raise Exception("failed to close some fds", failed)
 
 class Thread(UnixThread):
     "A central class holding everything necessary to work with some thread, along with various helpers"
@@ -87,13 +109,18 @@ class Thread(UnixThread):
         Returns the passed-in Path so this serves as a nice pseudo-constructor.
 
         """
+        to_write: Pointer = await self.ram.ptr(os.fsencode(text))
         if isinstance(path, Path):
             out: t.Optional[Path] = path
-            fd = await self.task.open(await self.ram.ptr(path), O.WRONLY|O.TRUNC|O.CREAT, mode=mode)
+            path_ptr = await self.ram.ptr(path)
+            # usually the whole text is written in one go, so try to do everything at once
+            _, to_write = await self.task.open_write_close(path_ptr, O.WRONLY|O.TRUNC|O.CREAT, mode, to_write)
+            if to_write.size() == 0:
+                return out
+            fd = await self.task.open(path_ptr, O.WRONLY|O.APPEND)
         else:
             out = None
             fd = path
-        to_write: Pointer = await self.ram.ptr(os.fsencode(text))
         while to_write.size() > 0:
             _, to_write = await fd.write(to_write)
         await fd.close()
@@ -155,6 +182,30 @@ class Thread(UnixThread):
             exit_state.check()
         return exit_state
 
+    async def spawn(self, command: Command,
+                    fds: t.Mapping[t.Union[FileDescriptor, int], FileDescriptor]={},
+                    cwd: t.Optional[Path]=None,
+                    env: t.Mapping[str, t.Union[str, bytes, os.PathLike]]={},
+                    inherited_signal_blocks: t.List[SignalBlock]=[],
+    ) -> AsyncChildProcess:
+        """Fork a child thread, set up its fds, cwd and environment, and exec `command` in it
+
+        This does the same as fork, unshare_files_and_replace, chdir and exec, but the
+        setup is sent to the child together with the exec; see
+        ChildUnixThread.setup_and_exec for the meaning of the arguments.
+
+        If some part of the setup fails, we kill the child, which was left half set up,
+        before raising the error.
+
+        """
+        thread = await self.fork()
+        try:
+            return await thread.setup_and_exec(command, fds, cwd, env, inherited_signal_blocks)
+        except BaseException:
+            if thread.process.process.death_state is None:
+                await thread.process.kill(SIG.KILL)
+            raise
+
     async def unshare(self, flags: CLONE) -> None:
         "Call the unshare syscall, appropriately updating values on this class"
         # Note: unsharing NEWPID causes us to not get zombies for our children if init dies. That
@@ -0,0 +1,149 @@
+"""Opt-in tracing of syscalls, memory transfers and waits, as a timeline
+
+A single operation on a Thread passes through many layers: Thread, Task,
+SyscallInterface, SyscallConnection, MemoryTransport. When it's slow, it's hard to tell
+from logs which layers were waiting on which. With tracing enabled, we record a
+timestamped span for:
+
+- each syscall, from submission to response, and each syscall chain
+- each batch of reads or writes performed by SocketMemoryTransport
+- each epoll_wait performed by EpollWaiter.do_wait
+- each wait in OneAtATime.needs_run for some other coroutine to finish running
+
+The spans can be exported in the Chrome trace event format, which can be viewed in
+Perfetto or chrome://tracing. Each span is placed on the track of the trio task which
+made it, in the process (by pid) which the operation was performed in, where we know it.
+
+Use it like this:
+
+    with rsyscall.trace.tracing() as tracer:
+        await thread.run(...)
+    with open("trace.json", "w") as f:
+        tracer.dump(f)
+
+"""
+from __future__ import annotations
+import contextlib
+import json
+import os
+import time
+import trio
+import typing as t
+import weakref
+
+__all__ = [
+    "Tracer",
+    "tracing",
+    "span",
+]
+
+class Tracer:
+    "Records spans, and exports them as Chrome trace events"
+    def __init__(self) -> None:
+        self.events: t.List[t.Dict[str, t.Any]] = []
+        self.start = time.perf_counter()
+        self.tids: t.MutableMapping[t.Any, int] = weakref.WeakKeyDictionary()
+        self.process_names: t.Dict[int, str] = {}
+        self.thread_names: t.Dict[int, str] = {}
+        self.tracks: t.Set[t.Tuple[int, int]] = set()
+
+    def now(self) -> float:
+        "The current time, in microseconds since we started tracing"
+        return (time.perf_counter() - self.start) * 1e6
+
+    def _current_tid(self) -> int:
+        try:
+            task = trio.hazmat.current_task()
+        except RuntimeError:
+            return 0
+        try:
+            return self.tids[task]
+        except KeyError:
+            tid = self.tids[task] = len(self.thread_names) + 1
+            self.thread_names[tid] = task.name
+            return tid
+
+    def name_process(self, pid: int, name: str) -> None:
+        "Label the track for this pid with this name"
+        self.process_names.setdefault(pid, name)
+
+    def complete(self, name: str, category: str, start: float,
+                 pid: t.Optional[int]=None, args: t.Dict[str, t.Any]={}) -> None:
+        "Record a span which started at `start`, as returned by `now`, and ends now"
+        if pid is None:
+            pid = os.getpid()
+        tid = self._current_tid()
+        self.tracks.add((pid, tid))
+        self.events.append({
+            "name": name, "cat": category, "ph": "X",
+            "ts": start, "dur": self.now() - start,
+            "pid": pid, "tid": tid, "args": args,
+        })
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str,
+             pid: t.Optional[int]=None, **args: t.Any) -> t.Iterator[t.Dict[str, t.Any]]:
+        """Record a span covering the body of this context manager
+
+        We yield the span's args, so the body can add more once it knows them.
+
+        """
+        start = self.now()
+        try:
+            yield args
+        finally:
+            self.complete(name, category, start, pid, args)
+
+    def to_json(self) -> t.Dict[str, t.Any]:
+        "Return all the spans so far as a JSON object in the Chrome trace event format"
+        metadata: t.List[t.Dict[str, t.Any]] = []
+        for pid, name in self.process_names.items():
+            metadata.append({"name": "process_name", "ph": "M", "pid": pid, "args": {"name": name}})
+        for pid, tid in self.tracks:
+            if tid in self.thread_names:
+                metadata.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+                                 "args": {"name": self.thread_names[tid]}})
+        return {"traceEvents": metadata + self.events, "displayTimeUnit": "ns"}
+
+    def dump(self, file: t.TextIO) -> None:
+        "Write the trace to this file as JSON"
+        json.dump(self.to_json(), file, default=str)
+
+tracer: t.Optional[Tracer] = None
+"The current Tracer, if tracing is enabled"
+
+@contextlib.contextmanager
+def tracing() -> t.Iterator[Tracer]:
+    "Enable tracing for the body of this context manager, yielding the Tracer"
+    global tracer
+    if tracer is not None:
+        raise Exception("already tracing", tracer)
+    tracer = Tracer()
+    try:
+        yield tracer
+    finally:
+        tracer = None
+
+class _NoSpan:
+    "What span returns when tracing is disabled; it does nothing, so we can reuse one instance"
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, *exc_info: t.Any) -> None:
+        return None
+
+_no_span = _NoSpan()
+
+def span(name: str, category: str,
+         pid: t.Optional[int]=None, **args: t.Any) -> t.ContextManager[t.Optional[t.Dict[str, t.Any]]]:
+    """Record a span covering the body of this context manager, if tracing is enabled
+
+    The context manager yields the span's args, so the body can add more once it knows
+    them; or None if tracing is disabled, so the body can skip computing them. Callers
+    on hot paths should likewise only compute args which are expensive to compute in
+    the body, rather than passing them here.
+
+    """
+    if tracer is None:
+        return _no_span
+    return tracer.span(name, category, pid, **args)
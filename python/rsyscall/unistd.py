@@ -16,6 +16,7 @@ else:
 __all__ = [
     "SEEK",
     "OK",
+    "CLOSE_RANGE",
     "Arg",
     "ArgList"
     "Pipe",
@@ -32,6 +33,12 @@ class OK(enum.IntFlag):
     X = os.X_OK
     F = os.F_OK
 
+class CLOSE_RANGE(enum.IntFlag):
+    "The flags argument to close_range."
+    NONE = 0
+    UNSHARE = lib.CLOSE_RANGE_UNSHARE
+    CLOEXEC = lib.CLOSE_RANGE_CLOEXEC
+
 class Arg(bytes, Serializable):
     "A null-terminated string, as passed to execve."
     def to_bytes(self) -> bytes:
@@ -16,6 +16,7 @@ from rsyscall.monitor import AsyncChildProcess, ChildProcessMonitor
 from rsyscall.network.connection import Connection
 from rsyscall.tasks.fork import ForkThread
 import logging
+import rsyscall.near.types as near
 import typing as t
 import os
 
@@ -66,6 +67,7 @@ class UnixThread(ForkThread):
                   # and child's read syscall will never complete.
                   self.ram.transport,
                   self.ram.allocator.inherit(task),
+                  self.ram.const_cache,
         )
         if flags & CLONE.NEWPID:
             # if the new process is pid 1, then CLONE_PARENT isn't allowed so we can't use inherit_to_child.
@@ -79,7 +81,7 @@ class UnixThread(ForkThread):
         else:
             epoller = self.epoller.inherit(ram)
             monitor = self.monitor.inherit_to_child(ram, task)
-        return ChildUnixThread(UnixThread(
+        thread = UnixThread(
             task, ram,
             self.connection.for_task(task, ram),
             self.loader,
@@ -88,13 +90,28 @@ class UnixThread(ForkThread):
             stdin=self.stdin.for_task(task),
             stdout=self.stdout.for_task(task),
             stderr=self.stderr.for_task(task),
-        ), process=child_process)
+        )
+        # the child is in our address space, so it can share our futex watcher
+        thread.futex_watcher = self.futex_watcher
+        return ChildUnixThread(thread, process=child_process)
+
+def _inherited_sigmask(inherited_signal_blocks: t.List[SignalBlock]) -> Sigset:
+    sigmask: t.Set[SIG] = set()
+    for block in inherited_signal_blocks:
+        sigmask = sigmask.union(block.mask)
+    return Sigset(sigmask)
 
 class ChildUnixThread(UnixThread):
     def __init__(self, thr: UnixThread, process: AsyncChildProcess) -> None:
         super()._init_from(thr)
         self.process = process
 
+    def _make_envp(self, env_updates: t.Mapping[str, t.Union[str, bytes, os.PathLike]]) -> t.List[bytes]:
+        envp: t.Dict[bytes, bytes] = {**self.environ.data}
+        for key in env_updates:
+            envp[os.fsencode(key)] = os.fsencode(env_updates[key])
+        return [b''.join([key_bytes, b'=', value]) for key_bytes, value in envp.items()]
+
     async def _execve(self, path: Path, argv: t.List[bytes], envp: t.List[bytes], flags: AT) -> AsyncChildProcess:
         "Call execve, abstracting over memory; self.{exec,execve} are probably preferable"
         async def op(sem: RAM) -> t.Tuple[WrittenPointer[Path],
@@ -133,16 +150,8 @@ class ChildUnixThread(UnixThread):
         allow the user to explicitly pass down additional signal blocks.
 
         """
-        sigmask: t.Set[SIG] = set()
-        for block in inherited_signal_blocks:
-            sigmask = sigmask.union(block.mask)
-        await self.task.sigprocmask((HowSIG.SETMASK, await self.ram.ptr(Sigset(sigmask))))
-        envp: t.Dict[bytes, bytes] = {**self.environ.data}
-        for key in env_updates:
-            envp[os.fsencode(key)] = os.fsencode(env_updates[key])
-        raw_envp: t.List[bytes] = []
-        for key_bytes, value in envp.items():
-            raw_envp.append(b''.join([key_bytes, b'=', value]))
+        await self.task.sigprocmask((HowSIG.SETMASK, await self.ram.ptr(_inherited_sigmask(inherited_signal_blocks))))
+        raw_envp = self._make_envp(env_updates)
         logger.info("execveat(%s, %s, %s)", path, argv, env_updates)
         return await self._execve(path, [os.fsencode(arg) for arg in argv], raw_envp, AT.NONE)
 
@@ -156,3 +165,44 @@ class ChildUnixThread(UnixThread):
         """
         return (await self.execve(command.executable_path, command.arguments, command.env_updates,
                                   inherited_signal_blocks=inherited_signal_blocks))
+
+    async def setup_and_exec(self, command: Command,
+                             fds: t.Mapping[t.Union[FileDescriptor, int], FileDescriptor]={},
+                             cwd: t.Optional[Path]=None,
+                             env: t.Mapping[str, t.Union[str, bytes, os.PathLike]]={},
+                             inherited_signal_blocks: t.List[SignalBlock]=[],
+    ) -> AsyncChildProcess:
+        """Unshare our fd table, replace fds, chdir, and exec `command`, with few round trips
+
+        `fds` maps an fd (or fd number) in our new fd table to the fd to replace it with,
+        like the mapping passed to unshare_files_and_replace. To inherit an fd at its
+        current number, map it to itself. `env` is added to command.env_updates.
+
+        After unsharing the fd table, the rest of the setup is done in one round trip with
+        Task.setup_and_execve; see that for what happens if one of the steps fails.
+
+        """
+        replace = [(
+            # as in unshare_files_and_replace, we copy the source so that we can invalidate the
+            # copy after the exec, and maybe_copy the dest so that we have the only handle to it.
+            source.for_task(self.task),
+            near.FileDescriptor(dest) if isinstance(dest, int) else dest.maybe_copy(self.task),
+        ) for dest, source in fds.items()]
+        # we're going to exec, so there's no need to cloexec the fds left by other libraries
+        await self.task.unshare_files()
+        raw_envp = self._make_envp({**command.env_updates, **env})
+        argv = [os.fsencode(arg) for arg in command.arguments]
+        async def op(sem: RAM) -> t.Tuple[t.Optional[WrittenPointer[Path]], WrittenPointer[Sigset],
+                                          WrittenPointer[Path], WrittenPointer[ArgList], WrittenPointer[ArgList]]:
+            argv_ptrs = ArgList([await sem.ptr(Arg(arg)) for arg in argv])
+            envp_ptrs = ArgList([await sem.ptr(Arg(arg)) for arg in raw_envp])
+            return (await sem.ptr(cwd) if cwd is not None else None,
+                    await sem.ptr(_inherited_sigmask(inherited_signal_blocks)),
+                    await sem.ptr(command.executable_path),
+                    await sem.ptr(argv_ptrs),
+                    await sem.ptr(envp_ptrs))
+        cwd_ptr, sigmask_ptr, filename, argv_ptr, envp_ptr = await self.ram.perform_batch(op)
+        logger.info("execveat(%s, %s, %s) with fds %s and cwd %s",
+                    command.executable_path, command.arguments, env, fds, cwd)
+        await self.task.setup_and_execve(replace, cwd_ptr, sigmask_ptr, filename, argv_ptr, envp_ptr, AT.NONE)
+        return self.process
@@ -35,7 +35,7 @@ the user and providing some UI for the user to produce the value. The WishGrante
 choose to typecheck the value returned by the user to ensure that it matches the value
 requested in the Wish.  If the WishGranter provides a REPL, it may want to extract local
 variables from the traceback captured by wish, and present them to the user. If no
-WishGranter is bound, we simply raise the Wish as an exception.
+WishGranter is bound, we use a ConsoleGenie on the local thread, created on first use.
 
 This library provides only console REPL WishGranters, but the API is entirely extensible,
 so other ways to present a REPL, or even entirely different UIs, are possible. For
@@ -139,7 +139,8 @@ async def wish(wish: Wish[T], *, from_exn: t.Union[BaseException, None, bool]=Fa
 
     We use the WishGranter currently bound to my_wish_granter in our ContextVar context to
     perform the wish. This is directly analogous to using the closest bound exception
-    handler to handle an exception, and works the same way.
+    handler to handle an exception, and works the same way. If none is bound, we use a
+    ConsoleGenie serving a REPL on the local thread's stdin/stdout.
 
     """
     if not isinstance(wish, Wish):
@@ -152,7 +153,9 @@ async def wish(wish: Wish[T], *, from_exn: t.Union[BaseException, None, bool]=Fa
 
     wish.__traceback__ = _frames_to_traceback([record.frame for record in inspect.stack()[1:]])
 
-    wish_granter = my_wish_granter.get()
+    wish_granter = my_wish_granter.get(None)
+    if wish_granter is None:
+        wish_granter = await _default_wish_granter()
     ret = await wish_granter.wish(wish)
     return ret
 
@@ -340,7 +343,12 @@ async def serve_repls(listenfd: AsyncFileDescriptor,
             num += 1
     return retval
 
-def _initialize_module() -> None:
-    import rsyscall.tasks.local as local
-    my_wish_granter.set(trio.run(ConsoleGenie.make, local.thread))
-_initialize_module()
+_console_genie: t.Optional[ConsoleGenie] = None
+
+async def _default_wish_granter() -> WishGranter:
+    "Return the WishGranter used when none is bound: a ConsoleGenie on the local thread"
+    global _console_genie
+    if _console_genie is None:
+        import rsyscall.tasks.local as local
+        _console_genie = await ConsoleGenie.make(await local.initialize())
+    return _console_genie